@@ -1,8 +1,30 @@
 import logging
-import time
-from typing import Any, Dict, Optional
+import threading
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple, Union
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from calibration import LatencyEstimate
+from constant import ROBOT_MAX_TIMEOUT, ROBOT_PING_METHOD
+from fleet_health import RobotHealth
+from retry_policy import RetryPolicy, RetryStats
+from show_ir import ActionRef, split_cell
+from time_source import WALL_CLOCK, WallClock
+
+RPC_HEADERS = {"deviceid": "12345"}
+
+
+def build_rpc_request(method: str, params: Optional[list] = None) -> Dict[str, Any]:
+    """Build the JSON-RPC 2.0 payload understood by the robot API."""
+    data = {
+        "id": "12345",
+        "jsonrpc": "2.0",
+        "method": method,
+    }
+    if params is not None:
+        data["params"] = params
+    return data
 
 
 class RobotAction:
@@ -17,6 +39,9 @@ class RobotAction:
         action_name_to_time: Dict[str, float],
         action_name_to_repeat_time: Dict[str, int] = None,
         device_id: str = "1732853986186",
+        timeout: float = ROBOT_MAX_TIMEOUT,
+        retry: Optional[RetryPolicy] = None,
+        time_source: WallClock = WALL_CLOCK,
     ):
         """
         Initialize the RobotAction class.
@@ -26,64 +51,231 @@ class RobotAction:
             action_name_to_time: Dictionary mapping action names to their execution time
             action_name_to_repeat_time: Dictionary mapping action names to their repeat time
             device_id: The ID of the robot device
+            timeout: Timeout for a single request in seconds; once the robot's RTT
+                is known, commands use a shorter timeout adapted to it
+            retry: Retry policy for commands with a deadline
+            time_source: Clock that requests are timed and retries are paced by
         """
         self.api_url = api_url
         self.device_id = device_id
+        self.timeout = timeout
+        self.actions = action_name_to_time
+        self.repeat_actions = action_name_to_repeat_time or {}
+        # The robot is attached to every record, for the per-robot rate limit
+        self.logger = logging.LoggerAdapter(logging.getLogger("RobotAction"), {"robot": device_id})
+        self.session: Optional[requests.Session] = None
+        # Separate session of the emergency stop, see open_session()
+        self.stop_session: Optional[requests.Session] = None
+        self.latency = LatencyEstimate()
+        # Round trips of answered commands, which the request timeout adapts to
+        self.command_latency = LatencyEstimate()
+        self.health = RobotHealth()
+        self.retry = retry or RetryPolicy(max_timeout=timeout)
+        self.retry_stats = RetryStats()
+        self.time_source = time_source
+        # Monotonic times of the last request, read by the show trace
+        self.last_send_time: Optional[float] = None
+        self.last_response_time: Optional[float] = None
+        # When the scheduler will send the next command, so telemetry can stay clear of it
+        self.next_send_time: Optional[float] = None
+        # Last action the robot accepted and when it should be finished, for telemetry
+        self.running: Optional[Tuple[str, float]] = None
+
+    def set_actions(
+        self,
+        action_name_to_time: Mapping[str, float],
+        action_name_to_repeat_time: Optional[Mapping[str, int]] = None,
+    ) -> None:
+        """
+        Replace the action tables, e.g. when moving on to the next song.
+
+        The tables are kept by reference, so every robot shares an
+        ActionCatalog's read-only mappings.
+        """
         self.actions = action_name_to_time
         self.repeat_actions = action_name_to_repeat_time or {}
-        self.logger = logging.getLogger("RobotAction")
 
-    def run_action(self, name: str, stop_event=None) -> Optional[Dict[str, Any]]:
+    def open_session(self) -> None:
+        """
+        Open keep-alive sessions so every command reuses the same TCP connection.
+
+        The scheduler's worker, telemetry and the fleet monitor share `session`
+        from their threads. Its pool keeps two connections, one for commands and
+        one for a concurrent ping or telemetry query; a third concurrent request
+        doesn't wait but opens a connection that is dropped afterwards. The
+        emergency stop gets `stop_session` with a connection of its own, so a
+        stop from the signal thread never touches a session a worker is using.
+        """
+        if self.session is None:
+            self.session = self._new_session(2)
+        if self.stop_session is None:
+            self.stop_session = self._new_session(1)
+
+    @staticmethod
+    def _new_session(pool_maxsize: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def warm_up(self) -> bool:
+        """
+        Establish the pooled connection before the show starts.
+
+        Any HTTP answer counts, since only the TCP connection matters here.
+
+        Returns:
+            True if the robot answered
+        """
+        return self.ping(record=False) is not None
+
+    def ping(self, record: bool = True, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        Send the harmless ping method and measure the round-trip time.
+
+        Pings are sent even while the robot is offline, and an answer
+        re-admits it.
+
+        Args:
+            record: Add the measurement to the robot's latency estimate
+            timeout: Request timeout in seconds, the robot's timeout when omitted
+
+        Returns:
+            The round-trip time in seconds, or None if the robot didn't answer
+        """
+        self.open_session()
+        try:
+            sent = self.time_source.perf_counter()
+            response = self.session.post(
+                self.api_url,
+                headers=RPC_HEADERS,
+                json=build_rpc_request(ROBOT_PING_METHOD),
+                timeout=timeout or self.timeout,
+            )
+            rtt = self.time_source.perf_counter() - sent
+        except requests.exceptions.RequestException as e:
+            self.logger.warning("%s ping failed: %s", self.device_id, e)
+            self._record_failure()
+            return None
+        self.logger.debug("%s ping answered with %s", self.device_id, response.status_code)
+        self._record_success(rtt)
+        if record:
+            self.latency.add(rtt)
+        return rtt
+
+    @property
+    def request_timeout(self) -> float:
+        """Timeout of one command, adapted to its measured RTT, or the ping RTT before that."""
+        estimate = self.command_latency if self.command_latency.count else self.latency
+        return estimate.timeout(self.retry.min_timeout, self.retry.max_timeout)
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Return how many connections were opened and how many requests reused one."""
+        if self.session is None:
+            return {"opened": 0, "reused": 0}
+        pools = self.session.get_adapter(self.api_url).poolmanager.pools
+        opened = requested = 0
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            requested += pool.num_requests
+        return {"opened": opened, "reused": max(0, requested - opened)}
+
+    def close(self) -> None:
+        """Close the pooled sessions."""
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        if self.stop_session is not None:
+            self.stop_session.close()
+            self.stop_session = None
+
+    def run_action(
+        self, name: Union[str, Sequence[ActionRef]], stop_event=None
+    ) -> Optional[Dict[str, Any]]:
         """
         Run one or more robot actions (multi-line supported).
 
         Args:
-            name: Action name(s), possibly multi-line.
+            name: Action name(s), possibly multi-line, or the parsed ActionRefs of a cell.
             stop_event: Optional threading.Event for interruption.
 
         Returns:
             Optional response data from the last API call.
         """
-        # Handle single or multi-line names: split by newlines if present, else use as single action
-        if "\n" in name:
-            names = [n.strip() for n in name.splitlines() if n.strip()]
+        if isinstance(name, str):
+            refs = [
+                ActionRef(n, self.actions.get(n), self.repeat_actions.get(n, 1))
+                for n in split_cell(name)
+            ]
         else:
-            names = [name.strip()] if name.strip() else []
+            refs = list(name)
         results = []
 
-        for n in names:
+        for ref in refs:
             if stop_event is not None and stop_event.is_set():
                 self.logger.info("Action interrupted by stop_event.")
                 break
-            # self.logger.info(f"Running action: {n}")
-            if n not in self.actions:
-                self.logger.error(f"Action '{n}' not found in actions dictionary.")
+            if not ref.known:
+                self.logger.error("Action '%s' not found in actions dictionary.", ref.name)
                 continue
 
-            sleep_time = self.actions[n]
-            repeat = self.repeat_actions.get(n, 1)
-            result = self._send_request(
-                method="RunAction",
-                params=[n, repeat],
-                log_success_msg=f"Action run_action({n}, {repeat}) successful.",
-                log_error_msg=f"Error running action run_action({n}, {repeat}):",
-            )
-            results.append(result)
-
-            
-            waited = 0.0
-            interval = 0.1
-            while waited < float(sleep_time):
-                if stop_event is not None and stop_event.is_set():
-                    self.logger.info(
-                        "Action interrupted by stop_event during sleep."
-                    )
+            started = self.time_source.monotonic()
+            deadline = self.retry.deadline(started + self.latency.one_way, ref.duration)
+            results.append(self.start_action(ref.name, ref.repeat, deadline, stop_event))
+
+            # Time spent on retries comes out of the action's slot, not after it
+            remaining = max(0.0, ref.duration - (self.time_source.monotonic() - started))
+            # Wait on the event so an interruption ends the sleep immediately
+            if stop_event is not None:
+                if self.time_source.wait(stop_event, remaining):
+                    self.logger.info("Action interrupted by stop_event during sleep.")
                     break
-                time.sleep(interval)
-                waited += interval
+            else:
+                self.time_source.sleep(remaining)
 
         return results[-1] if results else None
 
+    def start_action(
+        self,
+        name: str,
+        repeat: Optional[int] = None,
+        deadline: Optional[float] = None,
+        stop_event: Optional[threading.Event] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Send a single RunAction command without waiting for the action to finish.
+
+        Args:
+            name: Action name as defined in the action details spreadsheet
+            repeat: Repeat count; looked up in the action tables when omitted
+            deadline: Monotonic time the command must reach the robot by to be of
+                any use; a lost command is retried until then, see RetryPolicy
+            stop_event: Event that abandons a pending retry when set
+
+        Returns:
+            Optional response data from the API call
+        """
+        if repeat is None:
+            if name not in self.actions:
+                self.logger.error("Action '%s' not found in actions dictionary.", name)
+                return None
+            repeat = self.repeat_actions.get(name, 1)
+        result = self._send_request(
+            method="RunAction",
+            params=[name, repeat],
+            log_success_msg="Action run_action(%s, %s) successful.",
+            log_error_msg="Error running action run_action(%s, %s):",
+            log_args=(name, repeat),
+            deadline=deadline,
+            stop_event=stop_event,
+        )
+        if result is not None:
+            arrival = self.last_send_time + self.latency.one_way
+            self.running = (name, arrival + (self.actions.get(name) or 0.0))
+        return result
+
     def run_stop_action(self) -> Optional[Dict[str, Any]]:
         """Stop any currently running robot action."""
         return self._send_request(
@@ -93,41 +285,172 @@ class RobotAction:
             log_error_msg="Error running action run_stop_action():",
         )
 
+    def emergency_stop(self, timeout: float) -> bool:
+        """
+        Send StopBusServo once, even to an offline robot and without retries.
+
+        The stop goes over `stop_session`, see open_session().
+
+        Args:
+            timeout: Seconds to wait for the robot's answer
+
+        Returns:
+            True if the robot confirmed the stop with a JSON-RPC result
+        """
+        self.open_session()
+        try:
+            response = self.stop_session.post(
+                self.api_url,
+                headers=RPC_HEADERS,
+                json=build_rpc_request("StopBusServo", ["stopAction"]),
+                timeout=timeout,
+            )
+            response.raise_for_status()
+            resp_json = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.logger.error("%s emergency stop failed: %s", self.device_id, e)
+            return False
+        if "result" not in resp_json:
+            self.logger.error("%s refused the emergency stop: %s", self.device_id, resp_json)
+            return False
+        return True
+
+    def query(self, method: str, timeout: float) -> Optional[Tuple[Any, float]]:
+        """
+        Call a read-only method once, for telemetry.
+
+        The answer doesn't count towards the robot's health or latency
+        estimates, and failures are only logged at debug level.
+
+        Args:
+            method: The API method to call
+            timeout: Seconds to wait for the answer
+
+        Returns:
+            The JSON-RPC result and the round-trip time in seconds, or None if
+            the robot didn't answer with a result
+        """
+        self.open_session()
+        try:
+            sent = self.time_source.perf_counter()
+            response = self.session.post(
+                self.api_url, headers=RPC_HEADERS, json=build_rpc_request(method), timeout=timeout
+            )
+            rtt = self.time_source.perf_counter() - sent
+            response.raise_for_status()
+            resp_json = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.logger.debug("%s %s query failed: %s", self.device_id, method, e)
+            return None
+        if "result" not in resp_json:
+            self.logger.debug("%s %s query refused: %s", self.device_id, method, resp_json)
+            return None
+        return resp_json["result"], rtt
+
     def _send_request(
         self,
         method: str,
         params: Optional[list],
         log_success_msg: str,
         log_error_msg: str,
+        log_args: tuple = (),
+        deadline: Optional[float] = None,
+        stop_event: Optional[threading.Event] = None,
     ) -> Optional[Dict[str, Any]]:
         """
         Send an API request to the robot.
 
+        Lost requests are retried with backoff while a retry can still reach
+        the robot before `deadline`; requests without a deadline are sent once.
+        Setting `stop_event` during the backoff abandons the retry at once.
+
         Args:
             method: The API method to call
             params: List of parameters for the API call
             log_success_msg: Message to log on successful API call
             log_error_msg: Message to log on failed API call
+            log_args: Arguments of the two messages, formatted only if they are logged
+            deadline: Monotonic time the request must reach the robot by
+            stop_event: Event that interrupts the backoff between attempts
 
         Returns:
             Optional response data from the API call
         """
-        headers = {"deviceid": "12345"}
-        data = {
-            "id": "12345",
-            "jsonrpc": "2.0",
-            "method": method,
-        }
-        if params is not None:
-            data["params"] = params
+        if not self.health.online:
+            self.logger.debug(log_error_msg + " %s robot is offline", *log_args, self.device_id)
+            return None
+        data = build_rpc_request(method, params)
+        poster = self.session if self.session is not None else requests
+        self.retry_stats.count(requests=1)
+        attempt = 1
+        while True:
+            try:
+                self.last_send_time = self.time_source.monotonic()
+                try:
+                    response = poster.post(
+                        self.api_url, headers=RPC_HEADERS, json=data, timeout=self.request_timeout
+                    )
+                finally:
+                    self.last_response_time = self.time_source.monotonic()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.retry_stats.count(timeouts=1)
+                if deadline is None:
+                    self.logger.error(log_error_msg + " %s", *log_args, e)
+                    self._record_failure()
+                    return None
+                backoff = self.retry.delay(attempt)
+                if (
+                    attempt >= self.retry.max_attempts
+                    or self.time_source.monotonic() + backoff + self.latency.one_way > deadline
+                ):
+                    self.logger.error(
+                        log_error_msg + " %s; abandoned after %d attempt(s)", *log_args, e, attempt
+                    )
+                    self.retry_stats.count(abandoned=1)
+                    self._record_failure()
+                    return None
+                self.logger.warning(
+                    "%s %s attempt %d lost, retrying in %.0f ms",
+                    self.device_id, method, attempt, backoff * 1000,
+                )
+                if stop_event is None:
+                    self.time_source.sleep(backoff)
+                elif self.time_source.wait(stop_event, backoff):
+                    # The show is stopping; the robot isn't to blame for the lost request
+                    self.logger.info(log_error_msg + " retry cancelled by stop_event", *log_args)
+                    self.retry_stats.count(abandoned=1)
+                    return None
+                self.retry_stats.count(retries=1)
+                attempt += 1
+                continue
+            except requests.exceptions.RequestException as e:
+                self.logger.error(log_error_msg + " %s", *log_args, e)
+                return None
+            break
+
+        # Any HTTP answer shows the robot is reachable
+        self._record_success()
+        self.command_latency.add(self.last_response_time - self.last_send_time)
+        if attempt > 1:
+            self.retry_stats.count(late_starts=1)
         try:
-            response = requests.post(
-                self.api_url, headers=headers, json=data, timeout=0.5
-            )
             response.raise_for_status()
             resp_json = response.json()
-            self.logger.info("%s - %s Response: %s", self.device_id, log_success_msg, resp_json)
-            return resp_json
-        except requests.exceptions.RequestException as e:
-            self.logger.error("%s %s", log_error_msg, e)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.logger.error(log_error_msg + " %s", *log_args, e)
             return None
+        self.logger.info(
+            "%s - " + log_success_msg + " Response: %s", self.device_id, *log_args, resp_json
+        )
+        return resp_json
+
+    def _record_success(self, rtt: Optional[float] = None) -> None:
+        if self.health.success(rtt):
+            self.logger.info("%s is back online", self.device_id)
+
+    def _record_failure(self) -> None:
+        if self.health.failure():
+            self.logger.warning(
+                f"{self.device_id} failed {self.health.failures} requests in a row, "
+                f"its commands will fail fast until it answers again"
+            )
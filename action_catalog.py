@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# Catalog revisions kept in memory; songs usually share the latest one
+_MAX_REVISIONS = 4
+_revisions: "OrderedDict[str, ActionCatalog]" = OrderedDict()
+_revisions_lock = threading.Lock()
+
+
+def normalize_name(name: str) -> str:
+    """Key of the case-insensitive index: case-folded, with runs of whitespace collapsed."""
+    return " ".join(name.split()).casefold()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """One row of the action details sheet."""
+
+    name: str
+    code: Optional[int]
+    duration: Optional[float]
+    repeat: int = 1
+    remark: str = ""
+    link: str = ""
+
+
+class ActionCatalog:
+    """
+    Immutable, indexed view of one revision of the action details sheet.
+
+    Names are interned, and the duration, repeat and code tables are read-only
+    mappings shared by the compiler and every robot, so moving between songs
+    with the same action sheet copies nothing. Lookups fall back to a
+    case-insensitive index, so "Wave Left" in a cell finds "wave left".
+    """
+
+    def __init__(self, entries: List[CatalogEntry], revision: str = ""):
+        self.revision = revision
+        self._entries = tuple(entries)
+        by_name: Dict[str, CatalogEntry] = {}
+        for entry in self._entries:
+            by_name[entry.name] = entry
+        by_key: Dict[str, CatalogEntry] = {}
+        for name, entry in by_name.items():
+            key = normalize_name(name)
+            if key in by_key and by_key[key].name != name:
+                logger.warning(
+                    f"Actions '{by_key[key].name}' and '{name}' differ only in case or spacing"
+                )
+                continue
+            by_key[key] = entry
+        self._by_name = MappingProxyType(by_name)
+        self._by_key = MappingProxyType(by_key)
+        self.durations: Mapping[str, float] = MappingProxyType(
+            {name: e.duration for name, e in by_name.items() if e.duration is not None}
+        )
+        self.repeats: Mapping[str, int] = MappingProxyType(
+            {name: e.repeat for name, e in by_name.items()}
+        )
+        self.codes: Mapping[str, int] = MappingProxyType(
+            {name: e.code for name, e in by_name.items() if e.code is not None}
+        )
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, str]], revision: str = "") -> "ActionCatalog":
+        """
+        Build a catalog from the rows of the action details sheet.
+
+        Rows without a name are skipped; unparsable Code, Time or Repeat_Time
+        values are left unset, as the old per-column getters did.
+        """
+        entries = []
+        for row in rows:
+            name = (row.get("Name") or "").strip()
+            if not name:
+                continue
+            repeat_time = _parse(int, row.get("Repeat_Time"))
+            entries.append(
+                CatalogEntry(
+                    sys.intern(name),
+                    _parse(int, row.get("Code")),
+                    _parse(float, row.get("Time")),
+                    1 if repeat_time is None else repeat_time,
+                    row.get("Remark", ""),
+                    row.get("Link", ""),
+                )
+            )
+        return cls(entries, revision)
+
+    @classmethod
+    def for_revision(cls, rows: List[Dict[str, str]], revision: str) -> "ActionCatalog":
+        """Return the catalog of a sheet revision, building it only the first time it is seen."""
+        with _revisions_lock:
+            catalog = _revisions.get(revision)
+            if catalog is not None:
+                _revisions.move_to_end(revision)
+                logger.debug(f"Reusing action catalog {revision[:12]}")
+                return catalog
+            catalog = cls.from_rows(rows, revision)
+            _revisions[revision] = catalog
+            while len(_revisions) > _MAX_REVISIONS:
+                _revisions.popitem(last=False)
+        logger.info(f"Built action catalog {revision[:12]} with {len(catalog)} actions")
+        return catalog
+
+    def lookup(self, name: str) -> Optional[CatalogEntry]:
+        """Find an action by exact name, then case-insensitively."""
+        entry = self._by_name.get(name)
+        if entry is None:
+            entry = self._by_key.get(normalize_name(name))
+        return entry
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self.lookup(name) is not None
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def __iter__(self) -> Iterator[CatalogEntry]:
+        return iter(self._by_name.values())
+
+
+def _parse(kind, value: Optional[str]):
+    if not value:
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
@@ -1,10 +1,21 @@
 import logging
-from typing import Any, Dict, List
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
 
-from jinja2 import BaseLoader, Environment
+from jinja2 import BaseLoader, Environment, Template
 
+from show_ir import CompileError, ShowRow, format_slack, parse_rows
 from spreadsheet_loader import SpreadsheetLoader
 
+# One environment for every cell of every song; compiled templates are cached by source
+_JINJA_ENV = Environment(loader=BaseLoader())
+
+
+@lru_cache(maxsize=1024)
+def _compile_template(source: str) -> Template:
+    """Compile a cell's template source, reusing earlier compilations of the same source."""
+    return _JINJA_ENV.from_string(source)
+
 
 class ActionCompiler:
     """
@@ -14,6 +25,9 @@ class ActionCompiler:
     1. Compiling action sequences from spreadsheet data
     2. Validating that all actions exist in the action details
     3. Ensuring that action execution times don't exceed allotted time slots
+
+    Each cell is parsed once into the structures of show_ir, and every
+    problem in the sheet is reported together.
     """
 
     def __init__(self, spreadsheet_loader: SpreadsheetLoader):
@@ -30,33 +44,109 @@ class ActionCompiler:
         """Helper to get all robot keys in an action row."""
         return [key for key in action if key.startswith("Robot")]
 
-    def compile_actions(self) -> List[Dict[str, Any]]:
+    def _template_context(self, idx: int, key: str, action: Dict[str, str]) -> Dict[str, Any]:
         """
-        Compile and validate robot actions from spreadsheet data.
+        Build the variables available to a templated cell.
+
+        Args:
+            idx: 1-based row number
+            key: Robot column, e.g. "Robot_3"
+            action: The row being compiled
 
         Returns:
-            List of dictionaries containing validated robot actions
+            Context with row, robot, time and song
+        """
+        _, _, robot = key.partition("_")
+        try:
+            time_val = float(action.get("Time", ""))
+        except (TypeError, ValueError):
+            time_val = None
+        return {
+            "row": idx,
+            "robot": int(robot) if robot.isdigit() else robot,
+            "time": time_val,
+            "song": self.spreadsheet_loader.dance,
+        }
+
+    def _render_templates(self, robot_actions: List[Dict[str, str]]) -> None:
+        """Render templated robot cells in place."""
+        for idx, action in enumerate(robot_actions, start=1):
+            self.render_row(idx, action)
 
-        Raises:
-            ValueError: If actions don't exist or exceed their time allocation
+    def render_row(self, idx: int, action: Dict[str, str]) -> Dict[str, str]:
+        """
+        Render the templated cells of one row in place.
+
+        A cell's template only sees its own row, so rows can be rendered
+        independently of each other.
+
+        Args:
+            idx: 1-based row number
+            action: The row to render
+
+        Returns:
+            The rendered row
         """
+        for key in self._get_robot_keys(action):
+            value = action[key]
+            # Only render as Jinja2 template if there are template markers and value is not empty
+            if value and ("{{" in value or "}}" in value or "{%" in value):
+                action[key] = _compile_template(value).render(
+                    self._template_context(idx, key, action)
+                )
+        return action
+
+    def _compile(self) -> Tuple[List[Dict[str, str]], List[ShowRow]]:
+        """Render, parse and validate the song, reporting every problem at once."""
         robot_actions = self.spreadsheet_loader.get_robot_actions()
-        action_name_to_time = self.spreadsheet_loader.get_action_name_to_time()
+        catalog = self.spreadsheet_loader.get_action_catalog()
 
-        for action in robot_actions:
-            for key in self._get_robot_keys(action):
-                value = action[key]
-                # Only render as Jinja2 template if there are template markers and value is not empty
-                if value and ("{{" in value or "}}" in value):
-                    rtemplate = Environment(loader=BaseLoader).from_string(value)
-                    action[key] = rtemplate.render({})
+        self._render_templates(robot_actions)
 
         self.logger.info(f"Compiled {len(robot_actions)} action sequences")
-        self.logger.debug(f"Action details loaded: {list(action_name_to_time.keys())}")
+        self.logger.debug(f"Action details loaded: {list(catalog.durations)}")
+
+        rows, diagnostics = parse_rows(
+            robot_actions, catalog.durations, catalog.repeats, catalog=catalog
+        )
+        self._log_slack(rows)
+        if diagnostics:
+            raise CompileError(diagnostics)
+        return robot_actions, rows
+
+    def _log_slack(self, rows: List[ShowRow]) -> None:
+        """Log the slack table and the tightest cell of the song."""
+        cells = [cell for row in rows for cell in row.cells.values() if cell.slack is not None]
+        if not cells:
+            return
+        self.logger.debug("Slack per row and robot (seconds):\n" + format_slack(rows))
+        tightest = min(cells, key=lambda cell: cell.slack)
+        self.logger.info(f"Tightest slack: {tightest.slack:.2f}s for '{tightest.key}'")
+
+    def compile_show(self) -> List[ShowRow]:
+        """
+        Compile and validate the song into its structured representation.
+
+        Returns:
+            Parsed rows with resolved action references and slack per robot
+
+        Raises:
+            CompileError: With every existence and timing problem in the sheet
+        """
+        _, rows = self._compile()
+        return rows
 
-        self.check_actions_existence(robot_actions, action_name_to_time)
-        self.check_actions_time(robot_actions, action_name_to_time)
+    def compile_actions(self) -> List[Dict[str, Any]]:
+        """
+        Compile and validate robot actions from spreadsheet data.
 
+        Returns:
+            List of dictionaries containing validated robot actions
+
+        Raises:
+            ValueError: If actions don't exist or exceed their time allocation
+        """
+        robot_actions, _ = self._compile()
         return robot_actions
 
     def check_actions_time(
@@ -72,22 +162,7 @@ class ActionCompiler:
         Raises:
             ValueError: If action times exceed allocated time slot
         """
-        for idx, action in enumerate(robot_actions, start=1):
-            time_val = action.get("Time")
-            for key in self._get_robot_keys(action):
-                value = action[key]
-                if value:
-                    actions = [a.strip() for a in value.splitlines() if a.strip()]
-                    total_action_time = 0.0
-                    for act in actions:
-                        act_time = action_name_to_time.get(act, "")
-                        if act_time == "":
-                            continue  # Existence is checked elsewhere
-                        total_action_time += float(act_time)
-                    if total_action_time > float(time_val):
-                        raise ValueError(
-                            f"Row {idx}: Sum of action times {total_action_time}s for '{key}' exceeds overall time {time_val}s"
-                        )
+        self._raise_diagnostics(robot_actions, action_name_to_time, ("time_format", "time"))
 
     def check_actions_existence(
         self, robot_actions: List[Dict[str, str]], action_name_to_time: Dict[str, str]
@@ -102,13 +177,15 @@ class ActionCompiler:
         Raises:
             ValueError: If an action is referenced but not defined in action details
         """
-        for idx, action in enumerate(robot_actions, start=1):
-            for key in self._get_robot_keys(action):
-                value = action[key]
-                if value:
-                    actions = [a.strip() for a in value.splitlines() if a.strip()]
-                    for act in actions:
-                        if act not in action_name_to_time:
-                            raise ValueError(
-                                f"Row {idx}: Action '{act}' for key '{key}' not found in action_name_to_time"
-                            )
+        self._raise_diagnostics(robot_actions, action_name_to_time, ("existence",))
+
+    def _raise_diagnostics(
+        self,
+        robot_actions: List[Dict[str, str]],
+        action_name_to_time: Dict[str, str],
+        kinds: Tuple[str, ...],
+    ) -> None:
+        _, diagnostics = parse_rows(robot_actions, action_name_to_time)
+        selected = [d for d in diagnostics if d.kind in kinds]
+        if selected:
+            raise CompileError(selected)
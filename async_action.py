@@ -0,0 +1,570 @@
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from action import RPC_HEADERS, build_rpc_request
+from calibration import LatencyEstimate
+from constant import (
+    CALIBRATION_SAMPLES,
+    FLEET_REPROBE_INTERVAL,
+    MEDIA_START_TIMEOUT,
+    RECALIBRATION_INTERVAL,
+    ROBOT_MAX_TIMEOUT,
+    ROBOT_PING_METHOD,
+)
+from emergency_stop import stop_fleet_async
+from fleet_health import RobotHealth, format_fleet_status
+from media_clock import MediaClock, plan_playback, start_playback
+from retry_policy import RetryPolicy, RetryStats
+from scheduler import (
+    RECALIBRATION_MIN_GAP,
+    LatenessReport,
+    ScheduledAction,
+    Timeline,
+    playback_lead,
+)
+from show_trace import ShowTrace
+from song_player import MediaPlayer
+
+
+class AsyncRobotAction:
+    """
+    Asyncio counterpart of RobotAction.
+
+    Talks JSON-RPC over a single keep-alive HTTP/1.1 connection using asyncio
+    streams, so hundreds of robots can be driven from one event loop.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        action_name_to_time: Dict[str, float],
+        action_name_to_repeat_time: Dict[str, int] = None,
+        device_id: str = "1732853986186",
+        timeout: float = ROBOT_MAX_TIMEOUT,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        """
+        Initialize the AsyncRobotAction class.
+
+        Args:
+            api_url: The URL of the robot API
+            action_name_to_time: Dictionary mapping action names to their execution time
+            action_name_to_repeat_time: Dictionary mapping action names to their repeat time
+            device_id: The ID of the robot device
+            timeout: Timeout for a single request in seconds; once the robot's RTT
+                is known, commands use a shorter timeout adapted to it
+            retry: Retry policy for commands with a deadline
+        """
+        self.api_url = api_url
+        self.device_id = device_id
+        self.actions = action_name_to_time
+        self.repeat_actions = action_name_to_repeat_time or {}
+        self.timeout = timeout
+        # The robot is attached to every record, for the per-robot rate limit
+        self.logger = logging.LoggerAdapter(
+            logging.getLogger("AsyncRobotAction"), {"robot": device_id}
+        )
+        parts = urlsplit(api_url)
+        self._host = parts.hostname
+        self._port = parts.port or 80
+        self._path = parts.path or "/"
+        self._streams: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.latency = LatencyEstimate()
+        # Round trips of answered commands, which the request timeout adapts to
+        self.command_latency = LatencyEstimate()
+        self.health = RobotHealth()
+        self.retry = retry or RetryPolicy(max_timeout=timeout)
+        self.retry_stats = RetryStats()
+        self.last_send_time: Optional[float] = None
+        self.last_response_time: Optional[float] = None
+        self._opened = 0
+        self._requests = 0
+
+    async def warm_up(self) -> bool:
+        """Open the keep-alive connection before the show starts."""
+        return await self.ping(record=False) is not None
+
+    async def ping(self, record: bool = True) -> Optional[float]:
+        """Send the harmless ping method and return the round-trip time, see RobotAction.ping."""
+        loop = asyncio.get_running_loop()
+        try:
+            sent = loop.time()
+            await asyncio.wait_for(
+                self._post(build_rpc_request(ROBOT_PING_METHOD)), self.timeout
+            )
+            rtt = loop.time() - sent
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            self.logger.warning("%s ping failed: %r", self.device_id, e)
+            if not isinstance(e, ValueError):
+                self._record_failure()
+            await self.close()
+            return None
+        self._record_success(rtt)
+        if record:
+            self.latency.add(rtt)
+        return rtt
+
+    @property
+    def request_timeout(self) -> float:
+        """Timeout of one command, see RobotAction.request_timeout."""
+        estimate = self.command_latency if self.command_latency.count else self.latency
+        return estimate.timeout(self.retry.min_timeout, self.retry.max_timeout)
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Return how many connections were opened and how many requests reused one."""
+        return {"opened": self._opened, "reused": max(0, self._requests - self._opened)}
+
+    async def start_action(
+        self, name: str, repeat: Optional[int] = None, deadline: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Send a single RunAction command, see RobotAction.start_action."""
+        if repeat is None:
+            if name not in self.actions:
+                self.logger.error("Action '%s' not found in actions dictionary.", name)
+                return None
+            repeat = self.repeat_actions.get(name, 1)
+        return await self._send_request(
+            method="RunAction",
+            params=[name, repeat],
+            log_success_msg="Action run_action(%s, %s) successful.",
+            log_error_msg="Error running action run_action(%s, %s):",
+            log_args=(name, repeat),
+            deadline=deadline,
+        )
+
+    async def run_stop_action(self) -> Optional[Dict[str, Any]]:
+        """Stop any currently running robot action."""
+        return await self._send_request(
+            method="StopBusServo",
+            params=["stopAction"],
+            log_success_msg="Action run_stop_action() successful.",
+            log_error_msg="Error running action run_stop_action():",
+        )
+
+    async def emergency_stop(self, timeout: float) -> bool:
+        """Send StopBusServo once, even to an offline robot, see RobotAction.emergency_stop."""
+        try:
+            resp_json = await asyncio.wait_for(
+                self._post(build_rpc_request("StopBusServo", ["stopAction"])), timeout
+            )
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            self.logger.error("%s emergency stop failed: %r", self.device_id, e)
+            await self.close()
+            return False
+        if "result" not in resp_json:
+            self.logger.error("%s refused the emergency stop: %s", self.device_id, resp_json)
+            return False
+        return True
+
+    async def close(self) -> None:
+        """Close the keep-alive connection."""
+        if self._streams is not None:
+            _, writer = self._streams
+            self._streams = None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _send_request(
+        self,
+        method: str,
+        params: Optional[list],
+        log_success_msg: str,
+        log_error_msg: str,
+        log_args: tuple = (),
+        deadline: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Send an API request to the robot, see RobotAction._send_request.
+
+        Lost requests are retried with backoff under the robot's RetryPolicy,
+        the same way as RobotAction does; cancelling the task ends the backoff.
+        """
+        if not self.health.online:
+            self.logger.debug(log_error_msg + " %s robot is offline", *log_args, self.device_id)
+            return None
+        loop = asyncio.get_running_loop()
+        data = build_rpc_request(method, params)
+        self.retry_stats.count(requests=1)
+        attempt = 1
+        while True:
+            self.last_send_time = loop.time()
+            try:
+                try:
+                    resp_json = await asyncio.wait_for(self._post(data), self.request_timeout)
+                finally:
+                    self.last_response_time = loop.time()
+            except asyncio.CancelledError:
+                # A half-read reply would corrupt the next request on this connection
+                await self.close()
+                raise
+            except ValueError as e:
+                self.logger.error(log_error_msg + " %r", *log_args, e)
+                # An HTTP error status still shows the robot is reachable
+                self._record_success()
+                await self.close()
+                return None
+            except (OSError, asyncio.TimeoutError) as e:
+                self.retry_stats.count(timeouts=1)
+                # The connection state is unknown after a failure, start over next time
+                await self.close()
+                if deadline is None:
+                    self.logger.error(log_error_msg + " %r", *log_args, e)
+                    self._record_failure()
+                    return None
+                backoff = self.retry.delay(attempt)
+                if (
+                    attempt >= self.retry.max_attempts
+                    or loop.time() + backoff + self.latency.one_way > deadline
+                ):
+                    self.logger.error(
+                        log_error_msg + " %r; abandoned after %d attempt(s)", *log_args, e, attempt
+                    )
+                    self.retry_stats.count(abandoned=1)
+                    self._record_failure()
+                    return None
+                self.logger.warning(
+                    "%s %s attempt %d lost, retrying in %.0f ms",
+                    self.device_id, method, attempt, backoff * 1000,
+                )
+                self.retry_stats.count(retries=1)
+                await asyncio.sleep(backoff)
+                attempt += 1
+                continue
+            break
+
+        self._record_success()
+        self.command_latency.add(self.last_response_time - self.last_send_time)
+        if attempt > 1:
+            self.retry_stats.count(late_starts=1)
+        self.logger.info(
+            "%s - " + log_success_msg + " Response: %s", self.device_id, *log_args, resp_json
+        )
+        return resp_json
+
+    def _record_success(self, rtt: Optional[float] = None) -> None:
+        if self.health.success(rtt):
+            self.logger.info("%s is back online", self.device_id)
+
+    def _record_failure(self) -> None:
+        if self.health.failure():
+            self.logger.warning(
+                f"{self.device_id} failed {self.health.failures} requests in a row, "
+                f"its commands will fail fast until it answers again"
+            )
+
+    async def _post(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        POST a JSON body over the keep-alive connection and return the decoded reply.
+
+        Raises:
+            ConnectionError: If the reply is cut short, malformed or chunked
+            ValueError: If the robot answers with an HTTP error status or invalid JSON
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._streams is None:
+                self._streams = await asyncio.open_connection(self._host, self._port)
+                self._opened += 1
+            self._requests += 1
+            reader, writer = self._streams
+            body = json.dumps(data).encode("utf-8")
+            headers = "".join(f"{key}: {value}\r\n" for key, value in RPC_HEADERS.items())
+            writer.write(
+                (
+                    f"POST {self._path} HTTP/1.1\r\n"
+                    f"Host: {self._host}:{self._port}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "Connection: keep-alive\r\n"
+                    f"{headers}\r\n"
+                ).encode("latin-1")
+                + body
+            )
+            await writer.drain()
+            try:
+                status, length, keep_alive = await self._read_head(reader)
+                payload = await reader.readexactly(length) if length else b""
+            except asyncio.IncompleteReadError as e:
+                raise ConnectionResetError(
+                    f"Reply from {self.api_url} cut short after {len(e.partial)} bytes"
+                ) from e
+            if not keep_alive:
+                await self.close()
+            if status >= 400:
+                raise ValueError(f"HTTP {status} from {self.api_url}")
+            return json.loads(payload) if payload else {}
+
+    async def _read_head(self, reader: asyncio.StreamReader) -> Tuple[int, int, bool]:
+        """Read the status line and headers: the status, body length and keep-alive."""
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by robot")
+        parts = status_line.split()
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise ConnectionError(f"Malformed status line from {self.api_url}: {status_line!r}")
+        status = int(parts[1])
+        length = 0
+        keep_alive = True
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            key = key.strip().lower()
+            value = value.strip().lower()
+            if key == "content-length":
+                if not value.isdigit():
+                    raise ConnectionError(f"Malformed Content-Length from {self.api_url}: {value!r}")
+                length = int(value)
+            elif key == "transfer-encoding" and value != "identity":
+                # Only Content-Length bodies are read; the rest of the reply is left unread
+                raise ConnectionError(f"Unsupported Transfer-Encoding from {self.api_url}: {value}")
+            elif key == "connection" and value == "close":
+                keep_alive = False
+        return status, length, keep_alive
+
+
+class AsyncDispatcher:
+    """
+    Runs a song's timeline for all robots on a single asyncio event loop.
+
+    Each robot gets one task that sleeps until its next deadline, and the stop
+    signal cancels the tasks directly instead of being polled. Like
+    TimelineScheduler, commands are sent early by each robot's one-way delay.
+    """
+
+    def __init__(
+        self,
+        robots: Dict[int, AsyncRobotAction],
+        timeline: Timeline,
+        stop_event: threading.Event,
+        start_delay: float = 0.05,
+        trace: Optional[ShowTrace] = None,
+        clock: Optional[MediaClock] = None,
+        start_offset: float = 0.0,
+        player: Optional[MediaPlayer] = None,
+        song_file_path: Optional[str] = None,
+    ):
+        """
+        Initialize the dispatcher.
+
+        Args:
+            robots: Robots keyed by robot number
+            timeline: Compiled timeline of the song
+            stop_event: Event that interrupts the show when set
+            start_delay: Head start given to the tasks before the first deadline
+            trace: Optional trace that records the timing of every action
+            clock: Playback clock of the song, see TimelineScheduler
+            start_offset: Song position the show starts from, see Timeline.starting_at
+            player: Player of the song, stopped together with the robots when the show is interrupted
+            song_file_path: Song the player starts once the connections are warm and
+                calibrated; its playback clock then replaces `clock`
+        """
+        self.robots = robots
+        self.stop_event = stop_event
+        self.start_delay = start_delay
+        self.timeline = timeline
+        self.trace = trace
+        self.clock = clock
+        self.start_offset = start_offset
+        self.player = player
+        self.song_file_path = song_file_path
+        self.following: Optional[MediaClock] = None
+        self.report = LatenessReport(len(self.timeline.row_offsets))
+        self.start_time: Optional[float] = None
+        self._task_robots: List[int] = []
+        self.logger = logging.getLogger("AsyncDispatcher")
+
+    def run(self) -> LatenessReport:
+        """Warm up every connection, then run the timeline to the end or until stopped."""
+        return asyncio.run(self._run())
+
+    async def _run(self) -> LatenessReport:
+        loop = asyncio.get_running_loop()
+        warmed = await asyncio.gather(*(robot.warm_up() for robot in self.robots.values()))
+        for (robot_id, robot), ok in zip(self.robots.items(), warmed):
+            if not ok and robot.health.mark_down():
+                self.logger.warning(f"Robot {robot_id} is unreachable, its commands will fail fast")
+        self.logger.info(
+            f"Fleet status: {sum(warmed)}/{len(self.robots)} robots online\n"
+            + format_fleet_status(self.robots)
+        )
+        await asyncio.gather(
+            *(self._calibrate(robot) for robot, ok in zip(self.robots.values(), warmed) if ok)
+        )
+
+        self.start_time = loop.time() + self.start_delay - self.start_offset
+        play_at = None
+        if self.player is not None and self.song_file_path is not None:
+            # Planned only now, or the audio runs ahead while the fleet is being pinged
+            play_at, self.clock = plan_playback(
+                self.player, playback_lead(self.robots, self.start_delay), self.start_offset
+            )
+            self.start_time = play_at - self.start_offset
+        self.following = None
+        if self.clock is not None:
+            origin = await loop.run_in_executor(
+                None, self.clock.wait_for_start, self.stop_event, MEDIA_START_TIMEOUT
+            )
+            if origin is not None:
+                # The default loop clock is time.monotonic(), the media clock's time base
+                self.start_time = origin
+                self.following = self.clock
+            elif not self.stop_event.is_set():
+                self.logger.warning("No playback position from the player, following the wall clock")
+        if self.trace is not None:
+            self.trace.begin(self.start_time)
+        self._task_robots = [
+            robot_id for robot_id in self.robots if self.timeline.robot_entries.get(robot_id)
+        ]
+        tasks = [
+            asyncio.create_task(
+                self._run_robot(
+                    robot_id,
+                    self.robots[robot_id],
+                    self.timeline.robot_entries[robot_id],
+                    self.start_time,
+                )
+            )
+            for robot_id in self._task_robots
+        ]
+        readmit = asyncio.create_task(self._readmit())
+        if play_at is not None:
+            await loop.run_in_executor(
+                None,
+                start_playback,
+                self.player,
+                self.song_file_path,
+                self.start_offset,
+                self.clock,
+                play_at,
+                self.stop_event,
+            )
+        self.logger.info(
+            f"Timeline started: {len(self.timeline.row_offsets)} rows, "
+            f"{self.timeline.duration:.1f}s, {len(tasks)} robot tasks"
+        )
+
+        # A single executor thread blocks on the stop event for the song's length
+        end = self.start_time + self.timeline.duration
+        try:
+            stopped = await loop.run_in_executor(
+                None, self.stop_event.wait, max(0.0, end - loop.time())
+            )
+        except asyncio.CancelledError:
+            # Ctrl+C cancels the main task; stop the fleet before giving up
+            self.stop_event.set()
+            await self._emergency_stop(tasks)
+            raise
+        if stopped:
+            self.logger.info("Timeline interrupted by stop_event.")
+            await self._emergency_stop(tasks)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for robot_id, result in zip(self._task_robots, results):
+            if isinstance(result, Exception):
+                # The robot sat out the rest of the song; say so instead of dropping it
+                self.logger.error(f"Robot {robot_id} stopped dancing: {result!r}")
+        readmit.cancel()
+        await asyncio.gather(readmit, return_exceptions=True)
+        await asyncio.gather(*(robot.close() for robot in self.robots.values()))
+        self.report.log_summary(self.logger)
+        if self.following is not None:
+            self.following.log_summary(self.logger)
+        return self.report
+
+    async def _emergency_stop(self, tasks: List[asyncio.Task]) -> None:
+        """Cancel the robot tasks and broadcast StopBusServo to every robot."""
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await stop_fleet_async(self.robots, self.player)
+
+    async def _readmit(self) -> None:
+        """Re-probe offline robots every FLEET_REPROBE_INTERVAL so they can rejoin the show."""
+        while True:
+            await asyncio.sleep(FLEET_REPROBE_INTERVAL)
+            offline = [robot for robot in self.robots.values() if not robot.health.online]
+            if offline and any(await asyncio.gather(*(robot.ping() for robot in offline))):
+                self.logger.info("Fleet status changed\n" + format_fleet_status(self.robots))
+
+    async def _calibrate(self, robot: AsyncRobotAction) -> None:
+        for _ in range(CALIBRATION_SAMPLES):
+            if await robot.ping() is None:
+                break
+
+    async def _run_robot(
+        self,
+        robot_id: int,
+        robot: AsyncRobotAction,
+        entries: List[ScheduledAction],
+        start: float,
+    ) -> None:
+        """Fire a robot's actions early enough to arrive at their deadlines."""
+        loop = asyncio.get_running_loop()
+        latency = robot.latency
+        clock = self.following
+        last_calibration = loop.time()
+        for idx, entry in enumerate(entries):
+            if clock is not None:
+                start = clock.origin
+            send_at = start + entry.offset - latency.one_way
+            now = loop.time()
+            if (
+                send_at - now > RECALIBRATION_MIN_GAP
+                and now - last_calibration >= RECALIBRATION_INTERVAL
+            ):
+                await robot.ping()
+                last_calibration = loop.time()
+            try:
+                delay = send_at - loop.time()
+                while delay > 0:
+                    if clock is None:
+                        await asyncio.sleep(delay)
+                        break
+                    # Wake up every poll so a re-synced audio clock moves the deadline
+                    await asyncio.sleep(min(delay, clock.poll_interval))
+                    send_at = clock.origin + entry.offset - latency.one_way
+                    delay = send_at - loop.time()
+            except asyncio.CancelledError:
+                if self.trace is not None:
+                    self.trace.interrupted(robot_id, entry.row, entry.name, send_at, loop.time())
+                raise
+            woke = loop.time()
+            audio_offset = None
+            if clock is not None:
+                audio_offset = woke + latency.one_way - (clock.origin + entry.offset)
+            self.report.record(
+                entry.row, woke - send_at, robot_id, woke + latency.one_way, audio_offset
+            )
+            # Retried only while it can arrive usefully early, see TimelineScheduler
+            next_send = (
+                start + entries[idx + 1].offset - latency.one_way
+                if idx + 1 < len(entries)
+                else None
+            )
+            deadline = robot.retry.deadline(
+                start + entry.offset, robot.actions.get(entry.name) or 0.0, next_send
+            )
+            dispatched = loop.time()
+            result = await robot.start_action(entry.name, entry.repeat, deadline)
+            if self.trace is not None:
+                self.trace.action(
+                    robot_id,
+                    entry.row,
+                    entry.name,
+                    send_at,
+                    woke,
+                    dispatched,
+                    robot.last_send_time,
+                    robot.last_response_time,
+                    result is not None,
+                )
@@ -0,0 +1,462 @@
+import argparse
+import asyncio
+import bisect
+import logging
+import multiprocessing
+import os
+import secrets
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from action import RobotAction, build_rpc_request
+from async_action import AsyncDispatcher, AsyncRobotAction
+from calibration import calibrate_robots
+from constant import LOG_FORMAT
+from log_pipeline import QueuedLogging
+from mock_robot import fleet_urls, start_mock_fleet
+from scheduler import TimelineScheduler, compile_timeline
+from show_cluster import ShowCoordinator, ShowWorker, worker_robots
+from show_ir import parse_rows
+from show_plan import ShowPlan
+from telemetry import TelemetryCollector
+
+BENCH_ACTIONS = {"wave": 0.1}
+ENGINES = ("thread", "asyncio")
+# Sampling interval of the telemetry scenario, far denser than a show needs
+TELEMETRY_BENCH_INTERVAL = 0.05
+
+
+def synthetic_show(robot_count: int, rows: int, slot: float) -> List[Dict[str, str]]:
+    """Build a show where every robot performs one action at the start of every row."""
+    return [
+        {"Time": str(slot), **{f"Robot_{rid}": "wave" for rid in range(1, robot_count + 1)}}
+        for _ in range(rows)
+    ]
+
+
+def collect_arrivals(urls: List[str]) -> List[List[float]]:
+    """Fetch and clear the RunAction arrival times recorded by each mock robot."""
+
+    def fetch(url: str) -> List[float]:
+        response = requests.post(url, json=build_rpc_request("MockGetLog"), timeout=5)
+        return [
+            entry["time"]
+            for entry in response.json()["result"]
+            if entry["method"] == "RunAction"
+        ]
+
+    with ThreadPoolExecutor(max_workers=min(32, len(urls))) as executor:
+        return list(executor.map(fetch, urls))
+
+
+def thread_robots(urls: List[str]) -> Dict[int, RobotAction]:
+    """Create, warm up and calibrate thread-engine robots like initialize_robots does."""
+    robots = {
+        idx: RobotAction(url, BENCH_ACTIONS, {}, f"robot_{idx}")
+        for idx, url in enumerate(urls, start=1)
+    }
+    with ThreadPoolExecutor(max_workers=len(robots)) as executor:
+        list(executor.map(RobotAction.warm_up, robots.values()))
+    calibrate_robots(robots)
+    return robots
+
+
+def summarize(
+    arrivals: List[List[float]], start: float, row_offsets: List[float], cpu: float, wall: float
+) -> Dict[str, float]:
+    """
+    Turn mock-robot arrival times into timing metrics.
+
+    Drift is the median arrival lateness of the last tenth of the rows minus
+    that of the first tenth, so it shows whether error grows with song length.
+    """
+    deadlines = [start + offset for offset in row_offsets]
+    by_row: List[List[float]] = [[] for _ in deadlines]
+    for times in arrivals:
+        seen = set()
+        for arrival in times:
+            # Lost requests leave gaps, so match each arrival to the nearest row deadline
+            row = bisect.bisect_left(deadlines, arrival)
+            if row == len(deadlines) or (
+                row > 0 and arrival - deadlines[row - 1] < deadlines[row] - arrival
+            ):
+                row -= 1
+            if row not in seen:
+                seen.add(row)
+                by_row[row].append(arrival)
+    skews = []
+    row_lateness = []
+    lateness = []
+    for deadline, row_arrivals in zip(deadlines, by_row):
+        if not row_arrivals:
+            continue
+        skews.append(max(row_arrivals) - min(row_arrivals))
+        row_lateness.append(statistics.median(a - deadline for a in row_arrivals))
+        lateness.extend(a - deadline for a in row_arrivals)
+    tenth = max(1, len(row_lateness) // 10)
+    drift = 0.0
+    if row_lateness:
+        drift = statistics.median(row_lateness[-tenth:]) - statistics.median(row_lateness[:tenth])
+    delivered = sum(len(times) for times in arrivals)
+    expected = len(arrivals) * len(row_offsets)
+    return {
+        "cpu_percent": 100.0 * cpu / wall if wall else 0.0,
+        "skew_mean_ms": 1000.0 * statistics.mean(skews) if skews else 0.0,
+        "skew_max_ms": 1000.0 * max(skews) if skews else 0.0,
+        "late_p50_ms": 1000.0 * statistics.median(row_lateness) if row_lateness else 0.0,
+        "jitter_ms": 1000.0 * statistics.pstdev(lateness) if len(lateness) > 1 else 0.0,
+        "drift_ms": 1000.0 * drift,
+        "delivered": delivered / float(expected) if expected else 0.0,
+    }
+
+
+def run_show(
+    engine: str, urls: List[str], rows: int, slot: float, telemetry: Optional[float] = None
+) -> Dict[str, float]:
+    """
+    Run a synthetic show on one engine and measure CPU use, start skew and drift.
+
+    With `telemetry`, a TelemetryCollector samples the thread-engine robots
+    every that many seconds during the show.
+    """
+    show_rows, _ = parse_rows(synthetic_show(len(urls), rows, slot), BENCH_ACTIONS)
+    timeline = compile_timeline(show_rows, list(range(1, len(urls) + 1)))
+    stop_event = threading.Event()
+    robots: Dict[int, Any]
+    if engine == "asyncio":
+        robots = {
+            idx: AsyncRobotAction(url, BENCH_ACTIONS, {}, f"robot_{idx}")
+            for idx, url in enumerate(urls, start=1)
+        }
+        runner = AsyncDispatcher(robots, timeline, stop_event)
+    else:
+        robots = thread_robots(urls)
+        runner = TimelineScheduler(robots, timeline, stop_event)
+
+    collector = None
+    if telemetry is not None and engine != "asyncio":
+        collector = TelemetryCollector(robots, interval=telemetry, display_interval=None)
+    collect_arrivals(urls)  # Drop warm-up requests
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if collector is not None:
+        with collector:
+            runner.run()
+    else:
+        runner.run()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    if engine != "asyncio":
+        for robot in robots.values():
+            robot.close()
+    return summarize(collect_arrivals(urls), runner.start_time, timeline.row_offsets, cpu, wall)
+
+
+def run_throughput(engine: str, urls: List[str], commands: int) -> Dict[str, float]:
+    """Send `commands` RunActions per robot back to back and measure the dispatch rate."""
+    if engine == "asyncio":
+
+        async def blast() -> None:
+            robots = [AsyncRobotAction(url, BENCH_ACTIONS, {}) for url in urls]
+
+            async def send(robot: AsyncRobotAction) -> None:
+                for _ in range(commands):
+                    await robot.start_action("wave")
+                await robot.close()
+
+            await asyncio.gather(*(send(robot) for robot in robots))
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        asyncio.run(blast())
+    else:
+        robots = thread_robots(urls)
+        collect_arrivals(urls)
+
+        def send(robot: RobotAction) -> None:
+            for _ in range(commands):
+                robot.start_action("wave")
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        with ThreadPoolExecutor(max_workers=len(robots)) as executor:
+            list(executor.map(send, robots.values()))
+        for robot in robots.values():
+            robot.close()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    delivered = sum(len(times) for times in collect_arrivals(urls))
+    return {
+        "rpc_per_s": delivered / wall if wall else 0.0,
+        "cpu_percent": 100.0 * cpu / wall if wall else 0.0,
+        "delivered": delivered / float(len(urls) * commands),
+    }
+
+
+def print_row(label: Dict[str, Any], result: Dict[str, float]) -> None:
+    fields = [f"{key}={value}" for key, value in label.items()]
+    fields += [
+        f"{key}={value:.0%}" if key == "delivered" else f"{key}={value:.2f}"
+        for key, value in result.items()
+    ]
+    print("  ".join(fields), flush=True)
+
+
+def bench_scale(args: argparse.Namespace, network: Dict[str, Any]) -> List[Dict[str, float]]:
+    """Start skew and CPU use as the fleet grows, for both engines."""
+    results = []
+    for count in args.robots:
+        fleet = start_mock_fleet(count, args.base_port, **network)
+        if fleet is None:
+            continue
+        try:
+            urls = fleet_urls(count, args.base_port)
+            for engine in args.engines:
+                result = run_show(engine, urls, args.rows, args.slot)
+                print_row({"scenario": "scale", "robots": count, "engine": engine}, result)
+                results.append(result)
+        finally:
+            fleet.terminate()
+            fleet.join()
+    return results
+
+
+def bench_drift(args: argparse.Namespace, network: Dict[str, Any]) -> List[Dict[str, float]]:
+    """Cumulative timeline drift as shows get longer."""
+    results = []
+    count = args.robots[0]
+    fleet = start_mock_fleet(count, args.base_port, **network)
+    if fleet is None:
+        return results
+    try:
+        urls = fleet_urls(count, args.base_port)
+        for rows in args.lengths:
+            for engine in args.engines:
+                result = run_show(engine, urls, rows, args.slot)
+                print_row({"scenario": "drift", "rows": rows, "engine": engine}, result)
+                results.append(result)
+    finally:
+        fleet.terminate()
+        fleet.join()
+    return results
+
+
+def bench_throughput(args: argparse.Namespace, network: Dict[str, Any]) -> List[Dict[str, float]]:
+    """Back-to-back dispatch rate through RobotAction and AsyncRobotAction."""
+    for count in args.robots:
+        fleet = start_mock_fleet(count, args.base_port, **network)
+        if fleet is None:
+            continue
+        try:
+            urls = fleet_urls(count, args.base_port)
+            for engine in args.engines:
+                result = run_throughput(engine, urls, args.commands)
+                print_row({"scenario": "throughput", "robots": count, "engine": engine}, result)
+        finally:
+            fleet.terminate()
+            fleet.join()
+    return []
+
+
+def bench_logging(args: argparse.Namespace, network: Dict[str, Any]) -> List[Dict[str, float]]:
+    """Dispatch jitter with synchronous INFO logging, as main.py logs by default, and with --log-queue."""
+    results = []
+    count = args.robots[0]
+    fleet = start_mock_fleet(count, args.base_port, **network)
+    if fleet is None:
+        return results
+    log_path = os.path.join(tempfile.gettempdir(), "benchmark_logging.log")
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    try:
+        urls = fleet_urls(count, args.base_port)
+        for mode in ("sync", "queue"):
+            handler = logging.FileHandler(log_path, mode="w", encoding="utf-8")
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            try:
+                if mode == "queue":
+                    with QueuedLogging(logging.INFO, [handler]):
+                        result = run_show("thread", urls, args.rows, args.slot)
+                else:
+                    root.handlers = [handler]
+                    root.setLevel(logging.INFO)
+                    try:
+                        result = run_show("thread", urls, args.rows, args.slot)
+                    finally:
+                        root.handlers = handlers
+                        root.setLevel(level)
+            finally:
+                handler.close()
+            print_row({"scenario": "logging", "robots": count, "logging": mode}, result)
+            results.append(result)
+    finally:
+        fleet.terminate()
+        fleet.join()
+    return results
+
+
+def bench_telemetry(args: argparse.Namespace, network: Dict[str, Any]) -> List[Dict[str, float]]:
+    """Dispatch timing of the thread engine without and with background telemetry sampling."""
+    results = []
+    count = args.robots[0]
+    fleet = start_mock_fleet(count, args.base_port, **network)
+    if fleet is None:
+        return results
+    try:
+        urls = fleet_urls(count, args.base_port)
+        for interval in (None, TELEMETRY_BENCH_INTERVAL):
+            result = run_show("thread", urls, args.rows, args.slot, telemetry=interval)
+            mode = "off" if interval is None else f"every {interval}s"
+            print_row({"scenario": "telemetry", "robots": count, "telemetry": mode}, result)
+            results.append(result)
+    finally:
+        fleet.terminate()
+        fleet.join()
+    return results
+
+
+def _run_cluster_worker(port: int, shard: List[Tuple[int, str]], name: str, token: str) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    robots = worker_robots(shard)
+    try:
+        ShowWorker(("127.0.0.1", port), robots, name, token).run()
+    finally:
+        for robot in robots.values():
+            robot.close()
+
+
+def bench_cluster(args: argparse.Namespace, network: Dict[str, Any]) -> List[Dict[str, float]]:
+    """Start skew with the fleet sharded across worker processes and one coordinator."""
+    results = []
+    count = args.robots[0]
+    fleet = start_mock_fleet(count, args.base_port, **network)
+    if fleet is None:
+        return results
+    urls = fleet_urls(count, args.base_port)
+    port = args.base_port + count
+    token = secrets.token_hex(16)
+    coordinator = ShowCoordinator(args.workers, token, port=port)
+    shards = [
+        [(rid, urls[rid - 1]) for rid in range(1, count + 1) if rid % args.workers == idx]
+        for idx in range(args.workers)
+    ]
+    workers = []
+    try:
+        accepting = threading.Thread(target=coordinator.accept_workers, args=(30.0,))
+        accepting.start()
+        for idx, shard in enumerate(shards):
+            worker = multiprocessing.Process(
+                target=_run_cluster_worker,
+                args=(port, shard, f"worker_{idx + 1}", token),
+                daemon=True,
+            )
+            worker.start()
+            workers.append(worker)
+        accepting.join()
+
+        show_rows, _ = parse_rows(synthetic_show(count, args.rows, args.slot), BENCH_ACTIONS)
+        timeline = compile_timeline(show_rows, list(range(1, count + 1)))
+        plan = ShowPlan.from_timeline("bench", timeline, BENCH_ACTIONS, {})
+        collect_arrivals(urls)
+        coordinator.play("bench", "bench.mp4", plan, threading.Event())
+        result = summarize(
+            collect_arrivals(urls), coordinator.start_time, timeline.row_offsets, 0.0, 0.0
+        )
+        del result["cpu_percent"]
+        print_row({"scenario": "cluster", "robots": count, "workers": args.workers}, result)
+        results.append(result)
+    finally:
+        coordinator.close()
+        for worker in workers:
+            worker.join(5.0)
+            if worker.is_alive():
+                worker.terminate()
+        fleet.terminate()
+        fleet.join()
+    return results
+
+
+SCENARIOS = {
+    "scale": bench_scale,
+    "drift": bench_drift,
+    "throughput": bench_throughput,
+    "cluster": bench_cluster,
+    "logging": bench_logging,
+    "telemetry": bench_telemetry,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the robot dispatch path against a mock robot fleet."
+    )
+    parser.add_argument(
+        "scenarios", nargs="*", metavar="scenario",
+        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)",
+    )
+    parser.add_argument(
+        "--robots", type=int, nargs="+", default=[6, 25, 50, 100, 200],
+        help="fleet sizes to benchmark; drift uses the first one",
+    )
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--rows", type=int, default=15, help="rows in the scale show")
+    parser.add_argument(
+        "--lengths", type=int, nargs="+", default=[20, 100, 400],
+        help="show lengths in rows for the drift scenario",
+    )
+    parser.add_argument("--slot", type=float, default=0.2, help="Time value of every row")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes for cluster")
+    parser.add_argument("--commands", type=int, default=200, help="commands per robot for throughput")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated round-trip time in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="simulated jitter in ms")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of unanswered requests")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for jitter and loss")
+    parser.add_argument("--base-port", type=int, default=19030, help="first mock robot port")
+    parser.add_argument(
+        "--max-skew-ms", type=float, default=None,
+        help="exit with an error if any show's worst start skew exceeds this",
+    )
+    parser.add_argument(
+        "--max-drift-ms", type=float, default=None,
+        help="exit with an error if any show's timeline drift exceeds this",
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    network = {
+        "latency": args.latency / 1000.0,
+        "jitter": args.jitter / 1000.0,
+        "loss": args.loss,
+        "seed": args.seed,
+    }
+    results = []
+    for scenario in args.scenarios:
+        results.extend(SCENARIOS[scenario](args, network))
+
+    failed = False
+    if args.max_skew_ms is not None and any(r["skew_max_ms"] > args.max_skew_ms for r in results):
+        print(f"FAIL: start skew above {args.max_skew_ms} ms")
+        failed = True
+    if args.max_drift_ms is not None and any(abs(r["drift_ms"]) > args.max_drift_ms for r in results):
+        print(f"FAIL: timeline drift above {args.max_drift_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
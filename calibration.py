@@ -0,0 +1,92 @@
+import logging
+import statistics
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Optional
+
+from constant import CALIBRATION_SAMPLES, MAX_LATENCY_LEAD
+
+if TYPE_CHECKING:
+    from action import RobotAction
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyEstimate:
+    """
+    Rolling round-trip time estimate of one robot.
+
+    The one-way delay is taken as half the median RTT, which is what a command
+    is sent ahead of its deadline so it arrives on time.
+    """
+
+    def __init__(self, window: int = 20):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def add(self, rtt: float) -> None:
+        with self._lock:
+            self._samples.append(rtt)
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    @property
+    def rtt(self) -> Optional[float]:
+        """Median round-trip time in seconds, None before the first sample."""
+        with self._lock:
+            return statistics.median(self._samples) if self._samples else None
+
+    @property
+    def jitter(self) -> float:
+        """Standard deviation of the round-trip time in seconds."""
+        with self._lock:
+            return statistics.pstdev(self._samples) if len(self._samples) > 1 else 0.0
+
+    def timeout(self, minimum: float, maximum: float) -> float:
+        """
+        Request timeout adapted to this robot: the RTT plus four times its jitter.
+
+        Returns `maximum` before the first sample.
+        """
+        rtt = self.rtt
+        if rtt is None:
+            return maximum
+        return min(maximum, max(minimum, rtt + 4.0 * self.jitter))
+
+    @property
+    def one_way(self) -> float:
+        """Estimated one-way delay, capped at MAX_LATENCY_LEAD."""
+        rtt = self.rtt
+        return min(rtt / 2.0, MAX_LATENCY_LEAD) if rtt is not None else 0.0
+
+
+def calibrate_robots(robots: Dict[int, "RobotAction"], samples: int = CALIBRATION_SAMPLES) -> None:
+    """
+    Measure the RTT of every robot in parallel and log the estimates.
+
+    Each robot is pinged `samples` times in a row over its pooled connection,
+    so the measurement reflects the warm path used during the show.
+    """
+    if not robots:
+        return
+
+    def measure(robot: "RobotAction") -> None:
+        for _ in range(samples):
+            if robot.ping() is None:
+                break
+
+    with ThreadPoolExecutor(max_workers=len(robots)) as executor:
+        list(executor.map(measure, robots.values()))
+
+    for robot_id, robot in robots.items():
+        estimate = robot.latency
+        if estimate.rtt is None:
+            logger.warning(f"Robot {robot_id}: no latency samples, sending without lead")
+        else:
+            logger.info(
+                f"Robot {robot_id}: RTT {estimate.rtt * 1000:.1f} ms "
+                f"± {estimate.jitter * 1000:.1f} ms, lead {estimate.one_way * 1000:.1f} ms"
+            )
@@ -13,3 +13,94 @@ ROBOT_IPS = [
     "http://192.168.137.5:9030",
     "http://192.168.137.6:9030",
 ]
+
+# Harmless JSON-RPC method used to open and probe robot connections
+ROBOT_PING_METHOD = "GetBatteryVoltage"
+
+# Local cache of downloaded spreadsheets
+SPREADSHEET_CACHE_DIR = ".cache/spreadsheets"
+SPREADSHEET_CACHE_TTL = 300  # seconds before a cached sheet is revalidated
+SPREADSHEET_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Pause between songs; the next song is prepared while the current one plays
+SONG_GAP_SECONDS = 0.5
+
+# Directory of compiled show plans, see `python main.py --compile-plans`
+SHOW_PLAN_DIR = "plans"
+
+# Latency calibration: pings per robot at startup, cap on how early a command
+# is sent, and how often each robot is re-measured during a show (seconds)
+CALIBRATION_SAMPLES = 5
+MAX_LATENCY_LEAD = 0.25
+RECALIBRATION_INTERVAL = 15.0
+
+# Media clock: the robots follow the position reported by the song player.
+# VLC's HTTP interface listens on this local port while a song plays.
+VLC_HTTP_PORT = 9099
+MEDIA_CLOCK_POLL_INTERVAL = 0.05  # seconds between position polls
+MEDIA_START_TIMEOUT = 10.0  # seconds to wait for audio before following the wall clock
+# First guess of the delay from launching VLC until the audio starts; after the
+# first song the measured delay is used to plan the next song's start
+VLC_STARTUP_LATENCY = 0.3
+
+# Fleet health: total time a probe of all robots may take, how often offline
+# robots are re-probed (seconds), and failed requests in a row before a robot
+# is taken offline and its commands fail fast
+FLEET_PROBE_BUDGET = 1.0
+FLEET_REPROBE_INTERVAL = 5.0
+ROBOT_FAILURE_LIMIT = 3
+
+# Distributed show control, see show_cluster.py: the address and port the
+# coordinator listens on, the environment variable holding the shared token
+# workers must present, how long a new connection may take to say hello, how
+# long it waits for workers to connect and to get ready for a song, and how
+# far ahead the common start is set when no playback clock is available
+CLUSTER_HOST = "127.0.0.1"
+CLUSTER_PORT = 9500
+CLUSTER_TOKEN_ENV = "ROBOT_CLUSTER_TOKEN"
+CLUSTER_HELLO_TIMEOUT = 5.0
+CLUSTER_CONNECT_TIMEOUT = 60.0
+CLUSTER_READY_TIMEOUT = 10.0
+CLUSTER_START_LEAD = 0.5
+
+# Rehearsal mode: seconds between conditional polls of the edited sheet
+REHEARSAL_POLL_INTERVAL = 2.0
+
+# Show simulator: idle time between a robot's actions that is reported as a
+# gap, and overruns up to this many seconds that are not reported
+SIMULATION_IDLE_GAP = 2.0
+SIMULATION_OVERRUN_TOLERANCE = 0.05
+
+# Deadline-aware retries of robot commands: request timeouts adapt to each
+# robot's RTT within these bounds (seconds), failed commands are retried up to
+# RETRY_MAX_ATTEMPTS times with exponential backoff from RETRY_BACKOFF, and an
+# action is abandoned once it could only start more than RETRY_LATE_FRACTION
+# of its duration late
+ROBOT_MIN_TIMEOUT = 0.05
+ROBOT_MAX_TIMEOUT = 0.5
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 0.02
+RETRY_LATE_FRACTION = 0.25
+
+# Logging: record format, and with --log-queue how many records per second
+# (after a burst) each robot may log before the rest are dropped
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_ROBOT_RATE = 5.0
+LOG_ROBOT_BURST = 20
+
+# Emergency stop: seconds the StopBusServo broadcast to the whole fleet may take
+EMERGENCY_STOP_DEADLINE = 0.3
+
+# Telemetry, see telemetry.py: read-only JSON-RPC methods sampled from every
+# robot between its commands, seconds between sampling rounds, the longest a
+# sample may take, how far clear of the robot's next command it must finish,
+# samples kept per robot, and how often the live status table is logged.
+# The robots' JSON-RPC API has no method for servo temperatures or for the
+# running action, so battery voltage, the method the ping also calls, is the
+# only metric; add more here if the firmware gains them
+TELEMETRY_METRICS = {"battery": "GetBatteryVoltage"}
+TELEMETRY_INTERVAL = 2.0
+TELEMETRY_TIMEOUT = 0.2
+TELEMETRY_GUARD = 0.1
+TELEMETRY_CAPACITY = 300
+TELEMETRY_DISPLAY_INTERVAL = 30.0
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from constant import EMERGENCY_STOP_DEADLINE
+
+if TYPE_CHECKING:
+    from action import RobotAction
+    from async_action import AsyncRobotAction
+    from song_player import MediaPlayer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StopReport:
+    """Outcome of an emergency stop; latencies are seconds from the moment it was triggered."""
+
+    robots: int
+    confirmed: Dict[int, float] = field(default_factory=dict)
+    unconfirmed: List[int] = field(default_factory=list)
+    player: Optional[float] = None
+    elapsed: float = 0.0
+
+    def summary(self) -> Dict[str, object]:
+        """Plain fields, for the cluster's control messages."""
+        return {
+            "robots": self.robots,
+            "confirmed": len(self.confirmed),
+            "unconfirmed": self.unconfirmed,
+            "slowest": max(self.confirmed.values(), default=0.0),
+            "elapsed": self.elapsed,
+        }
+
+    def log(self, logger: logging.Logger) -> None:
+        slowest = max(self.confirmed.values(), default=0.0)
+        player = f", song stopped in {self.player * 1000:.1f} ms" if self.player is not None else ""
+        logger.warning(
+            f"Emergency stop: {len(self.confirmed)}/{self.robots} robots confirmed, "
+            f"slowest {slowest * 1000:.1f} ms, done in {self.elapsed * 1000:.1f} ms{player}"
+        )
+        if self.unconfirmed:
+            logger.error(f"Robots {self.unconfirmed} did not confirm the stop")
+
+
+def stop_fleet(
+    robots: Dict[int, "RobotAction"],
+    player: Optional["MediaPlayer"] = None,
+    deadline: float = EMERGENCY_STOP_DEADLINE,
+) -> StopReport:
+    """
+    Send StopBusServo to every robot at once and stop the song at the same moment.
+
+    Every robot gets its own thread and reuses its pooled connection. Offline
+    robots are tried too, and the whole stop takes at most `deadline`
+    seconds: robots that haven't confirmed by then are reported.
+
+    Args:
+        robots: Robots to stop
+        player: Player of the current song, stopped alongside the robots
+        deadline: Seconds the stop may take in total
+
+    Returns:
+        The StopReport, which is also logged
+    """
+    triggered = time.monotonic()
+    report = StopReport(len(robots))
+    # Answers after the deadline land here but no longer in the report
+    confirmed: Dict[int, float] = {}
+    player_stopped: List[float] = []
+
+    def on_answer(robot_id: int, future: Future) -> None:
+        if not future.cancelled() and future.exception() is None and future.result():
+            confirmed[robot_id] = time.monotonic() - triggered
+
+    executor = ThreadPoolExecutor(max_workers=len(robots) + 1, thread_name_prefix="emergency-stop")
+    futures = []
+    for robot_id, robot in robots.items():
+        future = executor.submit(robot.emergency_stop, deadline)
+        future.add_done_callback(partial(on_answer, robot_id))
+        futures.append(future)
+    if player is not None:
+        future = executor.submit(player.stop)
+        future.add_done_callback(lambda _: player_stopped.append(time.monotonic() - triggered))
+        futures.append(future)
+    wait(futures, timeout=deadline)
+    executor.shutdown(wait=False)
+    report.elapsed = time.monotonic() - triggered
+    report.confirmed = dict(confirmed)
+    report.player = player_stopped[0] if player_stopped else None
+    report.unconfirmed = sorted(rid for rid in robots if rid not in report.confirmed)
+    report.log(logger)
+    return report
+
+
+async def stop_fleet_async(
+    robots: Dict[int, "AsyncRobotAction"],
+    player: Optional["MediaPlayer"] = None,
+    deadline: float = EMERGENCY_STOP_DEADLINE,
+) -> StopReport:
+    """Send StopBusServo to every asyncio robot at once, see stop_fleet."""
+    loop = asyncio.get_running_loop()
+    triggered = loop.time()
+    report = StopReport(len(robots))
+
+    async def stop(robot_id: int, robot: "AsyncRobotAction") -> None:
+        if await robot.emergency_stop(deadline):
+            report.confirmed[robot_id] = loop.time() - triggered
+
+    async def stop_player() -> None:
+        await loop.run_in_executor(None, player.stop)
+        report.player = loop.time() - triggered
+
+    tasks = [asyncio.create_task(stop(robot_id, robot)) for robot_id, robot in robots.items()]
+    if player is not None:
+        tasks.append(asyncio.create_task(stop_player()))
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+    report.elapsed = loop.time() - triggered
+    report.unconfirmed = sorted(rid for rid in robots if rid not in report.confirmed)
+    report.log(logger)
+    return report
@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from constant import FLEET_PROBE_BUDGET, FLEET_REPROBE_INTERVAL, ROBOT_FAILURE_LIMIT
+
+if TYPE_CHECKING:
+    from action import RobotAction
+
+logger = logging.getLogger(__name__)
+
+
+class RobotHealth:
+    """
+    Reachability of one robot.
+
+    An offline robot fails every command immediately instead of waiting for
+    its request timeout, so it costs the rest of the show nothing. Robots go
+    offline when a probe fails or after `failure_limit` failed requests in a
+    row, and come back online on the next answered request or probe.
+    """
+
+    def __init__(self, failure_limit: int = ROBOT_FAILURE_LIMIT):
+        self.failure_limit = failure_limit
+        self._lock = threading.Lock()
+        self.online = True
+        self.failures = 0
+        self.since = time.monotonic()
+        self.last_rtt: Optional[float] = None
+
+    def success(self, rtt: Optional[float] = None) -> bool:
+        """Record an answered request; returns True if the robot was just re-admitted."""
+        with self._lock:
+            self.failures = 0
+            if rtt is not None:
+                self.last_rtt = rtt
+            if self.online:
+                return False
+            self.online = True
+            self.since = time.monotonic()
+            return True
+
+    def failure(self) -> bool:
+        """Record an unanswered request; returns True if the robot was just taken offline."""
+        with self._lock:
+            self.failures += 1
+            if not self.online or self.failures < self.failure_limit:
+                return False
+            self.online = False
+            self.since = time.monotonic()
+            return True
+
+    def mark_down(self) -> bool:
+        """Take the robot offline at once; returns True if it was online."""
+        with self._lock:
+            self.failures = max(self.failures, self.failure_limit)
+            if not self.online:
+                return False
+            self.online = False
+            self.since = time.monotonic()
+            return True
+
+
+def probe_fleet(
+    robots: Dict[int, "RobotAction"],
+    budget: float = FLEET_PROBE_BUDGET,
+    only_offline: bool = False,
+) -> List[int]:
+    """
+    Ping robots in parallel and update their health within a bounded total time.
+
+    Robots that haven't answered when the budget runs out are marked offline;
+    their pings finish in the background.
+
+    Args:
+        robots: Robots to probe
+        budget: Maximum seconds the probe may take
+        only_offline: Only probe robots that are currently offline
+
+    Returns:
+        IDs of the probed robots that answered
+    """
+    targets = {
+        robot_id: robot
+        for robot_id, robot in robots.items()
+        if not only_offline or not robot.health.online
+    }
+    if not targets:
+        return []
+    executor = ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="probe")
+    futures = {
+        executor.submit(robot.ping, True, min(budget, robot.timeout)): robot_id
+        for robot_id, robot in targets.items()
+    }
+    done, _ = wait(futures, timeout=budget)
+    executor.shutdown(wait=False)
+
+    # Answered pings have already re-admitted their robots
+    answered = []
+    for future, robot_id in futures.items():
+        if future in done and future.result() is not None:
+            answered.append(robot_id)
+        elif targets[robot_id].health.mark_down():
+            logger.warning(f"Robot {robot_id} is unreachable, its commands will fail fast")
+    return sorted(answered)
+
+
+def format_fleet_status(robots: Dict[int, "RobotAction"]) -> str:
+    """Render the health of every robot as a text table."""
+    now = time.monotonic()
+    lines = [f"{'Robot':<6}{'State':<9}{'RTT ms':>8}{'Fails':>7}{'For s':>8}  URL"]
+    for robot_id, robot in sorted(robots.items()):
+        health = robot.health
+        rtt = f"{health.last_rtt * 1000:.1f}" if health.last_rtt is not None else "-"
+        lines.append(
+            f"{robot_id:<6}{'online' if health.online else 'OFFLINE':<9}{rtt:>8}"
+            f"{health.failures:>7}{now - health.since:>8.0f}  {robot.api_url}"
+        )
+    return "\n".join(lines)
+
+
+class FleetMonitor:
+    """
+    Keeps the fleet's health current during and between songs.
+
+    A background thread re-probes offline robots every `interval` seconds, so
+    a robot that comes back is re-admitted without costing the others any
+    time. The status table is logged whenever a robot changes state.
+    """
+
+    def __init__(
+        self,
+        robots: Dict[int, "RobotAction"],
+        interval: float = FLEET_REPROBE_INTERVAL,
+        budget: float = FLEET_PROBE_BUDGET,
+    ):
+        self.robots = robots
+        self.interval = interval
+        self.budget = budget
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def probe(self) -> List[int]:
+        """Probe every robot now and log the status table."""
+        answered = probe_fleet(self.robots, self.budget)
+        logger.info(
+            f"Fleet status: {len(answered)}/{len(self.robots)} robots online\n"
+            + format_fleet_status(self.robots)
+        )
+        return answered
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._watch, name="fleet-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if probe_fleet(self.robots, self.budget, only_offline=True):
+                logger.info("Fleet status changed\n" + format_fleet_status(self.robots))
@@ -0,0 +1,125 @@
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+from constant import LOG_FORMAT, LOG_ROBOT_BURST, LOG_ROBOT_RATE
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queues records as they are, so they are formatted on the listener thread.
+
+    The standard QueueHandler formats the message in the logging thread to
+    make the record picklable; records here never leave the process. Log
+    arguments must therefore not be mutated after the call, which holds for
+    the response dicts and numbers the robots log.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RobotRateLimit(logging.Filter):
+    """
+    Token bucket per robot for records below ERROR.
+
+    A robot may log `burst` records at once and `rate` records per second
+    after that; the rest are counted and dropped before they are queued.
+    Records without a `robot` attribute always pass.
+    """
+
+    def __init__(self, rate: float = LOG_ROBOT_RATE, burst: float = LOG_ROBOT_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self.suppressed: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        robot = getattr(record, "robot", None)
+        if robot is None or record.levelno >= logging.ERROR:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(robot, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1.0:
+                self._buckets[robot] = (tokens, now)
+                self.suppressed[robot] = self.suppressed.get(robot, 0) + 1
+                return False
+            self._buckets[robot] = (tokens - 1.0, now)
+        return True
+
+
+class QueuedLogging:
+    """
+    Logging pipeline that keeps formatting and I/O off the dispatch threads.
+
+    While active, the root logger only puts records on an in-memory queue; a
+    listener thread formats them and writes them to the real handlers. Use
+    it as a context manager around the show.
+    """
+
+    def __init__(
+        self,
+        level: int = logging.INFO,
+        handlers: Optional[List[logging.Handler]] = None,
+        rate: float = LOG_ROBOT_RATE,
+        burst: float = LOG_ROBOT_BURST,
+    ):
+        """
+        Initialize the pipeline.
+
+        Args:
+            level: Level of the root logger while the pipeline is active
+            handlers: Handlers the listener writes to, stderr with LOG_FORMAT by default
+            rate: Records per second each robot may log, see RobotRateLimit
+            burst: Records each robot may log at once
+        """
+        if handlers is None:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            handlers = [handler]
+        self.level = level
+        self.handlers = handlers
+        self.rate_limit = RobotRateLimit(rate, burst)
+        self._queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self.handler = DeferredQueueHandler(self._queue)
+        self.handler.addFilter(self.rate_limit)
+        self.listener = QueueListener(self._queue, *handlers, respect_handler_level=True)
+        self._previous: Optional[Tuple[List[logging.Handler], int]] = None
+
+    def start(self) -> None:
+        root = logging.getLogger()
+        self._previous = (root.handlers[:], root.level)
+        root.handlers = [self.handler]
+        root.setLevel(self.level)
+        self.listener.start()
+
+    def stop(self) -> None:
+        """Flush the queue, report dropped records and restore the previous handlers."""
+        self.listener.stop()
+        if self._previous is not None:
+            root = logging.getLogger()
+            root.handlers, level = self._previous
+            root.setLevel(level)
+            self._previous = None
+        suppressed = self.rate_limit.suppressed
+        if suppressed:
+            logging.getLogger(__name__).info(
+                "Rate limit dropped %d log record(s): %s",
+                sum(suppressed.values()),
+                ", ".join(f"{robot} {count}" for robot, count in sorted(suppressed.items())),
+            )
+
+    def __enter__(self) -> "QueuedLogging":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
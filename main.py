@@ -1,78 +1,88 @@
+import argparse
 import logging
 import os
+import random
+import sys
 import threading
 import time
-from typing import Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Dict, Mapping, Optional, Tuple, Type, Union
 
 from action import RobotAction
-from action_compiler import ActionCompiler
-from constant import ROBOT_IPS
-from song_player import play_song, stop_song
+from async_action import AsyncDispatcher, AsyncRobotAction
+from calibration import calibrate_robots
+from constant import (
+    CLUSTER_HOST,
+    CLUSTER_PORT,
+    CLUSTER_TOKEN_ENV,
+    LOG_FORMAT,
+    REHEARSAL_POLL_INTERVAL,
+    ROBOT_IPS,
+    SHOW_PLAN_DIR,
+    SONG_GAP_SECONDS,
+    SPREADSHEET_CACHE_DIR,
+    SPREADSHEET_CACHE_MAX_BYTES,
+    SPREADSHEET_CACHE_TTL,
+)
+from emergency_stop import stop_fleet
+from fleet_health import FleetMonitor
+from log_pipeline import QueuedLogging
+from rehearsal import Rehearsal
+from scheduler import Timeline, TimelineScheduler, compile_timeline
+from show_cluster import ShowCoordinator, cluster_token
+from show_plan import PLAN_EXTENSION, ShowPlan
+from show_simulator import ShowSimulator, SimulatedRobot
+from show_trace import ShowTrace
+from song_player import PLAYERS, MediaPlayer, SystemPlayer
+from spreadsheet_cache import SpreadsheetCache
 from spreadsheet_loader import SpreadsheetLoader
+from spreadsheet_workbook import SpreadsheetWorkbook
+from telemetry import TelemetryCollector
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
 
 def initialize_robots(
-    action_name_to_time: Dict, action_name_to_repeat_time: Dict
+    action_name_to_time: Optional[Dict] = None,
+    action_name_to_repeat_time: Optional[Dict] = None,
 ) -> Dict[int, RobotAction]:
     """Initialize all robot connections and return them as a dictionary."""
     robots = {}
     for idx, ip_address in enumerate(ROBOT_IPS):
         robot_id = idx + 1
         try:
-            robots[robot_id] = RobotAction(
-                ip_address, action_name_to_time, action_name_to_repeat_time, "robot_"+ str(robot_id)
+            robot = RobotAction(
+                ip_address, action_name_to_time or {}, action_name_to_repeat_time, "robot_"+ str(robot_id)
             )
+            robot.open_session()
+            robots[robot_id] = robot
             logger.info(f"Robot {robot_id} initialized at {ip_address}")
         except (ConnectionError, OSError, ValueError) as e:
             logger.error(f"Failed to initialize Robot {robot_id}: {e}")
+
+    # Probe every robot in parallel; this also pre-warms the connections, and
+    # unreachable robots fail fast instead of stalling on timeouts
+    if robots:
+        online = FleetMonitor(robots).probe()
+        calibrate_robots({rid: robots[rid] for rid in online})
     return robots
 
 
-def execute_robot_actions(
-    robots: Dict[int, RobotAction], row: Dict[str, str], stop_event: threading.Event
-) -> None:
-    """Execute robot actions from a row of spreadsheet data."""
-    try:
-        time_value = row["Time"]
-        logger.info(f"Executing actions with time value: {time_value}")
-
-        # Create threads for all robots with actions
-        threads = []
-        for robot_id, robot in robots.items():
-            action_key = f"Robot_{robot_id}"
-            action = row.get(action_key)
-
-            if action:
-                logger.info(f"Robot {robot_id} will perform: {action}")
-                t = threading.Thread(target=robot.run_action, args=(action, stop_event))
-                threads.append(t)
-
-        # Start all threads
-        for thread in threads:
-            thread.start()
-
-        logger.info(f"Waiting for {time_value} seconds")
-        # Wait for all threads to complete
-        for thread in threads:
-            while thread.is_alive():
-                thread.join(timeout=0.1)
-                if stop_event.is_set():
-                    logger.info("Stop event set, breaking join loop.")
-                    break
-        logger.info("All robot actions completed successfully.")                    
-
-    except (KeyError, ValueError, TypeError) as e:
-        logger.error(f"Error executing robot actions: {e}")
-    except KeyboardInterrupt:
-        logger.info("Execution interrupted by user (Ctrl+C)")
-        stop_event.set()
-        raise
+def log_connection_stats(robots: Mapping[int, Union[RobotAction, AsyncRobotAction]]) -> None:
+    """Log how well each robot's keep-alive connection was reused, and its retry counters."""
+    for robot_id, robot in robots.items():
+        stats = robot.connection_stats()
+        retries = robot.retry_stats.as_dict()
+        logger.info(
+            f"Robot {robot_id} connections: {stats['opened']} opened, {stats['reused']} reused; "
+            f"{retries['requests']} commands, {retries['timeouts']} timeouts, "
+            f"{retries['retries']} retries, {retries['late_starts']} late starts, "
+            f"{retries['abandoned']} abandoned, timeout {robot.request_timeout * 1000:.0f} ms"
+        )
 
 
 def get_song_files(song_folder: str):
@@ -80,35 +90,540 @@ def get_song_files(song_folder: str):
     return [f for f in os.listdir(song_folder) if f.lower().endswith(".mp4")]
 
 
-def process_song(song_file_path: str, song: str, stop_event: threading.Event):
-    """Process a single song: load spreadsheet, compile actions, and coordinate robots."""
-    spreadsheet_loader = SpreadsheetLoader(song)
+def initialize_async_robots(
+    action_name_to_time: Dict, action_name_to_repeat_time: Dict
+) -> Dict[int, AsyncRobotAction]:
+    """Create asyncio robot clients; their connections are opened by the dispatcher."""
+    return {
+        idx + 1: AsyncRobotAction(
+            ip_address, action_name_to_time, action_name_to_repeat_time, "robot_" + str(idx + 1)
+        )
+        for idx, ip_address in enumerate(ROBOT_IPS)
+    }
+
+
+@dataclass
+class PreparedSong:
+    """A song that has been loaded, compiled and validated ahead of its turn."""
+
+    song: str
+    song_file_path: str
+    timeline: Timeline
+    action_name_to_time: Mapping[str, float]
+    action_name_to_repeat_time: Mapping[str, int]
+    action_name_to_code: Mapping[str, int] = field(default_factory=dict)
+
+
+def preparation_errors(from_plans: bool) -> Tuple[Type[Exception], ...]:
+    """Errors that make one song fail to prepare; the song is skipped and the show goes on."""
+    errors: Tuple[Type[Exception], ...] = (KeyError, ValueError, TypeError, OSError)
+    if from_plans:
+        return errors
+    # Imported here so that shows played from compiled plans never load jinja2
+    from jinja2 import TemplateError
+
+    return errors + (TemplateError,)
+
+
+def plan_path(plan_dir: str, song: str) -> str:
+    """Return where the compiled show plan of a song is stored."""
+    return os.path.join(plan_dir, song + PLAN_EXTENSION)
+
+
+def prepare_song(
+    song_file_path: str,
+    song: str,
+    cache: Optional[SpreadsheetCache] = None,
+    plan_dir: Optional[str] = None,
+    workbook: Optional[SpreadsheetWorkbook] = None,
+) -> PreparedSong:
+    """
+    Load the spreadsheets for a song and compile and validate its actions.
+
+    With a plan_dir the song is loaded from its compiled show plan instead,
+    without touching the network. With a workbook, its sheets are used
+    instead of fetching the song's sheet.
+    """
+    if plan_dir is not None:
+        plan = ShowPlan.load(plan_path(plan_dir, song))
+        return PreparedSong(song, song_file_path, plan.to_timeline(), *plan.action_tables())
+
+    # Imported here so that shows played from compiled plans never load jinja2
+    from action_compiler import ActionCompiler
+
+    spreadsheet_loader = SpreadsheetLoader(song, cache, workbook=workbook)
     action_compiler = ActionCompiler(spreadsheet_loader)
-    robot_actions = action_compiler.compile_actions()
-    action_name_to_time = spreadsheet_loader.get_action_name_to_time()
-    action_name_to_repeat_time = spreadsheet_loader.get_action_name_to_repeat_time()
-    robots = initialize_robots(action_name_to_time, action_name_to_repeat_time)
-
-    # Play the song before starting robot actions
-    play_song(song_file_path)
-    for row in robot_actions:
-        logger.info(f"Processing row: {row}")
+    rows = action_compiler.compile_show()
+    timeline = compile_timeline(rows, list(range(1, len(ROBOT_IPS) + 1)))
+    # The catalog's tables are shared read-only with the robots, not copied per song
+    catalog = spreadsheet_loader.get_action_catalog()
+    return PreparedSong(
+        song,
+        song_file_path,
+        timeline,
+        catalog.durations,
+        catalog.repeats,
+        catalog.codes,
+    )
+
+
+def build_plan(prepared: PreparedSong) -> ShowPlan:
+    """Turn a prepared song into its compiled show plan."""
+    return ShowPlan.from_timeline(
+        prepared.song,
+        prepared.timeline,
+        prepared.action_name_to_time,
+        prepared.action_name_to_repeat_time,
+        prepared.action_name_to_code,
+    )
+
+
+def compile_plans(
+    song_folder: str,
+    plan_dir: str,
+    cache: SpreadsheetCache,
+    workbook: Optional[SpreadsheetWorkbook] = None,
+) -> None:
+    """Compile every song in the song folder into a show plan file."""
+    os.makedirs(plan_dir, exist_ok=True)
+    errors = preparation_errors(False)
+    for song_file in get_song_files(song_folder):
+        song = os.path.splitext(song_file)[0]
         try:
-            execute_robot_actions(robots, row, stop_event)
-            if stop_event.is_set():
-                logger.info("Stop event detected in main loop. Exiting...")
-                return
+            prepared = prepare_song(
+                os.path.join(song_folder, song_file), song, cache, workbook=workbook
+            )
+        except errors as e:
+            logger.error(f"Failed to compile show plan for '{song}': {e}")
+            continue
+        plan = build_plan(prepared)
+        plan.save(plan_path(plan_dir, song))
+        logger.info(f"Compiled show plan for '{song}' to {plan_path(plan_dir, song)}")
+
+
+def _report_preparation(song: str, future: Future) -> None:
+    """Surface the outcome of a background preparation as soon as it is known."""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Failed to prepare song '{song}': {error}")
+    else:
+        logger.info(f"Song '{song}' is ready: {len(future.result().timeline.row_offsets)} rows")
+
+
+def submit_preparation(
+    executor: ThreadPoolExecutor,
+    song_folder: str,
+    song_file: str,
+    cache: Optional[SpreadsheetCache],
+    plan_dir: Optional[str] = None,
+    workbook: Optional[SpreadsheetWorkbook] = None,
+) -> Future:
+    """Prepare a song in the background while the current one is playing."""
+    song = os.path.splitext(song_file)[0]
+    future = executor.submit(
+        prepare_song, os.path.join(song_folder, song_file), song, cache, plan_dir, workbook
+    )
+    future.add_done_callback(partial(_report_preparation, song))
+    return future
+
+
+def process_song(
+    prepared: PreparedSong,
+    stop_event: threading.Event,
+    engine: str = "thread",
+    robots: Optional[Dict[int, RobotAction]] = None,
+    trace_dir: Optional[str] = None,
+    player: Optional[MediaPlayer] = None,
+):
+    """Play a prepared song and coordinate the robots to it."""
+    trace = ShowTrace(prepared.song) if trace_dir else None
+    player = player or SystemPlayer()
+    if engine == "asyncio":
+        async_robots = initialize_async_robots(
+            prepared.action_name_to_time, prepared.action_name_to_repeat_time
+        )
+        # The dispatcher starts the song once the fleet is warmed up and calibrated
+        dispatcher = AsyncDispatcher(
+            async_robots,
+            prepared.timeline,
+            stop_event,
+            trace=trace,
+            player=player,
+            song_file_path=prepared.song_file_path,
+        )
+        try:
+            dispatcher.run()
         except KeyboardInterrupt:
             logger.info("Main loop interrupted by user (Ctrl+C). Exiting...")
             stop_event.set()
             return
-    stop_song()
+        finally:
+            if dispatcher.clock is not None:
+                dispatcher.clock.stop()
+            log_connection_stats(async_robots)
+            export_trace(trace, trace_dir)
+        if stop_event.is_set():
+            logger.info("Stop event detected in main loop. Exiting...")
+            return
+        player.stop()
+        return
+
+    if robots is None:
+        robots = initialize_robots()
+    for robot in robots.values():
+        robot.set_actions(prepared.action_name_to_time, prepared.action_name_to_repeat_time)
+
+    # The scheduler starts the song once the robot workers are running
+    scheduler = TimelineScheduler(
+        robots,
+        prepared.timeline,
+        stop_event,
+        trace=trace,
+        player=player,
+        song_file_path=prepared.song_file_path,
+    )
+    try:
+        scheduler.run()
+        if stop_event.is_set():
+            logger.info("Stop event detected in main loop. Exiting...")
+            stop_fleet(robots, player)
+            return
+    except KeyboardInterrupt:
+        logger.info("Main loop interrupted by user (Ctrl+C). Exiting...")
+        stop_event.set()
+        stop_fleet(robots, player)
+        return
+    finally:
+        if scheduler.clock is not None:
+            scheduler.clock.stop()
+        log_connection_stats(robots)
+        export_trace(trace, trace_dir)
+    player.stop()
+
+
+def export_trace(trace: Optional[ShowTrace], trace_dir: Optional[str]) -> None:
+    """Write a song's execution trace, if one was recorded."""
+    if trace is None or not trace.records:
+        return
+    try:
+        paths = trace.export(trace_dir)
+    except OSError as e:
+        logger.error(f"Failed to write trace for {trace.song}: {e}")
+        return
+    logger.info(f"Trace of {trace.song} written to {', '.join(paths)}")
+
+
+def load_workbook(
+    args: argparse.Namespace, song_folder: str, cache: SpreadsheetCache
+) -> Optional[SpreadsheetWorkbook]:
+    """Download every song's sheet at once for --workbook; None to fetch them song by song."""
+    try:
+        workbook = SpreadsheetWorkbook(cache, args.workbook or None, args.action_details)
+    except (ValueError, OSError) as e:
+        logger.error(f"Failed to load the workbook, fetching song sheets one by one: {e}")
+        return None
+    songs = [os.path.splitext(f)[0] for f in get_song_files(song_folder)]
+    missing = workbook.missing(songs)
+    if missing:
+        logger.warning(f"No sheet in the workbook for {missing}, they are fetched on their own")
+    return workbook
+
+
+def export_telemetry(telemetry: TelemetryCollector, trace_dir: Optional[str]) -> None:
+    """Log the last telemetry of every robot and write all samples next to the traces."""
+    logger.info("Robot telemetry\n" + telemetry.format_status())
+    if trace_dir is None:
+        return
+    path = os.path.join(trace_dir, "telemetry.csv")
+    try:
+        os.makedirs(trace_dir, exist_ok=True)
+        telemetry.export_csv(path)
+    except OSError as e:
+        logger.error(f"Failed to write telemetry: {e}")
+        return
+    logger.info(f"Telemetry written to {path}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Coordinate a group of robots to music.")
+    parser.add_argument(
+        "--engine",
+        choices=["thread", "asyncio"],
+        default="thread",
+        help="dispatch engine: one thread per robot, or a single asyncio event loop",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="run entirely from the local spreadsheet cache without network access",
+    )
+    parser.add_argument(
+        "--compile-plans",
+        action="store_true",
+        help="compile every song into a show plan file and exit",
+    )
+    parser.add_argument(
+        "--from-plans",
+        action="store_true",
+        help="perform from compiled show plan files, without network access",
+    )
+    parser.add_argument(
+        "--plan-dir",
+        default=os.path.join(os.path.dirname(__file__), SHOW_PLAN_DIR),
+        help="directory of the compiled show plan files",
+    )
+    parser.add_argument(
+        "--player",
+        choices=sorted(PLAYERS),
+        default="vlc",
+        help="song player: VLC with a playback clock the robots follow, the system "
+        "default player without one, or a silent fake clock for dry runs",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="coordinate this many show_cluster.py workers instead of driving the robots here",
+    )
+    parser.add_argument(
+        "--cluster-host",
+        default=CLUSTER_HOST,
+        help="address the coordinator listens on; use 0.0.0.0 for workers on other machines",
+    )
+    parser.add_argument(
+        "--cluster-port", type=int, default=CLUSTER_PORT, help="port the coordinator listens on"
+    )
+    parser.add_argument(
+        "--trace-dir",
+        default=None,
+        help="write a scheduled vs. actual timing trace of every song into this directory",
+    )
+    parser.add_argument(
+        "--rehearse",
+        metavar="SONG",
+        default=None,
+        help="rehearse one song, replaying it whenever its sheet is edited",
+    )
+    parser.add_argument(
+        "--from-row", type=int, default=None, help="rehearsal: start every take from this row"
+    )
+    parser.add_argument(
+        "--from-time",
+        type=float,
+        default=None,
+        help="rehearsal: start every take from this song position in seconds",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=REHEARSAL_POLL_INTERVAL,
+        help="rehearsal: seconds between checks of the sheet for edits",
+    )
+    parser.add_argument(
+        "--jump-to-edits",
+        action="store_true",
+        help="rehearsal: start the next take from the first edited row",
+    )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="play every song on a virtual clock against simulated robots and report its "
+        "timing; exits with status 1 if a song fails to prepare or overruns",
+    )
+    parser.add_argument(
+        "--sim-latency", type=float, default=0.0, help="simulation: round-trip time in ms"
+    )
+    parser.add_argument(
+        "--sim-jitter", type=float, default=0.0, help="simulation: maximum extra round-trip ms"
+    )
+    parser.add_argument(
+        "--sim-loss", type=float, default=0.0, help="simulation: fraction of lost requests"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="simulation: seed for jitter and loss"
+    )
+    parser.add_argument(
+        "--log-queue",
+        action="store_true",
+        help="format and write log records on a background thread, and rate-limit each "
+        "robot's messages, to keep logging off the dispatch threads (off by default: no "
+        "measured jitter gain, see README)",
+    )
+    parser.add_argument(
+        "--workbook",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="SOURCE",
+        help="load every song's sheet from one xlsx download of the action sequence "
+        "spreadsheet, or from this URL or local xlsx file",
+    )
+    parser.add_argument(
+        "--action-details",
+        default=None,
+        metavar="SOURCE",
+        help="with --workbook, URL or local CSV file of the action details",
+    )
+    parser.add_argument(
+        "--telemetry",
+        action="store_true",
+        help="sample robot state between commands (thread engine); with --trace-dir the "
+        "samples are written to telemetry.csv",
+    )
+    return parser.parse_args()
+
+
+def simulate_show(
+    args: argparse.Namespace,
+    song_folder: str,
+    cache: SpreadsheetCache,
+    plan_dir: Optional[str],
+    workbook: Optional[SpreadsheetWorkbook] = None,
+) -> bool:
+    """
+    Prepare every song and play it on a virtual clock instead of real robots.
+
+    Returns:
+        True if every song was prepared and played without overruns
+    """
+    rng = random.Random(args.seed)
+    robots = {
+        idx + 1: SimulatedRobot(
+            idx + 1, args.sim_latency / 1000, args.sim_jitter / 1000, args.sim_loss, rng=rng
+        )
+        for idx in range(len(ROBOT_IPS))
+    }
+    simulator = ShowSimulator(robots)
+    song_files = get_song_files(song_folder)
+    if not song_files:
+        logger.error(f"No .mp4 files found in {song_folder}")
+        return False
+    ok = True
+    errors = preparation_errors(plan_dir is not None)
+    for song_file in song_files:
+        song = os.path.splitext(song_file)[0]
+        try:
+            prepared = prepare_song(
+                os.path.join(song_folder, song_file), song, cache, plan_dir, workbook
+            )
+        except errors as e:
+            logger.error(f"Failed to prepare song '{song}': {e}")
+            ok = False
+            continue
+        trace = ShowTrace(song) if args.trace_dir else None
+        started = time.perf_counter()
+        report = simulator.run(song, prepared.timeline, prepared.action_name_to_time, trace)
+        report.log_summary(logger)
+        logger.info(f"Simulated '{song}' in {(time.perf_counter() - started) * 1000:.0f} ms")
+        export_trace(trace, args.trace_dir)
+        ok = ok and report.ok
+    return ok
+
+
+def rehearse(
+    args: argparse.Namespace,
+    song_folder: str,
+    robots: Dict[int, RobotAction],
+    player: MediaPlayer,
+    cache: SpreadsheetCache,
+    stop_event: threading.Event,
+) -> None:
+    """Rehearse the song given with --rehearse until interrupted."""
+    song_files = [
+        f for f in get_song_files(song_folder) if os.path.splitext(f)[0] == args.rehearse
+    ]
+    if not song_files:
+        logger.error(f"No .mp4 file for '{args.rehearse}' in {song_folder}")
+        return
+    rehearsal = Rehearsal(
+        args.rehearse,
+        os.path.join(song_folder, song_files[0]),
+        robots,
+        player,
+        cache,
+        poll_interval=args.poll,
+        start_row=args.from_row,
+        start_time=args.from_time,
+        jump_to_edits=args.jump_to_edits,
+    )
+    try:
+        rehearsal.run(stop_event)
+    except KeyboardInterrupt:
+        logger.info("Rehearsal interrupted by user (Ctrl+C). Exiting...")
+        stop_event.set()
+        stop_fleet(robots, player)
 
 
 def main() -> None:
     """Main function to load spreadsheet and coordinate robot actions."""
+    args = parse_args()
+    if args.log_queue:
+        with QueuedLogging():
+            run(args)
+    else:
+        run(args)
+
+
+def run(args: argparse.Namespace) -> None:
+    """Run the show, a rehearsal, a simulation or the plan compiler, as selected by args."""
     song_folder = os.path.join(os.path.dirname(__file__), "song")
     stop_event = threading.Event()
+    cache = SpreadsheetCache(
+        os.path.join(os.path.dirname(__file__), SPREADSHEET_CACHE_DIR),
+        ttl=SPREADSHEET_CACHE_TTL,
+        max_bytes=SPREADSHEET_CACHE_MAX_BYTES,
+        offline=args.offline,
+    )
+    plan_dir = args.plan_dir if args.from_plans else None
+    workbook = None
+    if args.workbook is not None and plan_dir is None and not args.rehearse:
+        workbook = load_workbook(args, song_folder, cache)
+    if args.compile_plans:
+        compile_plans(song_folder, args.plan_dir, cache, workbook)
+        return
+    if args.simulate:
+        if not simulate_show(args, song_folder, cache, plan_dir, workbook):
+            sys.exit(1)
+        return
+
+    # Robots keep their warm connections across songs
+    player = PLAYERS[args.player]()
+    if args.rehearse:
+        # Rehearsals always use the thread engine on this host
+        robots = initialize_robots()
+        try:
+            rehearse(args, song_folder, robots, player, cache, stop_event)
+        finally:
+            for robot in robots.values():
+                robot.close()
+        return
+    coordinator = None
+    if args.workers:
+        token = cluster_token()
+        if token is None:
+            logger.error(f"Set {CLUSTER_TOKEN_ENV} to a shared token for the workers, exiting.")
+            return
+        # The workers own the robots; this process only plays the audio
+        coordinator = ShowCoordinator(
+            args.workers, token, host=args.cluster_host, port=args.cluster_port, player=player
+        )
+        if not coordinator.accept_workers():
+            logger.error("No workers connected, exiting.")
+            coordinator.close()
+            return
+    robots = initialize_robots() if args.engine == "thread" and coordinator is None else {}
+    monitor = FleetMonitor(robots)
+    monitor.start()
+    telemetry = None
+    if args.telemetry:
+        if robots:
+            telemetry = TelemetryCollector(robots)
+            telemetry.start()
+        else:
+            logger.warning("--telemetry needs the thread engine with local robots, ignored")
+    preparer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prepare")
     try:
         # Load the spreadsheet data
         song_files = get_song_files(song_folder)
@@ -116,19 +631,39 @@ def main() -> None:
             logger.error(f"No .mp4 files found in {song_folder}")
             return
 
-        for song_file in song_files:
+        errors = preparation_errors(plan_dir is not None)
+        upcoming = submit_preparation(
+            preparer, song_folder, song_files[0], cache, plan_dir, workbook
+        )
+        for idx in range(len(song_files)):
             if stop_event.is_set():
                 logger.info(
                     "Stop event detected before playing next song. Exiting loop."
                 )
                 break
 
-            song = os.path.splitext(song_file)[0]
-            song_file_path = os.path.join(song_folder, song_file)
+            current = upcoming
+            if idx + 1 < len(song_files):
+                upcoming = submit_preparation(
+                    preparer, song_folder, song_files[idx + 1], cache, plan_dir, workbook
+                )
+            try:
+                prepared = current.result()
+            except errors:
+                # Already reported when the preparation failed
+                logger.error(f"Skipping song: {song_files[idx]}")
+                continue
 
-            logger.info(f"Current song: {song_file_path}")
-            process_song(song_file_path, song, stop_event)
-            time.sleep(3)
+            if idx > 0 and robots:
+                monitor.probe()
+            logger.info(f"Current song: {prepared.song_file_path}")
+            if coordinator is not None:
+                coordinator.play(
+                    prepared.song, prepared.song_file_path, build_plan(prepared), stop_event
+                )
+            else:
+                process_song(prepared, stop_event, args.engine, robots, args.trace_dir, player)
+            stop_event.wait(SONG_GAP_SECONDS)
 
     except (KeyError, ValueError, TypeError) as e:
         logger.error(f"An error occurred in the main program: {e}")
@@ -136,6 +671,16 @@ def main() -> None:
         logger.info("Program interrupted by user (Ctrl+C). Exiting...")
         stop_event.set()
         return
+    finally:
+        preparer.shutdown(wait=False, cancel_futures=True)
+        monitor.stop()
+        if telemetry is not None:
+            telemetry.stop()
+            export_telemetry(telemetry, args.trace_dir)
+        if coordinator is not None:
+            coordinator.close()
+        for robot in robots.values():
+            robot.close()
 
 
 if __name__ == "__main__":
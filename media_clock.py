@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+from typing import Optional, Tuple
+
+from constant import MEDIA_CLOCK_POLL_INTERVAL
+from song_player import MediaPlayer
+
+logger = logging.getLogger(__name__)
+
+# Re-syncs smaller than this are logged at debug level only
+RESYNC_LOG_THRESHOLD = 0.02
+
+
+class MediaClock:
+    """
+    Tracks when, in time.monotonic() terms, the playing song started.
+
+    A background thread polls the player's position. Each sample bounds the
+    song's origin to an interval (request round trip plus the player's
+    position resolution); intersecting the intervals narrows the estimate
+    down to the poll interval even when the player only reports whole
+    seconds. A sample that doesn't fit the interval means playback stalled or
+    jumped, and the estimate is re-synced to that sample.
+
+    When playback is planned ahead, the clock reports the planned origin
+    until the first position arrives, so the robots can send the first row
+    before the audio starts. The delay from play() to the first position is
+    kept as the player's startup latency, to plan the next song.
+    """
+
+    def __init__(
+        self,
+        player: MediaPlayer,
+        poll_interval: float = MEDIA_CLOCK_POLL_INTERVAL,
+        origin: Optional[float] = None,
+    ):
+        """
+        Initialize the clock.
+
+        Args:
+            player: Player whose position is followed
+            poll_interval: Seconds between position polls
+            origin: Planned origin when playback is scheduled ahead with start_playback's `at`
+        """
+        self.player = player
+        self.poll_interval = poll_interval
+        self.origin = origin
+        self.planned_origin = origin
+        self.first_origin: Optional[float] = None
+        self.play_time: Optional[float] = None
+        self.start_position = 0.0
+        self.resyncs = 0
+        self.max_correction = 0.0
+        self._bounds = (float("-inf"), float("inf"))
+        self._idle_since: Optional[float] = None
+        self._started = threading.Event()
+        if origin is not None:
+            self._started.set()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, start_position: float = 0.0) -> None:
+        """
+        Start polling; call it right before the player is told to play.
+
+        Args:
+            start_position: Song position the player was asked to start from
+        """
+        self.play_time = time.monotonic()
+        self.start_position = start_position
+        self._thread = threading.Thread(target=self._poll, name="media-clock", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def wait_for_start(self, stop_event: threading.Event, timeout: float) -> Optional[float]:
+        """
+        Block until the audio has actually started, or return the planned origin.
+
+        Returns:
+            The song's origin, or None on timeout, when stop_event is set or
+            when the player turned out not to report its position
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            # Returns as soon as the first position arrives; the slices only
+            # bound how long it takes to notice a stop
+            if self._started.wait(min(max(0.0, remaining), self.poll_interval)):
+                return self.origin
+            if not self.player.has_clock or stop_event.is_set() or remaining <= 0:
+                return None
+
+    def position(self) -> Optional[float]:
+        """Current playback position in seconds according to the estimate."""
+        return time.monotonic() - self.origin if self.origin is not None else None
+
+    def log_summary(self, log: logging.Logger) -> None:
+        if self.first_origin is None or self.play_time is None:
+            if self.planned_origin is not None and self.player.has_clock:
+                log.warning("No playback position from the player, followed the planned start")
+            return
+        planned = ""
+        if self.planned_origin is not None:
+            planned = f" ({(self.first_origin - self.planned_origin) * 1000:+.0f} ms from the plan)"
+        log.info(
+            f"Audio started "
+            f"{(self.first_origin + self.start_position - self.play_time) * 1000:.0f} ms after play"
+            f"{planned}, drifted {(self.origin - self.first_origin) * 1000:+.1f} ms during the song, "
+            f"{self.resyncs} re-sync(s), largest correction {self.max_correction * 1000:.1f} ms"
+        )
+
+    def _poll(self) -> None:
+        while not self._stopped.is_set():
+            self._sample()
+            self._stopped.wait(self.poll_interval)
+
+    def _sample(self) -> None:
+        before = time.monotonic()
+        position = self.player.position()
+        after = time.monotonic()
+        if position is None:
+            if self.first_origin is None:
+                self._idle_since = before
+            return
+
+        # The player was at [position, position + resolution) at some instant between the two reads
+        low = before - position - self.player.resolution
+        high = after - position
+        if self.first_origin is None and self._idle_since is not None:
+            # Playback began, at start_position, after the last sample that saw it stopped
+            low = max(low, self._idle_since - self.start_position)
+        current_low, current_high = self._bounds
+        if max(low, current_low) <= min(high, current_high):
+            self._bounds = (max(low, current_low), min(high, current_high))
+        else:
+            self._bounds = (low, high)
+            self.resyncs += 1
+        origin = (self._bounds[0] + self._bounds[1]) / 2.0
+        if self.first_origin is not None:
+            correction = origin - self.origin
+            self.max_correction = max(self.max_correction, abs(correction))
+            if abs(correction) >= RESYNC_LOG_THRESHOLD:
+                logger.info(f"Audio clock moved by {correction * 1000:+.1f} ms, robots re-synced")
+        else:
+            self.first_origin = origin
+            if self.play_time is not None:
+                self.player.startup_latency = max(
+                    0.0, origin + self.start_position - self.play_time
+                )
+        self.origin = origin
+        self._started.set()
+
+
+def plan_playback(
+    player: MediaPlayer, lead: float, start: float = 0.0
+) -> Tuple[float, Optional[MediaClock]]:
+    """
+    Plan when a song starts, so the robots can be started before it.
+
+    Args:
+        player: Player of the song
+        lead: Shortest time from now until the audio starts
+        start: Song position playback starts from
+
+    Returns:
+        When the audio is to start, at least the player's startup latency from
+        now, and a clock that already reports the planned origin if the
+        player reports its position; pass both to start_playback
+    """
+    at = time.monotonic() + max(lead, player.startup_latency)
+    clock = MediaClock(player, origin=at - start) if player.has_clock else None
+    return at, clock
+
+
+def start_playback(
+    player: MediaPlayer,
+    song_file_path: str,
+    start: float = 0.0,
+    clock: Optional[MediaClock] = None,
+    at: Optional[float] = None,
+    stop_event: Optional[threading.Event] = None,
+) -> Optional[MediaClock]:
+    """
+    Start the song, and a clock that follows it if the player reports its position.
+
+    Args:
+        player: Player of the song
+        song_file_path: Song to play
+        start: Song position to start from
+        clock: Clock from plan_playback, used instead of a new one
+        at: Planned start from plan_playback; the player is told to play its
+            startup latency before, and right away without a plan
+        stop_event: Ends the wait for the planned start; the song is then not played
+
+    Returns:
+        The song's clock, None if the player doesn't report its position
+    """
+    if clock is None and player.has_clock:
+        clock = MediaClock(player)
+    if at is not None:
+        wait = at - player.startup_latency - time.monotonic()
+        if wait > 0:
+            if stop_event is None:
+                time.sleep(wait)
+            elif stop_event.wait(wait):
+                return clock
+    if clock is not None:
+        clock.start(start)
+    player.play(song_file_path, start)
+    return clock
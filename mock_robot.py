@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# How long a "lost" request keeps its connection open without an answer
+LOST_REQUEST_HOLD = 2.0
+# Battery voltage a mock robot reports when fully charged, in millivolts
+BATTERY_VOLTAGE = 7400
+
+
+class MockRobot:
+    """
+    A stand-in for one robot's JSON-RPC server.
+
+    Answers RunAction, StopBusServo and any other method, and records when
+    each request arrived so benchmarks can measure dispatch skew.
+    GetBatteryVoltage reports a battery that drains a millivolt per action,
+    so telemetry has data to show. Network conditions are simulated per
+    request: half the latency plus a random share of the jitter on the way
+    in and again on the way out, and a `loss` fraction of requests that are
+    never answered.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        rng: Optional[random.Random] = None,
+    ):
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng or random.Random()
+        self.arrivals: List[Dict[str, Any]] = []
+        self.battery = BATTERY_VOLTAGE
+
+    def _one_way_delay(self) -> float:
+        return self.latency / 2.0 + self.rng.uniform(0.0, self.jitter / 2.0)
+
+    def handle_rpc(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        method = request.get("method")
+        if method == "MockGetLog":
+            arrivals, self.arrivals = self.arrivals, []
+            return {"jsonrpc": "2.0", "id": request.get("id"), "result": arrivals}
+        self.arrivals.append(
+            {"time": time.monotonic(), "method": method, "params": request.get("params")}
+        )
+        data: Any = ()
+        if method == "GetBatteryVoltage":
+            data = self.battery
+        elif method == "RunAction":
+            self.battery -= 1
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": [True, data, method]}
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    if key.strip().lower() == "content-length":
+                        length = int(value.strip())
+                body = await reader.readexactly(length) if length else b"{}"
+                request = json.loads(body)
+                simulated = request.get("method") != "MockGetLog"
+                if simulated and self.loss and self.rng.random() < self.loss:
+                    # Never answer; the client gives up and reconnects
+                    await asyncio.sleep(LOST_REQUEST_HOLD)
+                    break
+                if simulated and (self.latency or self.jitter):
+                    await asyncio.sleep(self._one_way_delay())
+                reply = json.dumps(self.handle_rpc(request)).encode("utf-8")
+                if simulated and (self.latency or self.jitter):
+                    await asyncio.sleep(self._one_way_delay())
+                writer.write(
+                    (
+                        "HTTP/1.1 200 OK\r\n"
+                        "Content-Type: application/json\r\n"
+                        f"Content-Length: {len(reply)}\r\n\r\n"
+                    ).encode("latin-1")
+                    + reply
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve_fleet(
+    count: int,
+    base_port: int,
+    host: str = "127.0.0.1",
+    ready=None,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    loss: float = 0.0,
+    seed: Optional[int] = None,
+) -> None:
+    """Serve `count` mock robots on consecutive ports starting at `base_port`."""
+    rng = random.Random(seed)
+    robots = [
+        MockRobot(base_port + idx, latency, jitter, loss, random.Random(rng.random()))
+        for idx in range(count)
+    ]
+    servers = [
+        await asyncio.start_server(robot.handle_connection, host, robot.port, backlog=64)
+        for robot in robots
+    ]
+    logger.info(f"Mock fleet of {count} robots listening on {host}:{base_port}-{base_port + count - 1}")
+    if ready is not None:
+        ready.set()
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def fleet_urls(count: int, base_port: int, host: str = "127.0.0.1") -> List[str]:
+    """Return the API URLs of a mock fleet."""
+    return [f"http://{host}:{base_port + idx}" for idx in range(count)]
+
+
+def _run_fleet_process(count: int, base_port: int, host: str, ready, options) -> None:
+    try:
+        asyncio.run(serve_fleet(count, base_port, host, ready, **options))
+    except KeyboardInterrupt:
+        pass
+
+
+def start_mock_fleet(
+    count: int,
+    base_port: int,
+    host: str = "127.0.0.1",
+    timeout: float = 10.0,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    loss: float = 0.0,
+    seed: Optional[int] = None,
+) -> Optional[multiprocessing.Process]:
+    """
+    Start a mock fleet in a separate process so it doesn't share CPU time with the client.
+
+    Args:
+        count: Number of robots
+        base_port: Port of the first robot
+        host: Address to listen on
+        timeout: Seconds to wait for the fleet to come up
+        latency: Simulated round-trip time in seconds
+        jitter: Maximum extra random round-trip delay in seconds
+        loss: Fraction of requests that are never answered
+        seed: Seed for reproducible jitter and loss
+
+    Returns:
+        The running process, or None if the fleet didn't come up in time
+    """
+    ready = multiprocessing.Event()
+    options = {"latency": latency, "jitter": jitter, "loss": loss, "seed": seed}
+    process = multiprocessing.Process(
+        target=_run_fleet_process, args=(count, base_port, host, ready, options), daemon=True
+    )
+    process.start()
+    if not ready.wait(timeout):
+        process.terminate()
+        logger.error("Mock fleet failed to start")
+        return None
+    return process
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a fleet of mock JSON-RPC robots.")
+    parser.add_argument("--count", type=int, default=6, help="number of robots")
+    parser.add_argument("--base-port", type=int, default=9030, help="port of the first robot")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="round-trip time in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay in ms")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of unanswered requests")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    try:
+        asyncio.run(
+            serve_fleet(
+                args.count,
+                args.base_port,
+                args.host,
+                latency=args.latency / 1000.0,
+                jitter=args.jitter / 1000.0,
+                loss=args.loss,
+                seed=args.seed,
+            )
+        )
+    except KeyboardInterrupt:
+        logger.info("Mock fleet stopped.")
+
+
+if __name__ == "__main__":
+    main()
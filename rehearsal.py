@@ -0,0 +1,247 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from action import RobotAction
+from constant import REHEARSAL_POLL_INTERVAL
+from scheduler import Timeline, TimelineScheduler, compile_timeline
+from show_ir import Diagnostic, ShowRow, parse_rows
+from song_player import MediaPlayer
+from spreadsheet_cache import SpreadsheetCache
+from spreadsheet_loader import SpreadsheetLoader
+
+logger = logging.getLogger(__name__)
+
+# How quickly a running take notices a stop request or a valid edit
+STOP_CHECK_INTERVAL = 0.1
+
+
+class IncrementalCompiler:
+    """
+    Keeps a song compiled while its sheet is being edited.
+
+    Each update diffs the sheet's rows against the rows of the last update,
+    position by position, and only renders, parses and validates the rows
+    that changed. Everything is recompiled when the action details change.
+    """
+
+    def __init__(self, song: str, robot_ids: List[int]):
+        self.song = song
+        self.robot_ids = robot_ids
+        self.raw_rows: List[Dict[str, str]] = []
+        self.rows: List[ShowRow] = []
+        self.row_diagnostics: Dict[int, List[Diagnostic]] = {}
+        self.revision: Optional[str] = None
+
+    def update(self, loader: SpreadsheetLoader) -> List[int]:
+        """
+        Bring the compiled rows up to date with a freshly loaded sheet.
+
+        Args:
+            loader: Loader holding the current sheet
+
+        Returns:
+            Row numbers that were recompiled, including rows that were removed
+        """
+        # Imported here so that shows played from compiled plans never load jinja2
+        from action_compiler import ActionCompiler
+
+        catalog = loader.get_action_catalog()
+        raw_rows = loader.get_robot_actions()
+        full = catalog.revision != self.revision
+        changed = [
+            idx
+            for idx, row in enumerate(raw_rows, start=1)
+            if full or idx > len(self.raw_rows) or row != self.raw_rows[idx - 1]
+        ]
+        removed = list(range(len(raw_rows) + 1, len(self.raw_rows) + 1))
+        if not changed and not removed:
+            return []
+
+        compiler = ActionCompiler(loader)
+        # Nothing is kept until every changed row compiled, so a failed update leaves no trace
+        rows = self.rows[: len(raw_rows)]
+        row_diagnostics = dict(self.row_diagnostics)
+        for idx in changed:
+            rendered = compiler.render_row(idx, dict(raw_rows[idx - 1]))
+            parsed, diagnostics = parse_rows(
+                [rendered], catalog.durations, catalog.repeats, catalog=catalog, first_index=idx
+            )
+            if idx <= len(rows):
+                rows[idx - 1] = parsed[0]
+            else:
+                rows.append(parsed[0])
+            row_diagnostics[idx] = diagnostics
+        for idx in removed:
+            row_diagnostics.pop(idx, None)
+
+        self.raw_rows = [dict(row) for row in raw_rows]
+        self.rows = rows
+        self.row_diagnostics = row_diagnostics
+        self.revision = catalog.revision
+        return changed + removed
+
+    @property
+    def diagnostics(self) -> List[Diagnostic]:
+        return [d for idx in sorted(self.row_diagnostics) for d in self.row_diagnostics[idx]]
+
+    def timeline(self) -> Timeline:
+        return compile_timeline(self.rows, self.robot_ids)
+
+
+class Rehearsal:
+    """
+    Rehearse one song: play it from a chosen row or time, and replay as soon as the sheet changes.
+
+    The sheet is polled every `poll_interval` seconds with conditional
+    requests, so an unchanged sheet costs two 304 responses. When rows
+    change they are recompiled on their own; if they are valid, the running
+    take is stopped and the song is played again from the start point, or
+    from the first edited row with `jump_to_edits`. Invalid edits are
+    reported and the last valid version keeps playing.
+    """
+
+    def __init__(
+        self,
+        song: str,
+        song_file_path: str,
+        robots: Dict[int, RobotAction],
+        player: MediaPlayer,
+        cache: Optional[SpreadsheetCache] = None,
+        poll_interval: float = REHEARSAL_POLL_INTERVAL,
+        start_row: Optional[int] = None,
+        start_time: Optional[float] = None,
+        jump_to_edits: bool = False,
+    ):
+        """
+        Initialize the rehearsal.
+
+        Args:
+            song: Song name, the sheet of the action sequence spreadsheet
+            song_file_path: Audio file of the song
+            robots: Robots keyed by robot number
+            player: Player for the audio
+            cache: Spreadsheet cache used for the conditional polls
+            poll_interval: Seconds between checks of the sheet
+            start_row: Row number to start every take from
+            start_time: Song position in seconds to start every take from
+            jump_to_edits: Start the next take from the first edited row
+        """
+        self.song = song
+        self.song_file_path = song_file_path
+        self.robots = robots
+        self.player = player
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.start_row = start_row
+        self.start_time = start_time
+        self.jump_to_edits = jump_to_edits
+        self.compiler = IncrementalCompiler(song, sorted(robots))
+        self._timeline: Optional[Timeline] = None
+        self._edited = threading.Event()
+        self._first_edit: Optional[int] = None
+
+    def run(self, stop_event: threading.Event) -> None:
+        """Rehearse until stop_event is set."""
+        if not self._reload():
+            logger.info("Fix the sheet to start the rehearsal.")
+        watcher = threading.Thread(
+            target=self._watch, args=(stop_event,), name="rehearsal-watch", daemon=True
+        )
+        watcher.start()
+        try:
+            while not stop_event.is_set():
+                while self._timeline is None and not stop_event.wait(self.poll_interval):
+                    pass
+                if stop_event.is_set():
+                    break
+                self._take(stop_event)
+                if stop_event.is_set():
+                    break
+                if not self._edited.is_set():
+                    logger.info("Take finished, waiting for the next edit of the sheet.")
+                    while not self._edited.wait(self.poll_interval):
+                        if stop_event.is_set():
+                            return
+                if self.jump_to_edits and self._first_edit is not None:
+                    self.start_row, self.start_time = self._first_edit, None
+        finally:
+            stop_event.set()
+            watcher.join()
+
+    def start_offset(self, timeline: Timeline) -> float:
+        """Song position the next take starts from."""
+        if self.start_row is not None:
+            row = min(max(self.start_row, 1), len(timeline.row_offsets))
+            return timeline.row_offsets[row - 1] if timeline.row_offsets else 0.0
+        return max(0.0, self.start_time or 0.0)
+
+    def _take(self, stop_event: threading.Event) -> None:
+        timeline = self._timeline
+        start = self.start_offset(timeline)
+        self._edited.clear()
+        self._first_edit = None
+        take_stop = threading.Event()
+
+        def propagate() -> None:
+            while not take_stop.is_set():
+                if stop_event.wait(STOP_CHECK_INTERVAL) or self._edited.is_set():
+                    take_stop.set()
+
+        threading.Thread(target=propagate, name="rehearsal-stop", daemon=True).start()
+        logger.info(f"Take of '{self.song}' from {start:.2f}s")
+        scheduler = TimelineScheduler(
+            self.robots,
+            timeline.starting_at(start),
+            take_stop,
+            start_offset=start,
+            player=self.player,
+            song_file_path=self.song_file_path,
+        )
+        try:
+            scheduler.run()
+        finally:
+            take_stop.set()
+            if scheduler.clock is not None:
+                scheduler.clock.stop()
+            self.player.stop()
+
+    def _watch(self, stop_event: threading.Event) -> None:
+        while not stop_event.wait(self.poll_interval):
+            changed = self._reload()
+            if changed:
+                self._first_edit = min(changed)
+                self._edited.set()
+
+    def _reload(self) -> List[int]:
+        """Poll the sheet and recompile changed rows; returns them if the result is valid."""
+        # Imported here so that shows played from compiled plans never load jinja2
+        from jinja2 import TemplateError
+
+        try:
+            loader = SpreadsheetLoader(self.song, self.cache, max_age=0)
+            changed = self.compiler.update(loader)
+        except (KeyError, ValueError, TypeError, OSError, TemplateError) as e:
+            # Keep playing the last valid version; the next edit is picked up as usual
+            logger.error(f"Failed to reload '{self.song}': {e}")
+            return []
+        if not changed:
+            return []
+        diagnostics = self.compiler.diagnostics
+        if diagnostics:
+            logger.error(
+                f"Rows {changed} changed but the sheet has {len(diagnostics)} problem(s), "
+                f"keeping the last valid version:\n" + "\n".join(d.message for d in diagnostics)
+            )
+            return []
+        try:
+            timeline = self.compiler.timeline()
+        except ValueError as e:
+            logger.error(f"Failed to compile '{self.song}': {e}")
+            return []
+        catalog = loader.get_action_catalog()
+        for robot in self.robots.values():
+            robot.set_actions(catalog.durations, catalog.repeats)
+        self._timeline = timeline
+        logger.info(f"Recompiled {len(changed)} row(s) of '{self.song}': {changed}")
+        return changed
@@ -0,0 +1,77 @@
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from constant import (
+    RETRY_BACKOFF,
+    RETRY_LATE_FRACTION,
+    RETRY_MAX_ATTEMPTS,
+    ROBOT_MAX_TIMEOUT,
+    ROBOT_MIN_TIMEOUT,
+)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    How a robot command is retried when a request is lost.
+
+    A command is only retried while it has a deadline and the retry can
+    still reach the robot before it; a command without a deadline is sent
+    once, as before. Retransmitting RunAction after a timeout may restart an
+    action that did arrive, which is preferred to skipping the move.
+    """
+
+    max_attempts: int = RETRY_MAX_ATTEMPTS
+    backoff: float = RETRY_BACKOFF
+    min_timeout: float = ROBOT_MIN_TIMEOUT
+    max_timeout: float = ROBOT_MAX_TIMEOUT
+    late_fraction: float = RETRY_LATE_FRACTION
+
+    def delay(self, attempt: int) -> float:
+        """Backoff before retry number `attempt` (1-based)."""
+        return self.backoff * (2 ** (attempt - 1))
+
+    def deadline(self, due: float, duration: float, next_send: Optional[float] = None) -> float:
+        """
+        Latest time an action may still usefully reach the robot.
+
+        Args:
+            due: When the action should start on the robot
+            duration: Duration of the action
+            next_send: When the robot's next command is sent, if any
+
+        Returns:
+            A monotonic deadline
+        """
+        deadline = due + self.late_fraction * duration
+        if next_send is not None:
+            deadline = min(deadline, next_send)
+        return deadline
+
+
+class RetryStats:
+    """Per-robot retry counters, for tuning timeouts to the venue network."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.late_starts = 0
+        self.abandoned = 0
+
+    def count(self, **increments: int) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "timeouts": self.timeouts,
+                "retries": self.retries,
+                "late_starts": self.late_starts,
+                "abandoned": self.abandoned,
+            }
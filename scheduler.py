@@ -0,0 +1,381 @@
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional
+
+from action import RobotAction
+from constant import MEDIA_START_TIMEOUT, RECALIBRATION_INTERVAL
+from media_clock import MediaClock, plan_playback, start_playback
+from show_ir import ShowRow
+from show_trace import ShowTrace
+from song_player import MediaPlayer
+from time_source import WALL_CLOCK, WallClock
+
+# A robot is only re-measured when its next command is further away than the ping timeout
+RECALIBRATION_MIN_GAP = 1.0
+
+
+@dataclass(frozen=True)
+class ScheduledAction:
+    """A single robot action pinned to an offset from the start of the song."""
+
+    row: int
+    offset: float
+    name: str
+    repeat: int = 1
+
+
+@dataclass
+class Timeline:
+    """Absolute schedule of a song: row start offsets and per-robot action lists."""
+
+    row_offsets: List[float]
+    duration: float
+    robot_entries: Dict[int, List[ScheduledAction]] = field(default_factory=dict)
+
+    def starting_at(self, offset: float) -> "Timeline":
+        """
+        Drop the actions before `offset`, e.g. to rehearse from the middle of a song.
+
+        Offsets stay relative to the start of the song; pass the same offset
+        as the engines' start_offset.
+        """
+        return Timeline(
+            self.row_offsets,
+            self.duration,
+            {
+                robot_id: [entry for entry in entries if entry.offset >= offset - 1e-9]
+                for robot_id, entries in self.robot_entries.items()
+            },
+        )
+
+
+def compile_timeline(rows: List[ShowRow], robot_ids: List[int]) -> Timeline:
+    """
+    Turn the per-row ``Time`` slots into offsets from the start of the song.
+
+    Each row starts when the previous row's slot ends, and each action in a
+    multi-line cell starts when the action before it is expected to finish.
+
+    Args:
+        rows: Parsed rows from ActionCompiler.compile_show
+        robot_ids: Robots to build schedules for
+
+    Returns:
+        The compiled Timeline
+
+    Raises:
+        ValueError: If a row has a missing or invalid Time value
+    """
+    row_offsets = []
+    robot_entries: Dict[int, List[ScheduledAction]] = {rid: [] for rid in robot_ids}
+    row_start = 0.0
+    for row in rows:
+        if row.time is None:
+            raise ValueError(f"Row {row.index}: invalid Time value")
+        row_offsets.append(row_start)
+        for cell in row.cells.values():
+            if cell.robot not in robot_entries:
+                continue
+            offset = row_start
+            for ref in cell.actions:
+                if not ref.known:
+                    continue
+                robot_entries[cell.robot].append(
+                    ScheduledAction(row.index, offset, ref.name, ref.repeat)
+                )
+                offset += ref.duration or 0.0
+        row_start += row.time
+    return Timeline(row_offsets, row_start, robot_entries)
+
+
+class LatenessReport:
+    """
+    Collects how late each action was dispatched relative to its send time.
+
+    When arrival estimates are recorded too, the start skew of a row is the
+    spread of the estimated arrival times of each robot's first action in it.
+    """
+
+    def __init__(self, row_count: int):
+        self._lock = threading.Lock()
+        self.row_lateness: List[List[float]] = [[] for _ in range(row_count)]
+        self.row_arrivals: List[Dict[int, float]] = [{} for _ in range(row_count)]
+        self.audio_offsets: List[float] = []
+
+    def record(
+        self,
+        row: int,
+        lateness: float,
+        robot_id: Optional[int] = None,
+        arrival: Optional[float] = None,
+        audio_offset: Optional[float] = None,
+    ) -> None:
+        with self._lock:
+            self.row_lateness[row - 1].append(lateness)
+            if robot_id is not None and arrival is not None:
+                self.row_arrivals[row - 1].setdefault(robot_id, arrival)
+            if audio_offset is not None:
+                self.audio_offsets.append(audio_offset)
+
+    def row_max(self) -> List[float]:
+        """Worst lateness per row, 0.0 for rows without dispatched actions."""
+        return [max(values) if values else 0.0 for values in self.row_lateness]
+
+    def row_skew(self) -> List[float]:
+        """Spread of estimated start times between robots per row."""
+        return [
+            max(arrivals.values()) - min(arrivals.values()) if arrivals else 0.0
+            for arrivals in self.row_arrivals
+        ]
+
+    def summary(self) -> Dict[str, float]:
+        """Song-level figures in seconds: worst lateness, worst start skew and audio offsets."""
+        worst = self.row_max()
+        offsets = self.audio_offsets
+        return {
+            "actions": float(sum(len(values) for values in self.row_lateness)),
+            "worst_lateness": max(worst, default=0.0),
+            "worst_skew": max(self.row_skew(), default=0.0),
+            "audio_offset_mean": sum(offsets) / len(offsets) if offsets else 0.0,
+            "audio_offset_worst": max(offsets, key=abs) if offsets else 0.0,
+        }
+
+    def log_summary(self, logger: logging.Logger) -> None:
+        worst = self.row_max()
+        skews = self.row_skew()
+        for idx, values in enumerate(self.row_lateness, start=1):
+            if values:
+                logger.info(
+                    f"Row {idx}: max lateness {max(values) * 1000:.1f} ms, "
+                    f"mean {sum(values) / len(values) * 1000:.1f} ms over {len(values)} actions, "
+                    f"start skew {skews[idx - 1] * 1000:.1f} ms"
+                )
+        if worst:
+            logger.info(
+                f"Timeline lateness: worst {max(worst) * 1000:.1f} ms, "
+                f"last row {worst[-1] * 1000:.1f} ms, worst start skew {max(skews) * 1000:.1f} ms"
+            )
+        if self.audio_offsets:
+            worst_offset = max(self.audio_offsets, key=abs)
+            logger.info(
+                f"Audio-to-robot offset: mean "
+                f"{sum(self.audio_offsets) / len(self.audio_offsets) * 1000:+.1f} ms, "
+                f"worst {worst_offset * 1000:+.1f} ms over {len(self.audio_offsets)} actions"
+            )
+
+
+def playback_lead(robots: Mapping[int, RobotAction], start_delay: float) -> float:
+    """Time the robots of either engine need before the audio starts for row 1 to land on the beat."""
+    return start_delay + max((robot.latency.one_way for robot in robots.values()), default=0.0)
+
+
+class TimelineScheduler:
+    """
+    Runs a song's timeline with one long-lived worker thread per robot.
+
+    Every action is fired against an absolute monotonic deadline, so spawn
+    cost and RPC latency of one action never push back the ones after it.
+    Commands are sent early by each robot's estimated one-way delay, and the
+    estimate is refreshed in idle gaps of the robot's own timeline. With a
+    media clock, deadlines are offsets from when the audio actually started.
+    Given the song, the scheduler plans its start far enough ahead that the
+    first row's commands go out before the audio starts, and starts the
+    player only once the workers are running.
+    """
+
+    def __init__(
+        self,
+        robots: Dict[int, RobotAction],
+        timeline: Timeline,
+        stop_event: threading.Event,
+        start_delay: float = 0.05,
+        recalibration_interval: Optional[float] = RECALIBRATION_INTERVAL,
+        trace: Optional[ShowTrace] = None,
+        clock: Optional[MediaClock] = None,
+        start_offset: float = 0.0,
+        player: Optional[MediaPlayer] = None,
+        song_file_path: Optional[str] = None,
+        time_source: WallClock = WALL_CLOCK,
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            robots: Robots keyed by robot number
+            timeline: Compiled timeline of the song
+            stop_event: Event that interrupts the show when set
+            start_delay: Head start given to the workers before the first deadline
+            recalibration_interval: Seconds between latency re-measurements, None to disable
+            trace: Optional trace that records the timing of every action
+            clock: Playback clock of the song; the timeline waits for the audio to
+                start and follows its position instead of the wall clock
+            start_offset: Song position the show starts from, see Timeline.starting_at
+            player: Player of the song, started by run() after the workers
+            song_file_path: Song the player plays; its playback clock then replaces `clock`
+            time_source: Clock the workers read the time and wait through
+        """
+        self.robots = robots
+        self.stop_event = stop_event
+        self.start_delay = start_delay
+        self.recalibration_interval = recalibration_interval
+        self.trace = trace
+        self.clock = clock
+        self.start_offset = start_offset
+        self.player = player
+        self.song_file_path = song_file_path
+        self.time_source = time_source
+        self.following: Optional[MediaClock] = None
+        self.timeline = timeline
+        self.report = LatenessReport(len(self.timeline.row_offsets))
+        self.start_time: Optional[float] = None
+        self.logger = logging.getLogger("TimelineScheduler")
+
+    def run(self) -> LatenessReport:
+        """Run the timeline to the end or until stop_event is set."""
+        start = self.time_source.monotonic() + self.start_delay - self.start_offset
+        play_at = None
+        if self.player is not None and self.song_file_path is not None:
+            play_at, self.clock = plan_playback(
+                self.player, playback_lead(self.robots, self.start_delay), self.start_offset
+            )
+            start = play_at - self.start_offset
+        self.following = None
+        if self.clock is not None:
+            origin = self.clock.wait_for_start(self.stop_event, MEDIA_START_TIMEOUT)
+            if origin is not None:
+                start = origin
+                self.following = self.clock
+            elif not self.stop_event.is_set():
+                self.logger.warning("No playback position from the player, following the wall clock")
+        self.start_time = start
+        if self.trace is not None:
+            self.trace.begin(start)
+        workers = [
+            threading.Thread(
+                target=self._run_robot,
+                args=(robot_id, robot, self.timeline.robot_entries.get(robot_id), start),
+                name=f"robot-{robot_id}",
+                daemon=True,
+            )
+            for robot_id, robot in self.robots.items()
+            if self.timeline.robot_entries.get(robot_id)
+        ]
+        for worker in workers:
+            worker.start()
+        if play_at is not None:
+            start_playback(
+                self.player,
+                self.song_file_path,
+                self.start_offset,
+                self.clock,
+                play_at,
+                self.stop_event,
+            )
+
+        self.logger.info(
+            f"Timeline started: {len(self.timeline.row_offsets)} rows, "
+            f"{self.timeline.duration:.1f}s, {len(workers)} robot workers"
+        )
+        end = start + self.timeline.duration
+        self.stop_event.wait(max(0.0, end - self.time_source.monotonic()))
+        for worker in workers:
+            worker.join()
+        if self.stop_event.is_set():
+            self.logger.info("Timeline interrupted by stop_event.")
+        self.report.log_summary(self.logger)
+        if self.following is not None:
+            self.following.log_summary(self.logger)
+        return self.report
+
+    def run_robot(self, robot_id: int, start: float) -> None:
+        """
+        Run one robot's part of the timeline in the calling thread.
+
+        Used by ShowSimulator, which drives the workers one at a time on a
+        virtual clock instead of starting them all with run().
+
+        Args:
+            robot_id: Robot whose actions are dispatched
+            start: Time of the timeline's zero offset on the time source
+        """
+        self.start_time = start
+        entries = self.timeline.robot_entries.get(robot_id)
+        if entries:
+            self._run_robot(robot_id, self.robots[robot_id], entries, start)
+
+    def _run_robot(
+        self,
+        robot_id: int,
+        robot: RobotAction,
+        entries: List[ScheduledAction],
+        start: float,
+    ) -> None:
+        """Fire a robot's actions early enough to arrive at their deadlines."""
+        latency = robot.latency
+        trace = self.trace
+        clock = self.following
+        wall = self.time_source
+        last_calibration = wall.monotonic()
+        for idx, entry in enumerate(entries):
+            if clock is not None:
+                start = clock.origin
+            send_at = start + entry.offset - latency.one_way
+            robot.next_send_time = send_at
+            now = wall.monotonic()
+            if (
+                self.recalibration_interval is not None
+                and send_at - now > RECALIBRATION_MIN_GAP
+                and now - last_calibration >= self.recalibration_interval
+            ):
+                robot.ping()
+                last_calibration = wall.monotonic()
+            while True:
+                remaining = send_at - wall.monotonic()
+                if remaining <= 0:
+                    break
+                if clock is None:
+                    wall.wait(self.stop_event, remaining)
+                    break
+                # Wake up every poll so a re-synced audio clock moves the deadline
+                if wall.wait(self.stop_event, min(remaining, clock.poll_interval)):
+                    break
+                send_at = clock.origin + entry.offset - latency.one_way
+                robot.next_send_time = send_at
+            woke = wall.monotonic()
+            if self.stop_event.is_set():
+                if trace is not None:
+                    trace.interrupted(robot_id, entry.row, entry.name, send_at, woke)
+                break
+            audio_offset = None
+            if clock is not None:
+                audio_offset = woke + latency.one_way - (clock.origin + entry.offset)
+            self.report.record(
+                entry.row, woke - send_at, robot_id, woke + latency.one_way, audio_offset
+            )
+            # A lost command is retried only while it can arrive usefully early,
+            # and never past the moment the robot's next command is due
+            next_send = (
+                start + entries[idx + 1].offset - latency.one_way
+                if idx + 1 < len(entries)
+                else None
+            )
+            deadline = robot.retry.deadline(
+                start + entry.offset, robot.actions.get(entry.name) or 0.0, next_send
+            )
+            dispatched = wall.monotonic()
+            result = robot.start_action(entry.name, entry.repeat, deadline, self.stop_event)
+            if trace is not None:
+                trace.action(
+                    robot_id,
+                    entry.row,
+                    entry.name,
+                    send_at,
+                    woke,
+                    dispatched,
+                    robot.last_send_time,
+                    robot.last_response_time,
+                    result is not None,
+                )
+        robot.next_send_time = None
+        self.logger.debug("Robot %s finished its timeline.", robot_id)
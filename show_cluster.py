@@ -0,0 +1,595 @@
+import argparse
+import base64
+import hmac
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from action import RobotAction
+from calibration import calibrate_robots
+from constant import (
+    CLUSTER_CONNECT_TIMEOUT,
+    CLUSTER_HELLO_TIMEOUT,
+    CLUSTER_HOST,
+    CLUSTER_PORT,
+    CLUSTER_READY_TIMEOUT,
+    CLUSTER_START_LEAD,
+    CLUSTER_TOKEN_ENV,
+    LOG_FORMAT,
+    MEDIA_CLOCK_POLL_INTERVAL,
+    ROBOT_IPS,
+)
+from emergency_stop import stop_fleet
+from fleet_health import FleetMonitor
+from media_clock import plan_playback, start_playback
+from scheduler import LatenessReport, TimelineScheduler
+from show_plan import ShowPlan
+from song_player import MediaPlayer
+
+logger = logging.getLogger(__name__)
+
+# Clock exchanges per offset measurement; the one with the shortest round trip wins
+CLOCK_SAMPLES = 5
+# A re-synced audio clock is forwarded to the workers when it moved by more than this
+SYNC_THRESHOLD = 0.001
+
+
+class Connection:
+    """Newline-delimited JSON messages over a TCP socket, safe to send from several threads."""
+
+    def __init__(self, sock: socket.socket):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self._reader = sock.makefile("rb")
+        self._lock = threading.Lock()
+
+    def send(self, message_type: str, **fields: Any) -> bool:
+        data = json.dumps({"type": message_type, **fields}).encode("utf-8") + b"\n"
+        try:
+            with self._lock:
+                self.sock.sendall(data)
+            return True
+        except OSError as e:
+            logger.error(f"Failed to send '{message_type}': {e}")
+            return False
+
+    def receive(self) -> Optional[Dict[str, Any]]:
+        """Return the next message, or None once the peer has gone."""
+        try:
+            line = self._reader.readline()
+        except OSError:
+            return None
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            logger.error(f"Dropping malformed message: {line[:80]!r}")
+            return {}
+
+    def close(self) -> None:
+        # The reader holds its own reference to the socket, so closing alone wouldn't end the
+        # connection; shutting it down does, and wakes up a thread blocked in receive()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def epoch_to_monotonic(epoch: float, offset: float = 0.0) -> float:
+    """Convert a coordinator wall-clock time into this process's monotonic clock."""
+    return epoch - offset - time.time() + time.monotonic()
+
+
+def monotonic_to_epoch(value: float, offset: float = 0.0) -> float:
+    """Convert a monotonic time of this process into coordinator wall-clock time."""
+    return value + offset + time.time() - time.monotonic()
+
+
+class RemoteClock:
+    """
+    Stands in for MediaClock on a worker: the song's origin is the common
+    start epoch sent by the coordinator, moved by its sync messages when the
+    coordinator's audio clock re-syncs.
+    """
+
+    def __init__(self, offset: float, poll_interval: float = MEDIA_CLOCK_POLL_INTERVAL):
+        self.offset = offset
+        self.poll_interval = poll_interval
+        self.origin: Optional[float] = None
+        self.first_origin: Optional[float] = None
+        self._started = threading.Event()
+
+    def set_epoch(self, epoch: float) -> None:
+        self.origin = epoch_to_monotonic(epoch, self.offset)
+        if self.first_origin is None:
+            self.first_origin = self.origin
+        self._started.set()
+
+    def wait_for_start(self, stop_event: threading.Event, timeout: float) -> Optional[float]:
+        """
+        Block until the coordinator's start message arrives.
+
+        The timeout is not applied: the coordinator owns the show's timeouts
+        and sends stop, or the connection drops, if the song doesn't start.
+        """
+        while not self._started.wait(self.poll_interval):
+            if stop_event.is_set():
+                return None
+        return self.origin
+
+    def log_summary(self, log: logging.Logger) -> None:
+        if self.origin is not None and self.first_origin is not None:
+            log.info(
+                f"Coordinator clock moved the start by "
+                f"{(self.origin - self.first_origin) * 1000:+.1f} ms"
+            )
+
+
+class ShowWorker:
+    """
+    Runs its share of the fleet for a coordinator.
+
+    The worker announces the robots it owns together with the cluster's
+    shared token, measures its wall-clock offset
+    to the coordinator, and then for each song loads the shipped show plan,
+    probes its robots, reports ready and runs the timeline against the
+    common start epoch. Its timing stats are sent back after the song.
+    """
+
+    def __init__(
+        self, coordinator: Tuple[str, int], robots: Dict[int, RobotAction], name: str, token: str
+    ):
+        self.address = coordinator
+        self.robots = robots
+        self.name = name
+        self.token = token
+        self.stop_event = threading.Event()
+        self.connection: Optional[Connection] = None
+        self.offset = 0.0
+        self._clock: Optional[RemoteClock] = None
+        self._song_thread: Optional[threading.Thread] = None
+        # Messages that arrived while waiting for a clock reply, served next
+        self._pending: Deque[Optional[Dict[str, Any]]] = deque()
+
+    def run(self) -> None:
+        """Serve songs until the coordinator says goodbye or goes away."""
+        self.connection = Connection(socket.create_connection(self.address))
+        self.connection.send("hello", name=self.name, robots=sorted(self.robots), token=self.token)
+        logger.info(
+            f"Connected to coordinator {self.address[0]}:{self.address[1]} as '{self.name}'"
+        )
+        monitor = FleetMonitor(self.robots)
+        monitor.start()
+        try:
+            self._serve()
+        except KeyboardInterrupt:
+            logger.info("Worker interrupted by user (Ctrl+C), stopping the show.")
+            self.stop_event.set()
+            self.connection.send("stop", reason=f"interrupted on {self.name}")
+            self._emergency_stop()
+        finally:
+            self.stop_event.set()
+            if self._song_thread is not None:
+                self._song_thread.join()
+            monitor.stop()
+            self.connection.close()
+
+    def _serve(self) -> None:
+        while True:
+            message = self._pending.popleft() if self._pending else self.connection.receive()
+            if message is None:
+                logger.warning("Coordinator went away, stopping.")
+                return
+            kind = message.get("type")
+            if kind == "song":
+                self._prepare(message)
+            elif kind in ("start", "sync") and self._clock is not None:
+                self._clock.set_epoch(message["epoch"])
+            elif kind == "stop":
+                logger.info("Stop received from the coordinator.")
+                self.stop_event.set()
+                # Off the receive loop, so the connection keeps being served
+                threading.Thread(
+                    target=self._emergency_stop, name="emergency-stop", daemon=True
+                ).start()
+            elif kind == "bye":
+                return
+
+    def _emergency_stop(self) -> None:
+        """Stop this worker's robots at once and report how it went to the coordinator."""
+        report = stop_fleet(self.robots)
+        self.connection.send("stopped", **report.summary())
+
+    def _measure_offset(self) -> float:
+        """Estimate coordinator wall time minus ours from the fastest of a few exchanges."""
+        best: Optional[Tuple[float, float]] = None
+        for _ in range(CLOCK_SAMPLES):
+            sent = time.time()
+            self.connection.send("clock")
+            reply = self.connection.receive()
+            # Anything else, e.g. a stop, is served once the song is set up
+            while reply is not None and reply.get("type") != "clock":
+                self._pending.append(reply)
+                reply = self.connection.receive()
+            received = time.time()
+            if reply is None:
+                self._pending.append(None)
+                break
+            rtt = received - sent
+            if best is None or rtt < best[0]:
+                best = (rtt, reply["time"] - (sent + received) / 2.0)
+        return best[1] if best is not None else 0.0
+
+    def _prepare(self, message: Dict[str, Any]) -> None:
+        if self._song_thread is not None:
+            self._song_thread.join()
+        plan = ShowPlan.from_bytes(base64.b64decode(message["plan"]))
+        action_name_to_time, action_name_to_repeat_time = plan.action_tables()
+        for robot in self.robots.values():
+            robot.set_actions(action_name_to_time, action_name_to_repeat_time)
+        online = FleetMonitor(self.robots).probe()
+        self.offset = self._measure_offset()
+        self.stop_event.clear()
+        self._clock = RemoteClock(self.offset)
+        scheduler = TimelineScheduler(
+            self.robots, plan.to_timeline(), self.stop_event, clock=self._clock
+        )
+        self._song_thread = threading.Thread(
+            target=self._perform, args=(plan.song, scheduler), name="song", daemon=True
+        )
+        self._song_thread.start()
+        self.connection.send("ready", song=plan.song, online=online)
+        logger.info(
+            f"Ready for '{plan.song}': {len(online)}/{len(self.robots)} robots online, "
+            f"clock offset {self.offset * 1000:+.1f} ms"
+        )
+
+    def _perform(self, song: str, scheduler: TimelineScheduler) -> None:
+        report = scheduler.run()
+        self.connection.send(
+            "stats",
+            song=song,
+            stopped=self.stop_event.is_set(),
+            online=sum(robot.health.online for robot in self.robots.values()),
+            row_window=self._row_window(report),
+            retries=sum(robot.retry_stats.retries for robot in self.robots.values()),
+            abandoned=sum(robot.retry_stats.abandoned for robot in self.robots.values()),
+            **report.summary(),
+        )
+
+    def _row_window(self, report: LatenessReport) -> List[Optional[List[float]]]:
+        """Earliest and latest estimated arrival per row, in coordinator wall time."""
+        window = []
+        for arrivals in report.row_arrivals:
+            if arrivals:
+                window.append(
+                    [
+                        monotonic_to_epoch(min(arrivals.values()), self.offset),
+                        monotonic_to_epoch(max(arrivals.values()), self.offset),
+                    ]
+                )
+            else:
+                window.append(None)
+        return window
+
+
+class WorkerLink:
+    """The coordinator's view of one connected worker."""
+
+    def __init__(self, connection: Connection, name: str, robots: List[int]):
+        self.connection = connection
+        self.name = name
+        self.robots = robots
+        self.connected = True
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.stats: Optional[Dict[str, Any]] = None
+
+
+class ShowCoordinator:
+    """
+    Distributes songs to workers that each own a share of the fleet.
+
+    For every song the coordinator ships each worker the compiled show plan
+    of its robots, waits until they are ready, starts the audio and sends a
+    common start epoch. While the song plays, audio clock re-syncs are
+    forwarded; a stop on either side is propagated to everyone, and the
+    workers' timing stats are collected and logged. Connections whose hello
+    doesn't carry the shared token are closed before any message is sent to
+    them or accepted from them. The token only keeps strangers out; the
+    connection itself is not encrypted.
+    """
+
+    def __init__(
+        self,
+        expected_workers: int,
+        token: str,
+        host: str = CLUSTER_HOST,
+        port: int = CLUSTER_PORT,
+        player: Optional[MediaPlayer] = None,
+    ):
+        self.expected_workers = expected_workers
+        self.token = token
+        self.host = host
+        self.port = port
+        self.player = player
+        self.workers: List[WorkerLink] = []
+        self.stop_event = threading.Event()
+        self.start_time: Optional[float] = None
+        self._closing = False
+        self._server: Optional[socket.socket] = None
+        # When the last emergency stop was sent, to time the workers' confirmations
+        self._stop_sent: Optional[float] = None
+
+    def accept_workers(self, timeout: float = CLUSTER_CONNECT_TIMEOUT) -> List[WorkerLink]:
+        """Wait until the expected number of workers has connected, or the timeout passes."""
+        self._server = socket.create_server((self.host, self.port))
+        self._server.settimeout(0.5)
+        logger.info(f"Waiting for {self.expected_workers} worker(s) on {self.host}:{self.port}")
+        deadline = time.monotonic() + timeout
+        while len(self.workers) < self.expected_workers and time.monotonic() < deadline:
+            try:
+                sock, peer = self._server.accept()
+            except socket.timeout:
+                continue
+            # A peer that never says hello must not hold up the others
+            sock.settimeout(CLUSTER_HELLO_TIMEOUT)
+            connection = Connection(sock)
+            hello = connection.receive()
+            if not hello or hello.get("type") != "hello":
+                logger.error(f"Unexpected greeting from {peer[0]}:{peer[1]}, closing")
+                connection.close()
+                continue
+            if not hmac.compare_digest(str(hello.get("token", "")).encode(), self.token.encode()):
+                logger.error(f"Rejected {peer[0]}:{peer[1]}: wrong or missing cluster token")
+                connection.close()
+                continue
+            sock.settimeout(None)
+            link = WorkerLink(connection, hello.get("name", f"{peer[0]}:{peer[1]}"), hello["robots"])
+            self.workers.append(link)
+            threading.Thread(
+                target=self._listen, args=(link,), name=f"worker-{link.name}", daemon=True
+            ).start()
+            logger.info(f"Worker '{link.name}' joined with robots {link.robots}")
+        owned = [rid for link in self.workers for rid in link.robots]
+        duplicates = sorted({rid for rid in owned if owned.count(rid) > 1})
+        if duplicates:
+            logger.warning(f"Robots {duplicates} are claimed by more than one worker")
+        return self.workers
+
+    def play(
+        self, song: str, song_file_path: str, plan: ShowPlan, stop_event: threading.Event
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Perform one song across all workers.
+
+        Args:
+            song: Song name
+            song_file_path: Audio file played by the coordinator
+            plan: Compiled show plan of the whole fleet
+            stop_event: Event that stops the show on every worker when set
+
+        Returns:
+            The stats reported by each worker, keyed by worker name
+        """
+        self.stop_event = stop_event
+        workers = [link for link in self.workers if link.connected]
+        for link in workers:
+            link.ready.clear()
+            link.done.clear()
+            link.stats = None
+            payload = base64.b64encode(plan.for_robots(link.robots).to_bytes()).decode("ascii")
+            link.connection.send("song", song=song, plan=payload)
+
+        deadline = time.monotonic() + CLUSTER_READY_TIMEOUT
+        for link in workers:
+            if not link.ready.wait(max(0.0, deadline - time.monotonic())):
+                logger.error(f"Worker '{link.name}' is not ready for '{song}', it will start late")
+
+        # The start is announced ahead, so the workers' first commands land on the beat
+        clock = None
+        origin = time.monotonic() + CLUSTER_START_LEAD
+        if self.player is not None:
+            origin, clock = plan_playback(self.player, CLUSTER_START_LEAD)
+        self.start_time = origin
+        self._broadcast(workers, "start", epoch=monotonic_to_epoch(origin))
+        if self.player is not None:
+            start_playback(self.player, song_file_path, clock=clock, at=origin, stop_event=stop_event)
+        logger.info(f"Started '{song}' on {len(workers)} worker(s)")
+
+        sent_origin = origin
+        poll = clock.poll_interval if clock is not None else MEDIA_CLOCK_POLL_INTERVAL
+        try:
+            while not all(link.done.is_set() for link in workers):
+                if stop_event.wait(poll):
+                    self.emergency_stop(workers)
+                    break
+                if clock is not None and abs(clock.origin - sent_origin) > SYNC_THRESHOLD:
+                    sent_origin = clock.origin
+                    self._broadcast(workers, "sync", epoch=monotonic_to_epoch(sent_origin))
+        except KeyboardInterrupt:
+            stop_event.set()
+            self.emergency_stop(workers)
+            raise
+        for link in workers:
+            link.done.wait(CLUSTER_READY_TIMEOUT)
+        if clock is not None:
+            clock.stop()
+            clock.log_summary(logger)
+        if self.player is not None and not stop_event.is_set():
+            self.player.stop()
+        stats = {link.name: link.stats for link in workers if link.stats is not None}
+        self.log_stats(song, stats)
+        return stats
+
+    def emergency_stop(self, workers: List[WorkerLink]) -> None:
+        """Tell every worker to stop its robots and stop the song at the same moment."""
+        self._stop_sent = time.monotonic()
+        self._broadcast(workers, "stop")
+        if self.player is not None:
+            self.player.stop()
+            logger.warning(
+                f"Song stopped {(time.monotonic() - self._stop_sent) * 1000:.1f} ms "
+                f"after the stop was sent to {len(workers)} worker(s)"
+            )
+
+    def close(self) -> None:
+        """Say goodbye to every worker and stop listening."""
+        self._closing = True
+        self._broadcast(self.workers, "bye")
+        for link in self.workers:
+            link.connection.close()
+        if self._server is not None:
+            self._server.close()
+
+    def log_stats(self, song: str, stats: Dict[str, Dict[str, Any]]) -> None:
+        lines = [
+            f"{'Worker':<16}{'Robots':>7}{'Online':>7}{'Actions':>8}"
+            f"{'Late ms':>9}{'Skew ms':>9}{'Audio ms':>9}{'Retries':>8}{'Abandoned':>10}"
+        ]
+        for link in self.workers:
+            s = stats.get(link.name)
+            if s is None:
+                lines.append(f"{link.name:<16}{len(link.robots):>7}  no stats")
+                continue
+            lines.append(
+                f"{link.name:<16}{len(link.robots):>7}{s['online']:>7}{int(s['actions']):>8}"
+                f"{s['worst_lateness'] * 1000:>9.1f}{s['worst_skew'] * 1000:>9.1f}"
+                f"{s['audio_offset_mean'] * 1000:>+9.1f}"
+                f"{s.get('retries', 0):>8}{s.get('abandoned', 0):>10}"
+            )
+        logger.info(
+            f"Cluster stats for '{song}', fleet-wide worst start skew "
+            f"{fleet_skew(stats.values()) * 1000:.1f} ms\n" + "\n".join(lines)
+        )
+
+    def _broadcast(self, workers: List[WorkerLink], message_type: str, **fields: Any) -> None:
+        for link in workers:
+            if link.connected:
+                link.connection.send(message_type, **fields)
+
+    def _listen(self, link: WorkerLink) -> None:
+        while True:
+            message = link.connection.receive()
+            if message is None:
+                if not self._closing:
+                    logger.warning(f"Worker '{link.name}' disconnected")
+                link.connected = False
+                link.ready.set()
+                link.done.set()
+                return
+            kind = message.get("type")
+            if kind == "clock":
+                link.connection.send("clock", time=time.time())
+            elif kind == "ready":
+                link.ready.set()
+            elif kind == "stats":
+                link.stats = message
+                link.done.set()
+            elif kind == "stop":
+                logger.info(f"Stop requested by worker '{link.name}': {message.get('reason', '')}")
+                self.stop_event.set()
+            elif kind == "stopped":
+                since = (
+                    f", {(time.monotonic() - self._stop_sent) * 1000:.1f} ms after the stop was sent"
+                    if self._stop_sent is not None
+                    else ""
+                )
+                logger.warning(
+                    f"Worker '{link.name}' stopped {message['confirmed']}/{message['robots']} "
+                    f"robots, slowest {message['slowest'] * 1000:.1f} ms{since}"
+                    + (f", unconfirmed {message['unconfirmed']}" if message["unconfirmed"] else "")
+                )
+
+
+def fleet_skew(stats) -> float:
+    """Worst spread of estimated start times per row across all workers' robots."""
+    windows: Dict[int, List[float]] = {}
+    for s in stats:
+        for row, window in enumerate(s.get("row_window", [])):
+            if window is None:
+                continue
+            low, high = windows.setdefault(row, [window[0], window[1]])
+            windows[row] = [min(low, window[0]), max(high, window[1])]
+    return max((high - low for low, high in windows.values()), default=0.0)
+
+
+def cluster_token() -> Optional[str]:
+    """Return the shared cluster token from the environment, None if it isn't set."""
+    return os.environ.get(CLUSTER_TOKEN_ENV) or None
+
+
+def parse_address(value: str) -> Tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    if not host or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"expected HOST:PORT, got '{value}'")
+    return host, int(port)
+
+
+def parse_robot(value: str) -> Tuple[int, str]:
+    """Parse ID or ID=URL; a bare ID takes its URL from ROBOT_IPS."""
+    robot_id, _, url = value.partition("=")
+    if not robot_id.isdigit():
+        raise argparse.ArgumentTypeError(f"expected ID or ID=URL, got '{value}'")
+    robot_id = int(robot_id)
+    if not url:
+        if not 1 <= robot_id <= len(ROBOT_IPS):
+            raise argparse.ArgumentTypeError(f"robot {robot_id} is not in ROBOT_IPS")
+        url = ROBOT_IPS[robot_id - 1]
+    return robot_id, url
+
+
+def worker_robots(robot_urls: List[Tuple[int, str]]) -> Dict[int, RobotAction]:
+    """Create the worker's robots with open sessions and a first latency calibration."""
+    robots = {}
+    for robot_id, url in robot_urls:
+        robot = RobotAction(url, {}, None, f"robot_{robot_id}")
+        robot.open_session()
+        robots[robot_id] = robot
+    online = FleetMonitor(robots).probe()
+    calibrate_robots({rid: robots[rid] for rid in online})
+    return robots
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Run a show worker that drives a share of the fleet for a coordinator "
+        "(start the coordinator with `python main.py --workers N`)."
+    )
+    parser.add_argument(
+        "--coordinator", type=parse_address, default=("127.0.0.1", CLUSTER_PORT),
+        help="coordinator address as HOST:PORT",
+    )
+    parser.add_argument(
+        "--robots", type=parse_robot, nargs="+", required=True,
+        help="robots owned by this worker, as ID (URL from ROBOT_IPS) or ID=URL",
+    )
+    parser.add_argument("--name", default=socket.gethostname(), help="worker name in the stats")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    token = cluster_token()
+    if token is None:
+        logger.error(f"Set {CLUSTER_TOKEN_ENV} to the token the coordinator was started with")
+        return
+    robots = worker_robots(args.robots)
+    try:
+        ShowWorker(args.coordinator, robots, args.name, token).run()
+    except OSError as e:
+        logger.error(f"Cannot reach coordinator {args.coordinator[0]}:{args.coordinator[1]}: {e}")
+    finally:
+        for robot in robots.values():
+            robot.close()
+
+
+if __name__ == "__main__":
+    main()
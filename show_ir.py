@@ -0,0 +1,177 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from action_catalog import ActionCatalog
+
+
+@dataclass(frozen=True)
+class ActionRef:
+    """A reference to an action from a robot cell, resolved against the action details."""
+
+    name: str
+    duration: Optional[float]
+    repeat: int = 1
+
+    @property
+    def known(self) -> bool:
+        return self.duration is not None
+
+
+@dataclass
+class RobotCell:
+    """The actions one robot performs in one row."""
+
+    key: str
+    robot: Optional[int]
+    actions: List[ActionRef]
+    total: float
+    slack: Optional[float]
+
+
+@dataclass
+class ShowRow:
+    """One row of the action sheet after parsing."""
+
+    index: int
+    time: Optional[float]
+    cells: Dict[str, RobotCell] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class Diagnostic:
+    """A problem found while parsing the action sheet."""
+
+    row: int
+    key: str
+    kind: str  # "time_format", "existence", "repeat" or "time"
+    message: str
+
+
+class CompileError(ValueError):
+    """Raised with every problem found in an action sheet, not only the first one."""
+
+    def __init__(self, diagnostics: List[Diagnostic]):
+        self.diagnostics = diagnostics
+        super().__init__(
+            f"{len(diagnostics)} problem(s) in the action sheet:\n"
+            + "\n".join(d.message for d in diagnostics)
+        )
+
+
+def robot_number(key: str) -> Optional[int]:
+    """Return the robot number of a column such as "Robot_3"."""
+    _, _, number = key.partition("_")
+    return int(number) if number.isdigit() else None
+
+
+def split_cell(value: str) -> List[str]:
+    """Split a multi-line robot cell into action names."""
+    return [a.strip() for a in value.splitlines() if a.strip()]
+
+
+def parse_rows(
+    robot_actions: List[Dict[str, str]],
+    action_name_to_time: Mapping[str, float],
+    action_name_to_repeat_time: Optional[Mapping[str, int]] = None,
+    catalog: Optional[ActionCatalog] = None,
+    first_index: int = 1,
+) -> Tuple[List[ShowRow], List[Diagnostic]]:
+    """
+    Parse every robot cell exactly once into ShowRows.
+
+    Unknown actions, invalid Time values, negative Repeat_Time values and
+    cells whose actions don't fit into their row are all reported as
+    diagnostics rather than raised.
+
+    Args:
+        robot_actions: Rows from the action sequence spreadsheet
+        action_name_to_time: Mapping of action names to execution times
+        action_name_to_repeat_time: Mapping of action names to their repeat time
+        catalog: Resolve names through this catalog instead of the two mappings,
+            matching them case-insensitively and using the catalog's spelling
+        first_index: Row number of the first row, for parsing part of a sheet
+
+    Returns:
+        The parsed rows and the list of diagnostics
+    """
+    repeats = action_name_to_repeat_time or {}
+    rows = []
+    diagnostics = []
+    for idx, action in enumerate(robot_actions, start=first_index):
+        time_val = action.get("Time")
+        try:
+            row_time = float(time_val)
+        except (TypeError, ValueError):
+            row_time = None
+            diagnostics.append(
+                Diagnostic(idx, "Time", "time_format", f"Row {idx}: Invalid Time value '{time_val}'")
+            )
+        row = ShowRow(idx, row_time)
+        for key, value in action.items():
+            if not key.startswith("Robot") or not value:
+                continue
+            refs = []
+            total = 0.0
+            for name in split_cell(value):
+                if catalog is not None:
+                    entry = catalog.lookup(name)
+                    if entry is not None and entry.duration is not None:
+                        refs.append(ActionRef(entry.name, entry.duration, entry.repeat))
+                        total += entry.duration
+                        continue
+                    act_time = None
+                else:
+                    act_time = action_name_to_time.get(name)
+                if act_time is None or act_time == "":
+                    refs.append(ActionRef(name, None, repeats.get(name, 1)))
+                    diagnostics.append(
+                        Diagnostic(
+                            idx,
+                            key,
+                            "existence",
+                            f"Row {idx}: Action '{name}' for key '{key}' not found in action_name_to_time",
+                        )
+                    )
+                    continue
+                refs.append(ActionRef(name, float(act_time), repeats.get(name, 1)))
+                total += float(act_time)
+            for ref in refs:
+                if ref.repeat < 0:
+                    diagnostics.append(
+                        Diagnostic(
+                            idx,
+                            key,
+                            "repeat",
+                            f"Row {idx}: Action '{ref.name}' for key '{key}' has negative Repeat_Time {ref.repeat}",
+                        )
+                    )
+            slack = row_time - total if row_time is not None else None
+            if slack is not None and slack < 0:
+                diagnostics.append(
+                    Diagnostic(
+                        idx,
+                        key,
+                        "time",
+                        f"Row {idx}: Sum of action times {total}s for '{key}' exceeds overall time {time_val}s",
+                    )
+                )
+            row.cells[key] = RobotCell(key, robot_number(key), refs, total, slack)
+        rows.append(row)
+    return rows, diagnostics
+
+
+def format_slack(rows: List[ShowRow]) -> str:
+    """Render the slack of every robot in every row as a text table."""
+    robots = sorted(
+        {cell.key for row in rows for cell in row.cells.values()},
+        key=lambda key: (robot_number(key) is None, robot_number(key) or 0, key),
+    )
+    lines = ["Row   Time " + " ".join(f"{key:>9}" for key in robots)]
+    for row in rows:
+        slacks = []
+        for key in robots:
+            cell = row.cells.get(key)
+            slacks.append(f"{cell.slack:>9.2f}" if cell and cell.slack is not None else f"{'-':>9}")
+        time_str = f"{row.time:>6.2f}" if row.time is not None else f"{'?':>6}"
+        lines.append(f"{row.index:<5}{time_str} " + " ".join(slacks))
+    return "\n".join(lines)
@@ -0,0 +1,250 @@
+import struct
+import sys
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from scheduler import ScheduledAction, Timeline
+
+PLAN_MAGIC = b"RGAP"
+PLAN_VERSION = 1
+PLAN_EXTENSION = ".rgap"
+
+_HEADER = struct.Struct("<4sHHIIId")
+_ACTION = struct.Struct("<IdIH")
+_TRACK = struct.Struct("<II")
+_STRING = struct.Struct("<H")
+
+
+def _typecode(candidates: str, size: int) -> str:
+    """Pick the array typecode with the given item size; C type sizes vary between platforms."""
+    for typecode in candidates:
+        if array(typecode).itemsize == size:
+            return typecode
+    raise ImportError(f"No {size}-byte array type among {candidates!r} on this platform")
+
+
+# Typecodes of the plan's arrays: 32-bit unsigned integers and 64-bit floats
+_U32 = _typecode("IL", 4)
+_F64 = _typecode("d", 8)
+
+
+@dataclass(frozen=True)
+class PlanAction:
+    """One entry of a plan's action table."""
+
+    code: int
+    name: str
+    duration: float
+    repeat: int
+
+
+@dataclass
+class RobotTrack:
+    """A robot's actions as parallel arrays of action codes, offsets and row numbers."""
+
+    codes: array = field(default_factory=lambda: array(_U32))
+    offsets: array = field(default_factory=lambda: array(_F64))
+    rows: array = field(default_factory=lambda: array(_U32))
+
+
+@dataclass
+class ShowPlan:
+    """
+    Compiled, versioned form of a song that can be performed without the spreadsheets.
+
+    Layout (little-endian): a header with magic, version, counts, duration and
+    song name; the action table; the row offsets; then one section per robot
+    holding its code, offset and row arrays.
+    """
+
+    song: str
+    duration: float
+    actions: List[PlanAction]
+    row_offsets: array
+    tracks: Dict[int, RobotTrack]
+
+    @classmethod
+    def from_timeline(
+        cls,
+        song: str,
+        timeline: Timeline,
+        action_name_to_time: Dict[str, float],
+        action_name_to_repeat_time: Dict[str, int],
+        action_name_to_code: Optional[Dict[str, int]] = None,
+    ) -> "ShowPlan":
+        """
+        Build a plan from a compiled timeline.
+
+        Actions keep their numeric Code from the action details sheet; actions
+        without a usable code get fresh codes above the highest one in use.
+        """
+        action_name_to_code = action_name_to_code or {}
+        used_names = sorted(
+            {entry.name for entries in timeline.robot_entries.values() for entry in entries}
+        )
+        codes: Dict[str, int] = {}
+        for name in used_names:
+            code = action_name_to_code.get(name)
+            if code is not None and code >= 0 and code not in codes.values():
+                codes[name] = code
+        next_code = max(codes.values(), default=-1) + 1
+        for name in used_names:
+            if name not in codes:
+                codes[name] = next_code
+                next_code += 1
+
+        actions = [
+            PlanAction(
+                codes[name],
+                name,
+                float(action_name_to_time.get(name, 0.0)),
+                int(action_name_to_repeat_time.get(name, 1)),
+            )
+            for name in used_names
+        ]
+        tracks = {}
+        for robot_id, entries in timeline.robot_entries.items():
+            track = RobotTrack()
+            for entry in entries:
+                track.codes.append(codes[entry.name])
+                track.offsets.append(entry.offset)
+                track.rows.append(entry.row)
+            tracks[robot_id] = track
+        return cls(song, timeline.duration, actions, array(_F64, timeline.row_offsets), tracks)
+
+    def to_timeline(self) -> Timeline:
+        """
+        Expand the plan into the Timeline consumed by the dispatch engines.
+
+        Raises:
+            ValueError: If a track refers to a code missing from the action table
+        """
+        by_code = {action.code: action for action in self.actions}
+        robot_entries = {}
+        for robot_id, track in self.tracks.items():
+            entries = []
+            for code, offset, row in zip(track.codes, track.offsets, track.rows):
+                action = by_code.get(code)
+                if action is None:
+                    raise ValueError(
+                        f"Corrupt show plan: robot {robot_id} row {row} uses unknown action code {code}"
+                    )
+                entries.append(ScheduledAction(row, offset, action.name, action.repeat))
+            robot_entries[robot_id] = entries
+        return Timeline(list(self.row_offsets), self.duration, robot_entries)
+
+    def action_tables(self) -> Tuple[Dict[str, float], Dict[str, int]]:
+        """Return the name to time and name to repeat mappings of the plan's actions."""
+        return (
+            {action.name: action.duration for action in self.actions},
+            {action.name: action.repeat for action in self.actions},
+        )
+
+    def for_robots(self, robot_ids: List[int]) -> "ShowPlan":
+        """Return the plan restricted to the tracks of the given robots."""
+        tracks = {rid: track for rid, track in self.tracks.items() if rid in robot_ids}
+        return ShowPlan(self.song, self.duration, self.actions, self.row_offsets, tracks)
+
+    def to_bytes(self) -> bytes:
+        parts = [
+            _HEADER.pack(
+                PLAN_MAGIC,
+                PLAN_VERSION,
+                0,
+                len(self.row_offsets),
+                len(self.actions),
+                len(self.tracks),
+                self.duration,
+            ),
+            _pack_string(self.song),
+        ]
+        for action in self.actions:
+            name = action.name.encode("utf-8")
+            parts.append(_ACTION.pack(action.code, action.duration, action.repeat, len(name)))
+            parts.append(name)
+        parts.append(_array_bytes(self.row_offsets, _F64))
+        for robot_id, track in sorted(self.tracks.items()):
+            parts.append(_TRACK.pack(robot_id, len(track.codes)))
+            parts.append(_array_bytes(track.codes, _U32))
+            parts.append(_array_bytes(track.offsets, _F64))
+            parts.append(_array_bytes(track.rows, _U32))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ShowPlan":
+        """
+        Decode a plan.
+
+        Raises:
+            ValueError: If the data isn't a plan or was written by another format version
+        """
+        try:
+            magic, version, _, row_count, action_count, robot_count, duration = (
+                _HEADER.unpack_from(data, 0)
+            )
+            if magic != PLAN_MAGIC:
+                raise ValueError("Not a show plan file")
+            if version != PLAN_VERSION:
+                raise ValueError(f"Unsupported show plan version {version}")
+            pos = _HEADER.size
+            song, pos = _unpack_string(data, pos)
+            actions = []
+            for _ in range(action_count):
+                code, duration_val, repeat, name_len = _ACTION.unpack_from(data, pos)
+                pos += _ACTION.size
+                name = data[pos:pos + name_len].decode("utf-8")
+                pos += name_len
+                actions.append(PlanAction(code, name, duration_val, repeat))
+            row_offsets, pos = _read_array(data, pos, _F64, row_count)
+            tracks = {}
+            for _ in range(robot_count):
+                robot_id, count = _TRACK.unpack_from(data, pos)
+                pos += _TRACK.size
+                codes, pos = _read_array(data, pos, _U32, count)
+                offsets, pos = _read_array(data, pos, _F64, count)
+                rows, pos = _read_array(data, pos, _U32, count)
+                tracks[robot_id] = RobotTrack(codes, offsets, rows)
+        except (struct.error, UnicodeDecodeError) as e:
+            raise ValueError(f"Corrupt show plan: {e}") from e
+        return cls(song, duration, actions, row_offsets, tracks)
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> "ShowPlan":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def _pack_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return _STRING.pack(len(data)) + data
+
+
+def _unpack_string(data: bytes, pos: int) -> Tuple[str, int]:
+    (length,) = _STRING.unpack_from(data, pos)
+    pos += _STRING.size
+    return data[pos:pos + length].decode("utf-8"), pos + length
+
+
+def _array_bytes(values: array, typecode: str) -> bytes:
+    """Serialize `values` little-endian with the item size of `typecode`, whatever its own typecode."""
+    if values.typecode != typecode or sys.byteorder == "big":
+        values = array(typecode, values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _read_array(data: bytes, pos: int, typecode: str, count: int) -> Tuple[array, int]:
+    values = array(typecode)
+    end = pos + values.itemsize * count
+    if end > len(data):
+        raise ValueError("Corrupt show plan: truncated array")
+    values.frombytes(data[pos:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values, end
@@ -0,0 +1,366 @@
+import logging
+import random
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+import requests
+
+from action import RobotAction
+from constant import (
+    CALIBRATION_SAMPLES,
+    FLEET_PROBE_BUDGET,
+    FLEET_REPROBE_INTERVAL,
+    SIMULATION_IDLE_GAP,
+    SIMULATION_OVERRUN_TOLERANCE,
+)
+from retry_policy import RetryPolicy, RetryStats
+from scheduler import ScheduledAction, Timeline, TimelineScheduler, playback_lead
+from show_trace import ShowTrace
+from time_source import WallClock
+
+_robot_logger = logging.getLogger("SimulatedRobot")
+_robot_logger.setLevel(logging.CRITICAL)
+
+
+class VirtualClock(WallClock):
+    """
+    Simulated monotonic time that only moves when the code running on it waits.
+
+    A wait jumps straight to its end, so a song takes as long as its code
+    takes to run. Nothing else can set an event meanwhile: the simulator
+    runs one robot's worker at a time.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += max(0.0, seconds)
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        if not event.is_set():
+            self.sleep(timeout)
+        return event.is_set()
+
+
+class _SimulatedResponse:
+    """The answer of a simulated robot to any JSON-RPC method."""
+
+    status_code = 200
+
+    def __init__(self, method: str):
+        self.method = method
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def json(self) -> Dict[str, Any]:
+        return {"jsonrpc": "2.0", "id": "12345", "result": [True, [], self.method]}
+
+
+class _SimulatedSession:
+    """Stands in for a robot's requests.Session and moves the virtual clock by each round trip."""
+
+    def __init__(self, robot: "SimulatedRobot"):
+        self.robot = robot
+
+    def post(self, url: str, headers=None, json=None, timeout: float = 0.0) -> _SimulatedResponse:
+        robot = self.robot
+        clock = robot.time_source
+        if robot.loss and robot.rng.random() < robot.loss:
+            clock.sleep(timeout)
+            raise requests.exceptions.Timeout(f"{url} request lost")
+        rtt = robot.round_trip()
+        if json["method"] == "RunAction":
+            robot.arrived(clock.now + rtt / 2)
+        if rtt >= timeout:
+            clock.sleep(timeout)
+            raise requests.exceptions.Timeout(f"{url} answered after {rtt * 1000:.0f} ms")
+        clock.sleep(rtt)
+        return _SimulatedResponse(json["method"])
+
+    def close(self) -> None:
+        pass
+
+
+class SimulatedRobot(RobotAction):
+    """
+    A RobotAction talking to a robot on a simulated network.
+
+    Each request takes `latency` plus up to `jitter` seconds of round trip,
+    split evenly between the two directions, and a `loss` fraction of
+    requests is never answered. Everything else is RobotAction's own code:
+    the timeout adapted to the measured round trips, the retries under the
+    robot's RetryPolicy and the health tracking. The robot performs each
+    action for its duration from the moment the command arrives; a retry
+    that arrives again restarts it, and a new command cuts the running
+    action short.
+    """
+
+    def __init__(
+        self,
+        robot_id: int,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        retry: Optional[RetryPolicy] = None,
+        rng: Optional[random.Random] = None,
+        clock: Optional[VirtualClock] = None,
+    ):
+        super().__init__(
+            f"http://simulated-robot-{robot_id}/",
+            {},
+            device_id=f"robot-{robot_id}",
+            retry=retry,
+            time_source=clock or VirtualClock(),
+        )
+        # The report counts retries and lost commands, one log line per request would drown it
+        self.logger = logging.LoggerAdapter(_robot_logger, {"robot": self.device_id})
+        self.robot_id = robot_id
+        self.network_latency = latency
+        self.network_jitter = jitter
+        self.loss = loss
+        self.rng = rng or random.Random()
+        self.session = self.stop_session = _SimulatedSession(self)
+        # (start, end, row) of every action the robot performed, and how long
+        # the action it was still busy with ran into each new one
+        self.busy: List[Tuple[float, float, int]] = []
+        self.overlaps: List[Tuple[int, float]] = []
+        self._entries: Iterator[ScheduledAction] = iter(())
+        self._entry: Optional[ScheduledAction] = None
+        self._entry_arrived = False
+        self._probe_tick = 0
+        # Calibrated like calibrate_robots does before the show, off the show's time
+        now = self.time_source.now
+        for _ in range(CALIBRATION_SAMPLES):
+            self.ping()
+        self.time_source.now = now
+
+    def round_trip(self) -> float:
+        """Draw the round-trip time of one request."""
+        jitter = self.rng.uniform(0.0, self.network_jitter) if self.network_jitter else 0.0
+        return self.network_latency + jitter
+
+    def begin_song(self, entries: List[ScheduledAction]) -> None:
+        """Forget the previous song and expect the commands of `entries`, in order."""
+        self.busy = []
+        self.overlaps = []
+        self._entries = iter(entries)
+        self._entry = None
+        self.retry_stats = RetryStats()
+
+    def start_action(
+        self,
+        name: str,
+        repeat: Optional[int] = None,
+        deadline: Optional[float] = None,
+        stop_event: Optional[threading.Event] = None,
+    ) -> Optional[Dict[str, Any]]:
+        self._entry = next(self._entries, None)
+        self._entry_arrived = False
+        self._reprobe()
+        return super().start_action(name, repeat, deadline, stop_event)
+
+    def arrived(self, when: float) -> None:
+        """Record a RunAction command reaching the robot at `when`."""
+        entry = self._entry
+        if entry is None:
+            return
+        end = when + (self.actions.get(entry.name) or 0.0)
+        if self._entry_arrived:
+            # A retransmitted command restarts the action it already started
+            self.busy[-1] = (when, end, entry.row)
+            return
+        self._entry_arrived = True
+        if self.busy and self.busy[-1][1] > when:
+            begin, finish, row = self.busy[-1]
+            self.overlaps.append((entry.row, finish - when))
+            self.busy[-1] = (begin, when, row)
+        self.busy.append((when, end, entry.row))
+
+    def _reprobe(self) -> None:
+        """Ping an offline robot on the FleetMonitor's schedule, which costs the worker no time."""
+        tick = int(self.time_source.now // FLEET_REPROBE_INTERVAL)
+        if not self.health.online and tick > self._probe_tick:
+            now = self.time_source.now
+            self.ping(True, min(FLEET_PROBE_BUDGET, self.timeout))
+            self.time_source.now = now
+        self._probe_tick = tick
+
+
+@dataclass
+class RobotUsage:
+    """How one robot spent the song."""
+
+    actions: int = 0
+    missed: int = 0
+    retries: int = 0
+    abandoned: int = 0
+    busy: float = 0.0
+    idle_gaps: List[Tuple[float, float]] = field(default_factory=list)
+    utilization: float = 0.0
+
+
+@dataclass
+class SimulationReport:
+    """Timing of one song played on the virtual clock; all times in seconds from the song start."""
+
+    song: str
+    rows: int
+    duration: float
+    show_length: float = 0.0
+    worst_lateness: float = 0.0
+    row_overruns: List[Tuple[int, int, float]] = field(default_factory=list)
+    action_overlaps: List[Tuple[int, int, float]] = field(default_factory=list)
+    robots: Dict[int, RobotUsage] = field(default_factory=dict)
+
+    @property
+    def retries(self) -> int:
+        return sum(usage.retries for usage in self.robots.values())
+
+    @property
+    def abandoned(self) -> int:
+        return sum(usage.abandoned for usage in self.robots.values())
+
+    @property
+    def ok(self) -> bool:
+        return not self.row_overruns and not self.action_overlaps
+
+    def log_summary(self, logger: logging.Logger) -> None:
+        for row, robot_id, overrun in self.row_overruns:
+            logger.warning(f"Row {row}: robot {robot_id} overruns the row by {overrun * 1000:.1f} ms")
+        for row, robot_id, overlap in self.action_overlaps:
+            logger.warning(
+                f"Row {row}: robot {robot_id} is still busy for {overlap * 1000:.1f} ms "
+                f"when its next action arrives"
+            )
+        for robot_id, usage in sorted(self.robots.items()):
+            longest = max((length for _, length in usage.idle_gaps), default=0.0)
+            logger.info(
+                f"Robot {robot_id}: {usage.actions} actions, {usage.missed} lost, "
+                f"{usage.retries} retried, {usage.abandoned} abandoned, "
+                f"{usage.utilization:.0%} busy, {len(usage.idle_gaps)} idle gap(s), "
+                f"longest {longest:.1f}s"
+            )
+        logger.info(
+            f"Simulated '{self.song}': {self.rows} rows, timeline {self.duration:.1f}s, "
+            f"show length {self.show_length:.1f}s, worst lateness {self.worst_lateness * 1000:.1f} ms, "
+            f"{len(self.row_overruns)} row overrun(s), {len(self.action_overlaps)} overlap(s), "
+            f"{self.retries} retries, {self.abandoned} abandoned"
+        )
+
+
+class ShowSimulator:
+    """
+    Plays a compiled timeline against simulated robots on a virtual clock.
+
+    Each robot's part runs through TimelineScheduler's own worker loop and
+    RobotAction's own request and retry code, one robot after the other:
+    commands are sent their one-way delay ahead of their deadline, a late or
+    lost answer pushes back the robot's next command, and lost commands are
+    retried while RetryPolicy.deadline allows. Only the network and the
+    passing of time are simulated.
+    """
+
+    def __init__(
+        self,
+        robots: Dict[int, SimulatedRobot],
+        idle_gap: float = SIMULATION_IDLE_GAP,
+        tolerance: float = SIMULATION_OVERRUN_TOLERANCE,
+    ):
+        """
+        Initialize the simulator.
+
+        Args:
+            robots: Simulated robots keyed by robot number; they are moved onto
+                the simulator's clock
+            idle_gap: Shortest idle time between actions that is reported as a gap
+            tolerance: Overruns up to this many seconds are not reported
+        """
+        self.robots = robots
+        self.idle_gap = idle_gap
+        self.tolerance = tolerance
+        self.clock = VirtualClock()
+        for robot in robots.values():
+            robot.time_source = self.clock
+
+    def run(
+        self,
+        song: str,
+        timeline: Timeline,
+        action_name_to_time: Mapping[str, float],
+        trace: Optional[ShowTrace] = None,
+    ) -> SimulationReport:
+        """
+        Simulate one song.
+
+        Args:
+            song: Song name for the report
+            timeline: Compiled timeline of the song
+            action_name_to_time: Duration of every action
+            trace: Optional trace that records the virtual timing of every action
+
+        Returns:
+            The song's SimulationReport
+        """
+        scheduler = TimelineScheduler(
+            self.robots, timeline, threading.Event(), trace=trace, time_source=self.clock
+        )
+        # The workers start as far ahead of the song as a show with a player starts them
+        lead = playback_lead(self.robots, scheduler.start_delay)
+        report = SimulationReport(song, len(timeline.row_offsets), timeline.duration)
+        row_ends = timeline.row_offsets[1:] + [timeline.duration]
+        if trace is not None:
+            trace.begin(0.0)
+        for robot_id, robot in self.robots.items():
+            entries = timeline.robot_entries.get(robot_id) or []
+            robot.set_actions(action_name_to_time)
+            robot.begin_song(entries)
+            self.clock.now = -lead
+            scheduler.run_robot(robot_id, 0.0)
+            stats = robot.retry_stats.as_dict()
+            report.robots[robot_id] = RobotUsage(
+                actions=len(robot.busy),
+                missed=len(entries) - len(robot.busy),
+                retries=stats["retries"],
+                abandoned=stats["abandoned"],
+            )
+            report.action_overlaps.extend(
+                (row, robot_id, overlap)
+                for row, overlap in robot.overlaps
+                if overlap > self.tolerance
+            )
+        report.worst_lateness = scheduler.report.summary()["worst_lateness"]
+
+        end = timeline.duration
+        for robot in self.robots.values():
+            if robot.busy:
+                end = max(end, robot.busy[-1][1])
+        report.show_length = end
+        for robot_id, robot in self.robots.items():
+            usage = report.robots[robot_id]
+            usage.busy = sum(finish - begin for begin, finish, _ in robot.busy)
+            usage.utilization = usage.busy / end if end > 0 else 0.0
+            idle_from = 0.0
+            row_finish: Dict[int, float] = {}
+            for begin, finish, row in robot.busy:
+                if begin - idle_from >= self.idle_gap:
+                    usage.idle_gaps.append((idle_from, begin - idle_from))
+                idle_from = max(idle_from, finish)
+                row_finish[row] = max(row_finish.get(row, finish), finish)
+            if end - idle_from >= self.idle_gap:
+                usage.idle_gaps.append((idle_from, end - idle_from))
+            for row, finish in row_finish.items():
+                overrun = finish - row_ends[row - 1]
+                if overrun > self.tolerance:
+                    report.row_overruns.append((row, robot_id, overrun))
+        report.row_overruns.sort()
+        report.action_overlaps.sort()
+        return report
@@ -0,0 +1,137 @@
+import csv
+import json
+import os
+from typing import List, Optional
+
+# Fields of one action record, all times in time.monotonic() seconds
+TRACE_FIELDS = (
+    "robot",
+    "row",
+    "action",
+    "scheduled",
+    "sleep_end",
+    "dispatch",
+    "rpc_send",
+    "rpc_response",
+    "ok",
+    "interrupted",
+)
+
+
+class ShowTrace:
+    """
+    In-memory timing trace of one song, exported after the song ends.
+
+    The dispatch engines append one flat record per action; appending to a
+    list is atomic, so the hot path takes no lock and does no formatting.
+    """
+
+    def __init__(self, song: str):
+        self.song = song
+        self.start: Optional[float] = None
+        self.records: List[list] = []
+
+    def begin(self, start: float) -> None:
+        """Set the song start that exported timestamps are relative to."""
+        self.start = start
+
+    def action(
+        self,
+        robot: int,
+        row: int,
+        action: str,
+        scheduled: float,
+        sleep_end: float,
+        dispatch: float,
+        rpc_send: Optional[float],
+        rpc_response: Optional[float],
+        ok: bool,
+    ) -> None:
+        self.records.append(
+            [robot, row, action, scheduled, sleep_end, dispatch, rpc_send, rpc_response, ok, None]
+        )
+
+    def interrupted(self, robot: int, row: int, action: str, scheduled: float, at: float) -> None:
+        self.records.append([robot, row, action, scheduled, at, None, None, None, False, at])
+
+    def export_csv(self, path: str) -> None:
+        """Write one line per action with times in ms from the song start."""
+        base = self.start or 0.0
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(TRACE_FIELDS + ("lateness_ms", "rtt_ms"))
+            for record in sorted(self.records, key=lambda r: (r[3], r[0])):
+                robot, row, action, *times = record[:8]
+                ok, interrupted = record[8], record[9]
+                scheduled, _, dispatch, rpc_send, rpc_response = times
+                rel = [_ms(t, base) for t in times]
+                lateness = _ms(dispatch, scheduled) if dispatch is not None else ""
+                rtt = (
+                    _ms(rpc_response, rpc_send)
+                    if rpc_send is not None and rpc_response is not None
+                    else ""
+                )
+                writer.writerow(
+                    [robot, row, action, *rel, int(ok), _ms(interrupted, base), lateness, rtt]
+                )
+
+    def export_chrome(self, path: str) -> None:
+        """
+        Write a Chrome trace-event file (chrome://tracing, Perfetto).
+
+        Each robot is a thread; the wait for a deadline and the RPC are
+        complete events, deadlines and interruptions are instant events.
+        """
+        base = self.start or 0.0
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": self.song}}]
+        for robot in sorted({record[0] for record in self.records}):
+            events.append(
+                {"name": "thread_name", "ph": "M", "pid": 1, "tid": robot, "args": {"name": f"Robot {robot}"}}
+            )
+        for record in self.records:
+            robot, row, action, scheduled, sleep_end, dispatch, rpc_send, rpc_response, ok, interrupted = record
+            common = {"pid": 1, "tid": robot, "args": {"row": row, "action": action}}
+            events.append(
+                {"name": "deadline", "ph": "i", "s": "t", "ts": _us(scheduled, base), **common}
+            )
+            if interrupted is not None:
+                events.append(
+                    {"name": "interrupted", "ph": "i", "s": "t", "ts": _us(interrupted, base), **common}
+                )
+                continue
+            if rpc_send is not None and rpc_response is not None:
+                events.append(
+                    {
+                        "name": action,
+                        "cat": "rpc" if ok else "rpc_failed",
+                        "ph": "X",
+                        "ts": _us(rpc_send, base),
+                        "dur": _us(rpc_response, rpc_send),
+                        "pid": 1,
+                        "tid": robot,
+                        "args": {
+                            "row": row,
+                            "lateness_ms": _ms(dispatch, scheduled),
+                            "wake_error_ms": _ms(sleep_end, scheduled),
+                        },
+                    }
+                )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def export(self, trace_dir: str) -> List[str]:
+        """Write both formats into trace_dir and return the paths."""
+        os.makedirs(trace_dir, exist_ok=True)
+        json_path = os.path.join(trace_dir, f"{self.song}.trace.json")
+        csv_path = os.path.join(trace_dir, f"{self.song}.trace.csv")
+        self.export_chrome(json_path)
+        self.export_csv(csv_path)
+        return [json_path, csv_path]
+
+
+def _ms(value: Optional[float], base: float) -> object:
+    return round((value - base) * 1000.0, 3) if value is not None else ""
+
+
+def _us(value: float, base: float) -> float:
+    return round((value - base) * 1_000_000.0, 1)
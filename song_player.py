@@ -1,7 +1,16 @@
 import logging
 import os
+import secrets
 import subprocess
 import sys
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+import requests
+
+from constant import VLC_HTTP_PORT, VLC_STARTUP_LATENCY
 
 logger = logging.getLogger(__name__)
 
@@ -17,13 +26,14 @@ def _find_vlc_path() -> str:
     return "vlc"  # Default to PATH
 
 
-def play_song(file_path):
-    """Play a song file using VLC or the system default player."""
+def play_song(file_path, start: float = 0.0):
+    """Play a song file using VLC or the system default player; only VLC honours `start`."""
+    start_args = [f"--start-time={start:.3f}"] if start > 0 else []
     try:
         if sys.platform.startswith("win"):
             vlc_cmd = _find_vlc_path()
             try:
-                subprocess.Popen([vlc_cmd, "--play-and-exit", file_path], shell=True)
+                subprocess.Popen([vlc_cmd, "--play-and-exit", *start_args, file_path], shell=True)
                 logger.info(f"Playing song with VLC: {file_path}")
             except (OSError, FileNotFoundError, subprocess.SubprocessError) as e:
                 logger.error(f"Failed to play song with VLC: {e}")
@@ -34,7 +44,7 @@ def play_song(file_path):
                     logger.error(f"Failed to play song with default app: {e2}")
         else:
             try:
-                subprocess.Popen(["vlc", "--play-and-exit", file_path])
+                subprocess.Popen(["vlc", "--play-and-exit", *start_args, file_path])
                 logger.info(f"Playing song with VLC: {file_path}")
             except (OSError, FileNotFoundError, subprocess.SubprocessError) as e:
                 logger.error(f"Failed to play song with VLC: {e}")
@@ -58,3 +68,191 @@ def stop_song():
             logger.info("Stopped VLC player on Linux/Mac.")
     except (OSError, FileNotFoundError) as e:
         logger.error(f"Failed to stop song: {e}")
+
+
+class MediaPlayer(ABC):
+    """
+    A song player that can report where playback currently is.
+
+    `position` is polled by MediaClock; players that can't report it return
+    None, and the robots then follow the wall clock instead.
+    """
+
+    # Granularity of reported positions; a position p means the media time is in [p, p + resolution)
+    resolution = 0.0
+    has_clock = False
+    # Seconds from play() until the audio starts; MediaClock updates it after every song
+    startup_latency = 0.0
+
+    @abstractmethod
+    def play(self, file_path: str, start: float = 0.0) -> None:
+        """Start playing `file_path` from `start` seconds into the song."""
+
+    @abstractmethod
+    def stop(self) -> None:
+        """Stop the song."""
+
+    def position(self) -> Optional[float]:
+        """Playback position in seconds, None while the song isn't playing."""
+        return None
+
+
+class SystemPlayer(MediaPlayer):
+    """Fire-and-forget playback with play_song, without a playback clock."""
+
+    def play(self, file_path: str, start: float = 0.0) -> None:
+        play_song(file_path, start)
+
+    def stop(self) -> None:
+        stop_song()
+
+
+class VlcHttpPlayer(MediaPlayer):
+    """
+    Plays songs in VLC and reads the playback position from its HTTP interface.
+
+    VLC is started with the http interface bound to localhost and a random
+    password; /requests/status.json reports the state and the position in
+    whole seconds. The password is handed over in a config file that only the
+    current user can read, not on the command line, where any local user
+    could read it in the process list. If VLC can't be started, play_song is
+    used as a fallback and no position is available.
+    """
+
+    resolution = 1.0
+    has_clock = True
+    startup_latency = VLC_STARTUP_LATENCY
+
+    def __init__(self, port: int = VLC_HTTP_PORT, host: str = "127.0.0.1", timeout: float = 0.2):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = ("", secrets.token_hex(8))
+        self.process: Optional[subprocess.Popen] = None
+        self._config: Optional[str] = None
+        self._fallback = False
+
+    def play(self, file_path: str, start: float = 0.0) -> None:
+        vlc_cmd = _find_vlc_path() if sys.platform.startswith("win") else "vlc"
+        try:
+            self._write_config()
+            cmd = [
+                vlc_cmd,
+                "--config",
+                self._config,
+                "--play-and-exit",
+                f"--start-time={start:.3f}",
+                "--extraintf",
+                "http",
+                "--http-host",
+                self.host,
+                "--http-port",
+                str(self.port),
+                file_path,
+            ]
+            self.process = subprocess.Popen(cmd)
+            self._fallback = False
+            self.has_clock = True
+            logger.info(f"Playing song with VLC: {file_path}")
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.error(f"Failed to start VLC with its HTTP interface: {e}")
+            self._remove_config()
+            self.process = None
+            self._fallback = True
+            self.has_clock = False
+            play_song(file_path, start)
+
+    def stop(self) -> None:
+        if self._fallback:
+            stop_song()
+            return
+        if self.process is None or self.process.poll() is not None:
+            self._remove_config()
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=2.0)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._remove_config()
+        logger.info("Stopped VLC player.")
+
+    def _write_config(self) -> None:
+        """Write the HTTP password to a VLC config file readable only by the current user."""
+        self._remove_config()
+        # mkstemp creates the file with mode 0600
+        fd, self._config = tempfile.mkstemp(prefix="vlc-http-", suffix=".rc")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(f"[lua]\nhttp-password={self.session.auth[1]}\n")
+
+    def _remove_config(self) -> None:
+        if self._config is None:
+            return
+        try:
+            os.remove(self._config)
+        except OSError as e:
+            logger.warning(f"Could not remove the VLC config file {self._config}: {e}")
+        self._config = None
+
+    def position(self) -> Optional[float]:
+        if self.process is None or self.process.poll() is not None:
+            return None
+        try:
+            response = self.session.get(
+                f"http://{self.host}:{self.port}/requests/status.json", timeout=self.timeout
+            )
+            response.raise_for_status()
+            status = response.json()
+        except (requests.RequestException, ValueError):
+            return None
+        if status.get("state") != "playing":
+            return None
+        return float(status.get("time") or 0)
+
+
+class FakePlayer(MediaPlayer):
+    """
+    A silent player with a simulated playback clock, for tests and dry runs.
+
+    Playback starts `startup_delay` seconds after play() and runs at `rate`
+    times real time; stall() freezes the position to simulate a stutter.
+    """
+
+    has_clock = True
+
+    def __init__(self, startup_delay: float = 0.0, rate: float = 1.0):
+        self.startup_delay = startup_delay
+        self.rate = rate
+        self._begin: Optional[float] = None
+        self._start = 0.0
+        self._hold: Optional[Tuple[float, float]] = None
+
+    def play(self, file_path: str, start: float = 0.0) -> None:
+        self._begin = time.monotonic() + self.startup_delay
+        self._start = start
+        self._hold = None
+        logger.info(f"Playing song with the fake player: {file_path}")
+
+    def stop(self) -> None:
+        self._begin = None
+
+    def stall(self, seconds: float) -> None:
+        """Hold the playback position for `seconds` from now on."""
+        position = self.position()
+        if position is None:
+            return
+        self._hold = (time.monotonic() + seconds, position)
+        self._begin += seconds
+
+    def position(self) -> Optional[float]:
+        if self._begin is None:
+            return None
+        now = time.monotonic()
+        if self._hold is not None and now < self._hold[0]:
+            return self._hold[1]
+        elapsed = now - self._begin
+        return self._start + elapsed * self.rate if elapsed >= 0 else None
+
+
+PLAYERS = {"vlc": VlcHttpPlayer, "system": SystemPlayer, "fake": FakePlayer}
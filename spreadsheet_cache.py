@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+
+class SpreadsheetCache:
+    """
+    Content-addressed on-disk cache for downloaded spreadsheets.
+
+    Bodies are stored once under their SHA-256 and an index maps each URL to
+    its body and HTTP validators. Entries younger than the TTL are served
+    without touching the network; older ones are revalidated with
+    If-None-Match/If-Modified-Since. In offline mode only the cache is used.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self,
+        cache_dir: str,
+        ttl: float = 300.0,
+        max_bytes: int = 50 * 1024 * 1024,
+        offline: bool = False,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory holding the index and the cached bodies
+            ttl: Seconds during which a cached entry is used without revalidation
+            max_bytes: Upper bound on the total size of cached bodies
+            offline: Never touch the network, serve everything from the cache
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.logger = logging.getLogger("SpreadsheetCache")
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+        self._index: Dict[str, Dict[str, Any]] = self._read_index()
+
+    def fetch(self, url: str, timeout: float = 10, max_age: Optional[float] = None) -> Optional[str]:
+        """
+        Return the body of `url`, from the cache when possible.
+
+        A stale copy is served if revalidation fails, so a flaky venue
+        connection doesn't stop the show.
+
+        Args:
+            url: URL to fetch
+            timeout: Request timeout in seconds
+            max_age: Revalidate copies older than this instead of the TTL; 0
+                always asks the server, which costs a 304 when nothing changed
+
+        Returns:
+            The decoded body, or None if it is neither cached nor downloadable
+        """
+        body = self.fetch_bytes(url, timeout, max_age)
+        return body.decode("utf-8") if body is not None else None
+
+    def fetch_bytes(
+        self, url: str, timeout: float = 10, max_age: Optional[float] = None
+    ) -> Optional[bytes]:
+        """Return the raw body of `url`, e.g. a workbook export, see fetch."""
+        with self._lock:
+            entry = self._index.get(url)
+            cached = self._read_blob(entry["sha256"]) if entry else None
+            if cached is None and entry is not None:
+                # Body vanished from disk, forget the entry
+                del self._index[url]
+                entry = None
+
+            if self.offline:
+                if cached is None:
+                    self.logger.error(f"Offline mode: no cached copy of {url}")
+                else:
+                    self._touch(entry)
+                return cached
+
+            now = time.time()
+            ttl = self.ttl if max_age is None else max_age
+            if cached is not None and now - entry["fetched_at"] < ttl:
+                self._touch(entry)
+                return cached
+
+            headers = {}
+            if entry is not None:
+                if entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+            try:
+                response = self._session.get(url, headers=headers, timeout=timeout)
+                if response.status_code == 304 and cached is not None:
+                    self.logger.debug(f"Not modified: {url}")
+                    entry["fetched_at"] = now
+                    self._touch(entry)
+                    return cached
+                response.raise_for_status()
+                body = response.content
+            except requests.RequestException as e:
+                if cached is None:
+                    raise
+                self.logger.warning(f"Revalidation of {url} failed ({e}), using cached copy")
+                self._touch(entry)
+                return cached
+
+            self._store(url, body, response, now)
+            return body
+
+    def _store(self, url: str, data: bytes, response: requests.Response, now: float) -> None:
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(sha256)
+        if not os.path.exists(path):
+            self._atomic_write(path, data)
+        self._index[url] = {
+            "sha256": sha256,
+            "size": len(data),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": now,
+            "accessed_at": now,
+        }
+        self._evict()
+        self._write_index()
+
+    def _touch(self, entry: Dict[str, Any]) -> None:
+        entry["accessed_at"] = time.time()
+        self._write_index()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the referenced bodies fit in max_bytes."""
+        sizes = {entry["sha256"]: entry["size"] for entry in self._index.values()}
+        total = sum(sizes.values())
+        for url, entry in sorted(self._index.items(), key=lambda item: item[1]["accessed_at"]):
+            if total <= self.max_bytes:
+                break
+            del self._index[url]
+            if all(other["sha256"] != entry["sha256"] for other in self._index.values()):
+                total -= sizes[entry["sha256"]]
+        referenced = {entry["sha256"] for entry in self._index.values()}
+        blob_dir = os.path.join(self.cache_dir, "blobs")
+        for name in os.listdir(blob_dir):
+            if name not in referenced:
+                try:
+                    os.remove(os.path.join(blob_dir, name))
+                except OSError:
+                    pass
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, "blobs", sha256)
+
+    def _read_blob(self, sha256: str) -> Optional[bytes]:
+        try:
+            with open(self._blob_path(sha256), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.cache_dir, self.INDEX_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self) -> None:
+        data = json.dumps(self._index, indent=1).encode("utf-8")
+        self._atomic_write(os.path.join(self.cache_dir, self.INDEX_FILE), data)
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
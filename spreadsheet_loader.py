@@ -1,14 +1,35 @@
 import csv
 from io import StringIO
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, Iterable, List, Mapping, Optional
 
 import requests
 
+from action_catalog import ActionCatalog, content_hash
 from constant import (
     ACTION_DETAILS_SPREADSHEET_ID,
     ACTION_SEQUENCE_SPREADSHEET_ID,
     ROBOT_IPS,
 )
+from spreadsheet_cache import SpreadsheetCache
+
+if TYPE_CHECKING:
+    from spreadsheet_workbook import SpreadsheetWorkbook
+
+# Columns of a song's sheet and of the action details sheet, by position
+ROBOT_ACTION_COLUMNS = ["Time", "Robot_1", "Robot_2", "Robot_3", "Robot_4", "Robot_5", "Robot_6"]
+ACTION_DETAIL_COLUMNS = ["Code", "Name", "Time", "Repeat_Time", "Remark", "Link"]
+
+
+def rows_to_records(rows: Iterable[List[str]], columns: List[str]) -> List[Dict[str, str]]:
+    """Turn sheet rows after the header into dictionaries, skipping rows without a first cell."""
+    records = []
+    rows = iter(rows)
+    next(rows, None)  # Skip header
+    for row in rows:
+        if not row or not row[0]:
+            continue
+        records.append({col: row[idx] for idx, col in enumerate(columns) if idx < len(row)})
+    return records
 
 
 class SpreadsheetLoader:
@@ -17,11 +38,28 @@ class SpreadsheetLoader:
     def __init__(
         self,
         dance: str,
+        cache: Optional[SpreadsheetCache] = None,
+        max_age: Optional[float] = None,
+        workbook: Optional["SpreadsheetWorkbook"] = None,
     ):
+        """
+        Load a song's sheet and the action details.
 
+        Args:
+            dance: Song name, the sheet of the action sequence spreadsheet
+            cache: Spreadsheet cache for the downloads
+            max_age: Revalidate cached sheets older than this, see SpreadsheetCache.fetch
+            workbook: Workbook downloaded for the whole playlist; the song's sheet and
+                the action details are taken from it instead of being fetched
+        """
+        self.cache = cache
+        self.max_age = max_age
+        self.workbook = workbook
         self.robot_actions_spreadsheet_id = ACTION_SEQUENCE_SPREADSHEET_ID
         self.action_details_spreadsheet_id = ACTION_DETAILS_SPREADSHEET_ID
         self.dance = dance
+        self.action_details_hash = ""
+        self._catalog: Optional[ActionCatalog] = None
         self.robot_actions_data = (
             self._load_robot_actions() if self.robot_actions_spreadsheet_id else []
         )
@@ -39,6 +77,9 @@ class SpreadsheetLoader:
             url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/gviz/tq?tqx=out:csv&sheet={sheet_name}"
         print(f"Fetching spreadsheet data from: {url}")
         try:
+            if self.cache is not None:
+                csv_str = self.cache.fetch(url, timeout=10, max_age=self.max_age)
+                return StringIO(csv_str) if csv_str is not None else None
             response = requests.get(url, timeout=10)
             response.raise_for_status()
             csv_str = response.content.decode("utf-8")
@@ -49,72 +90,60 @@ class SpreadsheetLoader:
 
     def _load_csv_data(self, f: StringIO, columns: List[str]) -> List[Dict[str, str]]:
         """Load CSV data into a list of dictionaries with given columns."""
-        spreadsheet_data = []
-        reader = csv.reader(f, delimiter=",")
-        next(reader, None)  # Skip header
-        for row in reader:
-            if not row or not row[0]:
-                continue
-            entry = {col: row[idx] for idx, col in enumerate(columns) if idx < len(row)}
-            spreadsheet_data.append(entry)
-        return spreadsheet_data
+        return rows_to_records(csv.reader(f, delimiter=","), columns)
 
     def _load_robot_actions(self) -> List[Dict[str, str]]:
+        if self.workbook is not None:
+            if self.dance in self.workbook.songs:
+                # Copies, since compiling renders the templates in place
+                return [dict(row) for row in self.workbook.songs[self.dance]]
+            print(f"No sheet '{self.dance}' in the downloaded workbook, fetching it on its own.")
         f = self._fetch_spreadsheet_data(self.robot_actions_spreadsheet_id, self.dance)
         if not f:
             print("Failed to fetch robot actions spreadsheet data.")
             return []
-        columns = [
-            "Time",
-            "Robot_1",
-            "Robot_2",
-            "Robot_3",
-            "Robot_4",
-            "Robot_5",
-            "Robot_6",
-        ]
-        return self._load_csv_data(f, columns)
+        return self._load_csv_data(f, ROBOT_ACTION_COLUMNS)
 
     def _load_action_details(self) -> List[Dict[str, str]]:
+        if self.workbook is not None and self.workbook.action_details_data:
+            self.action_details_hash = self.workbook.action_details_hash
+            return self.workbook.action_details_data
         f = self._fetch_spreadsheet_data(self.action_details_spreadsheet_id)
         if not f:
             print("Failed to fetch action details spreadsheet data.")
             return []
-        columns = ["Code", "Name", "Time", "Repeat_Time", "Remark", "Link"]
-        return self._load_csv_data(f, columns)
+        self.action_details_hash = content_hash(f.getvalue())
+        return self._load_csv_data(f, ACTION_DETAIL_COLUMNS)
 
     def get_action_details(self):
         return self.action_details_data
 
-    def get_action_name_to_time(self) -> Dict[str, float]:
-        """Get a mapping of action names to their time values as floats."""
-        if not self.action_details_data:
-            raise ValueError("No action details data loaded.")
-        action_name_to_time = {}
-        for action in self.action_details_data:
-            name = action.get("Name")
-            time_val = action.get("Time")
-            if name and time_val:
-                try:
-                    action_name_to_time[name] = float(time_val)
-                except (ValueError, TypeError):
-                    continue
-        return action_name_to_time
-
-    def get_action_name_to_repeat_time(self) -> Dict[str, int]:
-        """Get a mapping of action names to their repeat time values as integers."""
+    def get_action_catalog(self) -> ActionCatalog:
+        """
+        Return the catalog of the loaded action details.
+
+        Catalogs are shared between loaders and only rebuilt when the sheet's
+        content changes.
+        """
         if not self.action_details_data:
             raise ValueError("No action details data loaded.")
-        action_name_to_repeat_time = {}
-        for action in self.action_details_data:
-            name = action.get("Name")
-            repeat_time_val = action.get("Repeat_Time")
-            if name and repeat_time_val:
-                try:
-                    action_name_to_repeat_time[name] = int(repeat_time_val)
-                except (ValueError, TypeError):
-                    continue
-        return action_name_to_repeat_time
+        if self._catalog is None:
+            self._catalog = ActionCatalog.for_revision(
+                self.action_details_data, self.action_details_hash
+            )
+        return self._catalog
+
+    def get_action_name_to_time(self) -> Mapping[str, float]:
+        """Get a read-only mapping of action names to their time values as floats."""
+        return self.get_action_catalog().durations
+
+    def get_action_name_to_repeat_time(self) -> Mapping[str, int]:
+        """Get a read-only mapping of action names to their repeat time values as integers."""
+        return self.get_action_catalog().repeats
+
+    def get_action_name_to_code(self) -> Mapping[str, int]:
+        """Get a read-only mapping of action names to their numeric Code values."""
+        return self.get_action_catalog().codes
 
     def get_robot_actions(self):
         return self.robot_actions_data
@@ -0,0 +1,201 @@
+import csv
+import io
+import logging
+import posixpath
+import re
+import zipfile
+from typing import Dict, List, Optional
+from xml.etree import ElementTree
+
+import requests
+
+from action_catalog import content_hash
+from constant import ACTION_DETAILS_SPREADSHEET_ID, ACTION_SEQUENCE_SPREADSHEET_ID
+from spreadsheet_cache import SpreadsheetCache
+from spreadsheet_loader import ACTION_DETAIL_COLUMNS, ROBOT_ACTION_COLUMNS, rows_to_records
+
+logger = logging.getLogger(__name__)
+
+_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_CELL_REF = re.compile(r"([A-Z]+)")
+
+
+def read_xlsx(data: bytes) -> Dict[str, List[List[str]]]:
+    """
+    Read the cell text of every sheet of an xlsx workbook.
+
+    Only what the action sheets need is understood: shared, inline and
+    formula strings, numbers and booleans. Numbers are written the way the
+    CSV export shows them, without float noise, and missing cells become
+    empty strings up to the sheet's last used column.
+
+    Args:
+        data: The workbook file
+
+    Returns:
+        Rows of cell text keyed by sheet name, in workbook order
+
+    Raises:
+        ValueError: If the data is not a readable xlsx workbook
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            names = set(archive.namelist())
+            strings = []
+            if "xl/sharedStrings.xml" in names:
+                root = ElementTree.fromstring(archive.read("xl/sharedStrings.xml"))
+                strings = [_text(item) for item in root.iter(f"{_MAIN_NS}si")]
+            rels = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+            targets = {
+                rel.get("Id"): rel.get("Target")
+                for rel in rels.iter(f"{_PACKAGE_REL_NS}Relationship")
+            }
+            workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+            sheets = {}
+            for sheet in workbook.iter(f"{_MAIN_NS}sheet"):
+                target = targets[sheet.get(f"{_REL_NS}id")]
+                # Targets are relative to xl/ unless absolute within the package
+                if target.startswith("/"):
+                    path = target.lstrip("/")
+                else:
+                    path = posixpath.join("xl", target)
+                sheets[sheet.get("name")] = _read_sheet(archive.read(path), strings)
+            return sheets
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise ValueError(f"Not a readable xlsx workbook: {e}") from e
+
+
+def _read_sheet(data: bytes, strings: List[str]) -> List[List[str]]:
+    rows: List[List[str]] = []
+    for row in ElementTree.fromstring(data).iter(f"{_MAIN_NS}row"):
+        # Rows and cells may be left out when empty, so place them by reference
+        number = int(row.get("r", len(rows) + 1))
+        while len(rows) < number - 1:
+            rows.append([])
+        values: List[str] = []
+        for cell in row.iter(f"{_MAIN_NS}c"):
+            ref = cell.get("r")
+            column = _column_index(ref) if ref else len(values)
+            while len(values) < column:
+                values.append("")
+            values.append(_cell_text(cell, strings))
+        rows.append(values)
+    # Like the CSV export, every row spans the sheet's used columns
+    width = max((len(values) for values in rows), default=0)
+    for values in rows:
+        values.extend([""] * (width - len(values)))
+    return rows
+
+
+def _column_index(ref: str) -> int:
+    index = 0
+    for letter in _CELL_REF.match(ref).group(1):
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def _cell_text(cell: ElementTree.Element, strings: List[str]) -> str:
+    kind = cell.get("t", "n")
+    if kind == "inlineStr":
+        inline = cell.find(f"{_MAIN_NS}is")
+        return _text(inline) if inline is not None else ""
+    value = cell.findtext(f"{_MAIN_NS}v")
+    if value is None:
+        return ""
+    if kind == "s":
+        return strings[int(value)]
+    if kind == "b":
+        return "TRUE" if value == "1" else "FALSE"
+    if kind == "n":
+        try:
+            return f"{float(value):.15g}"
+        except ValueError:
+            return value
+    return value
+
+
+def _text(item: ElementTree.Element) -> str:
+    """Text of a string item, joining the runs of rich text."""
+    return "".join(t.text or "" for t in item.iter(f"{_MAIN_NS}t"))
+
+
+class SpreadsheetWorkbook:
+    """
+    Every song's sheet of the action sequence spreadsheet, from one download.
+
+    The whole workbook is exported as xlsx once and all song tabs are parsed
+    in one pass, instead of one CSV request per song. Like SpreadsheetLoader,
+    it loads when created; pass it to SpreadsheetLoader to build songs from it.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[SpreadsheetCache] = None,
+        source: Optional[str] = None,
+        details_source: Optional[str] = None,
+        max_age: Optional[float] = None,
+    ):
+        """
+        Download and parse the workbook and the action details.
+
+        Args:
+            cache: Spreadsheet cache for downloads
+            source: URL or local path of the xlsx workbook, the export of
+                ACTION_SEQUENCE_SPREADSHEET_ID by default
+            details_source: URL or local path of the action details CSV, the
+                export of ACTION_DETAILS_SPREADSHEET_ID by default
+            max_age: Revalidate cached downloads older than this, see SpreadsheetCache.fetch
+
+        Raises:
+            ValueError: If the workbook or the action details can't be read
+            OSError: If a file can't be read, or a download fails and nothing is cached
+        """
+        self.cache = cache
+        self.max_age = max_age
+        self.source = source or (
+            f"https://docs.google.com/spreadsheets/d/{ACTION_SEQUENCE_SPREADSHEET_ID}/export?format=xlsx"
+        )
+        self.details_source = details_source or (
+            f"https://docs.google.com/spreadsheets/d/{ACTION_DETAILS_SPREADSHEET_ID}/export?format=csv"
+        )
+        # Both downloads share one connection when there is no cache
+        self._session: Optional[requests.Session] = None
+        try:
+            sheets = read_xlsx(self._read(self.source))
+            details = self._read(self.details_source).decode("utf-8")
+        finally:
+            if self._session is not None:
+                self._session.close()
+        self.songs: Dict[str, List[Dict[str, str]]] = {
+            name: rows_to_records(rows, ROBOT_ACTION_COLUMNS) for name, rows in sheets.items()
+        }
+        self.action_details_hash = content_hash(details)
+        self.action_details_data = rows_to_records(
+            csv.reader(io.StringIO(details), delimiter=","), ACTION_DETAIL_COLUMNS
+        )
+        logger.info(
+            f"Loaded {len(self.songs)} song sheet(s) and {len(self.action_details_data)} "
+            f"action details from {self.source}"
+        )
+
+    def missing(self, songs: List[str]) -> List[str]:
+        """Songs of a playlist that have no sheet in the workbook."""
+        return [song for song in songs if song not in self.songs]
+
+    def _read(self, source: str) -> bytes:
+        if not source.startswith(("http://", "https://")):
+            with open(source, "rb") as f:
+                return f.read()
+        logger.info(f"Fetching workbook data from: {source}")
+        if self.cache is not None:
+            body = self.cache.fetch_bytes(source, timeout=10, max_age=self.max_age)
+            if body is None:
+                raise OSError(f"No cached copy of {source}")
+            return body
+        if self._session is None:
+            self._session = requests.Session()
+        response = self._session.get(source, timeout=10)
+        response.raise_for_status()
+        return response.content
@@ -0,0 +1,229 @@
+import csv
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Mapping, Optional
+
+from constant import (
+    TELEMETRY_CAPACITY,
+    TELEMETRY_DISPLAY_INTERVAL,
+    TELEMETRY_GUARD,
+    TELEMETRY_INTERVAL,
+    TELEMETRY_METRICS,
+    TELEMETRY_TIMEOUT,
+)
+
+if TYPE_CHECKING:
+    from action import RobotAction
+
+logger = logging.getLogger(__name__)
+
+# Columns of the exported samples, times in seconds from when collection started
+TELEMETRY_FIELDS = ("robot", "time", "metric", "value", "rtt_ms", "expected_action")
+
+
+@dataclass
+class TelemetrySample:
+    """One answered telemetry request."""
+
+    time: float
+    metric: str
+    value: Any
+    rtt: float
+    # Action the scheduler expected the robot to be performing, None if idle;
+    # the robot API has no method that reports the running action
+    action: Optional[str] = None
+
+
+class TelemetryCollector:
+    """
+    Samples robot state in the background without delaying any command.
+
+    A single low-priority thread works through the robots one request at a
+    time over each robot's pooled session. A request's timeout is cut short so
+    that it ends `guard` seconds before the robot's next scheduled command,
+    which the scheduler publishes as RobotAction.next_send_time; if no time is
+    left, the robot is skipped until the next round. Offline robots are left to the
+    fleet monitor. Each robot keeps its last `capacity` samples.
+    """
+
+    def __init__(
+        self,
+        robots: Dict[int, "RobotAction"],
+        metrics: Mapping[str, str] = TELEMETRY_METRICS,
+        interval: float = TELEMETRY_INTERVAL,
+        timeout: float = TELEMETRY_TIMEOUT,
+        guard: float = TELEMETRY_GUARD,
+        capacity: int = TELEMETRY_CAPACITY,
+        display_interval: Optional[float] = TELEMETRY_DISPLAY_INTERVAL,
+    ):
+        """
+        Initialize the collector.
+
+        Args:
+            robots: Robots keyed by robot number
+            metrics: Read-only JSON-RPC method of every metric, keyed by metric name
+            interval: Seconds between sampling rounds
+            timeout: Longest a single request may take
+            guard: Seconds a request must be answered before the robot's next command
+            capacity: Samples kept per robot; older ones are dropped
+            display_interval: Seconds between status tables in the log, None to disable
+        """
+        self.robots = robots
+        self.metrics = dict(metrics)
+        self.interval = interval
+        self.timeout = timeout
+        self.guard = guard
+        self.display_interval = display_interval
+        self.start_time = time.monotonic()
+        self.buffers: Dict[int, Deque[TelemetrySample]] = {
+            robot_id: deque(maxlen=capacity) for robot_id in robots
+        }
+        self.sampled = 0
+        self.deferred = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._collect, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and log the counters; the samples stay available."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        logger.info(
+            f"Telemetry: {self.sampled} samples, {self.deferred} deferred near a command, "
+            f"{self.failed} unanswered"
+        )
+
+    def __enter__(self) -> "TelemetryCollector":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def samples(self, robot_id: int) -> List[TelemetrySample]:
+        """Buffered samples of one robot, oldest first."""
+        with self._lock:
+            return list(self.buffers.get(robot_id, ()))
+
+    def latest(self) -> Dict[int, Dict[str, TelemetrySample]]:
+        """Newest sample of every metric, keyed by robot number."""
+        latest: Dict[int, Dict[str, TelemetrySample]] = {}
+        with self._lock:
+            for robot_id, buffer in self.buffers.items():
+                metrics = latest.setdefault(robot_id, {})
+                for sample in buffer:
+                    metrics[sample.metric] = sample
+        return latest
+
+    def format_status(self) -> str:
+        """Render the newest value of every metric per robot as a text table."""
+        now = time.monotonic()
+        names = list(self.metrics)
+        header = "".join(f"{name:>12}" for name in names)
+        lines = [f"{'Robot':<6}{header}{'Age s':>8}  Expected action"]
+        for robot_id, metrics in sorted(self.latest().items()):
+            values = "".join(
+                f"{_format_value(metrics[name].value) if name in metrics else '-':>12}"
+                for name in names
+            )
+            newest = max(metrics.values(), key=lambda sample: sample.time, default=None)
+            age = f"{now - newest.time:.0f}" if newest is not None else "-"
+            action = newest.action if newest is not None and newest.action else "-"
+            lines.append(f"{robot_id:<6}{values}{age:>8}  {action}")
+        return "\n".join(lines)
+
+    def export_csv(self, path: str) -> None:
+        """Write every buffered sample, one line each, with times from the collector's start."""
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(TELEMETRY_FIELDS)
+            for robot_id in sorted(self.buffers):
+                for sample in self.samples(robot_id):
+                    writer.writerow(
+                        [
+                            robot_id,
+                            f"{sample.time - self.start_time:.3f}",
+                            sample.metric,
+                            "" if sample.value is None else sample.value,
+                            f"{sample.rtt * 1000:.1f}",
+                            sample.action or "",
+                        ]
+                    )
+
+    def _collect(self) -> None:
+        last_display = time.monotonic()
+        while not self._stopped.wait(self.interval):
+            for robot_id, robot in self.robots.items():
+                if not robot.health.online:
+                    continue
+                for metric, method in self.metrics.items():
+                    if self._stopped.is_set():
+                        return
+                    if not self._sample(robot_id, robot, metric, method):
+                        break
+            if (
+                self.display_interval is not None
+                and time.monotonic() - last_display >= self.display_interval
+            ):
+                last_display = time.monotonic()
+                logger.info("Robot telemetry\n" + self.format_status())
+
+    def _sample(self, robot_id: int, robot: "RobotAction", metric: str, method: str) -> bool:
+        """Take one sample if it fits before the robot's next command; False to skip the robot."""
+        timeout = self.timeout
+        next_send = robot.next_send_time
+        if next_send is not None:
+            # Slow robots still get sampled, only with less time to answer
+            timeout = min(timeout, next_send - self.guard - time.monotonic())
+        # Too close to a command, or the command is being sent right now
+        if timeout <= 0:
+            self.deferred += 1
+            return False
+        answer = robot.query(method, timeout)
+        if answer is None:
+            self.failed += 1
+            return False
+        result, rtt = answer
+        # The robots answer [success, data, method]
+        if isinstance(result, list) and len(result) == 3 and result[2] == method:
+            if not result[0]:
+                self.failed += 1
+                return False
+            result = result[1]
+        value = _unwrap(result)
+        now = time.monotonic()
+        running = robot.running
+        action = running[0] if running is not None and running[1] > now else None
+        with self._lock:
+            self.buffers[robot_id].append(TelemetrySample(now, metric, value, rtt, action))
+        self.sampled += 1
+        return True
+
+
+def _unwrap(value: Any) -> Any:
+    """Reduce single-value data to the value itself and no data to None."""
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return None
+        if len(value) == 1:
+            return _unwrap(value[0])
+    return value
+
+
+def _format_value(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
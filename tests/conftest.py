@@ -0,0 +1,34 @@
+import os
+import socket
+import sys
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_robot import fleet_urls, start_mock_fleet  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def mock_fleet():
+    """Start mock robots in a separate process; returns a function giving their URLs."""
+    processes = []
+
+    def start(count: int = 1, **network) -> list:
+        base_port = free_port()
+        process = start_mock_fleet(count, base_port, **network)
+        assert process is not None, "mock fleet didn't come up"
+        processes.append(process)
+        return fleet_urls(count, base_port)
+
+    yield start
+    for process in processes:
+        process.terminate()
+        process.join()
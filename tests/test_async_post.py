@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from async_action import AsyncRobotAction
+from mock_robot import MockRobot
+from retry_policy import RetryPolicy
+
+FAST = RetryPolicy(max_attempts=2, backoff=0.01, min_timeout=0.05, max_timeout=0.2)
+
+
+async def serve(handler):
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+
+
+def canned(reply: bytes):
+    """A server that answers every request with `reply` and hangs up."""
+
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(reply)
+        await writer.drain()
+        writer.close()
+
+    return handle
+
+
+async def post_to(reply: bytes):
+    server, url = await serve(canned(reply))
+    robot = AsyncRobotAction(url, {"wave": 0.1}, retry=FAST)
+    try:
+        with pytest.raises(Exception) as excinfo:
+            await robot._post({"method": "RunAction"})
+        return excinfo.value
+    finally:
+        await robot.close()
+        server.close()
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        b'HTTP/1.1 200 OK\r\nContent-Length: 50\r\n\r\n{"result"',
+        b"garbage\r\n\r\n",
+        b"",
+        b"HTTP/1.1 200 OK\r\nContent-Length: many\r\n\r\n{}",
+        b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n2\r\n{}\r\n0\r\n\r\n",
+    ],
+    ids=["truncated body", "garbled status", "closed", "bad length", "chunked"],
+)
+def test_broken_replies_are_connection_errors(reply):
+    assert isinstance(asyncio.run(post_to(reply)), ConnectionError)
+
+
+def test_http_error_status_is_a_value_error():
+    error = asyncio.run(post_to(b"HTTP/1.1 500 Oops\r\nContent-Length: 0\r\n\r\n"))
+    assert isinstance(error, ValueError)
+
+
+def test_broken_reply_is_retried_then_abandoned():
+    async def run():
+        server, url = await serve(canned(b"garbage\r\n\r\n"))
+        robot = AsyncRobotAction(url, {"wave": 0.1}, retry=FAST)
+        loop = asyncio.get_running_loop()
+        try:
+            result = await robot.start_action("wave", 1, loop.time() + 1.0)
+            return result, robot.retry_stats.as_dict()
+        finally:
+            await robot.close()
+            server.close()
+
+    result, stats = asyncio.run(run())
+    assert result is None
+    assert stats["timeouts"] == FAST.max_attempts
+    assert stats["abandoned"] == 1
+
+
+def test_mock_robot_answers_over_one_connection():
+    async def run():
+        mock = MockRobot(0)
+        server, url = await serve(mock.handle_connection)
+        robot = AsyncRobotAction(url, {"wave": 0.1}, retry=FAST)
+        try:
+            replies = [await robot.start_action("wave", 2) for _ in range(3)]
+            return replies, mock.arrivals, robot.connection_stats()
+        finally:
+            await robot.close()
+            server.close()
+
+    replies, arrivals, stats = asyncio.run(run())
+    assert [reply["result"] for reply in replies] == [[True, [], "RunAction"]] * 3
+    assert [arrival["params"] for arrival in arrivals] == [["wave", 2]] * 3
+    assert stats == {"opened": 1, "reused": 2}
@@ -0,0 +1,64 @@
+import pytest
+
+from action_catalog import ActionCatalog
+from show_ir import CompileError
+
+action_compiler = pytest.importorskip("action_compiler")
+
+
+class SheetLoader:
+    """Serves fixed sheets in place of SpreadsheetLoader."""
+
+    dance = "demo"
+
+    def __init__(self, robot_actions, details):
+        self.robot_actions = robot_actions
+        self.catalog = ActionCatalog.from_rows(details)
+
+    def get_robot_actions(self):
+        return [dict(row) for row in self.robot_actions]
+
+    def get_action_catalog(self):
+        return self.catalog
+
+
+DETAILS = [
+    {"Name": "wave", "Code": "1", "Time": "0.9"},
+    {"Name": "bow", "Code": "2", "Time": "0.5", "Repeat_Time": "-1"},
+]
+
+
+def compile_show(rows):
+    return action_compiler.ActionCompiler(SheetLoader(rows, DETAILS)).compile_show()
+
+
+def test_every_problem_is_reported_at_once():
+    rows = [
+        {"Time": "x", "Robot_1": "wave"},
+        {"Time": "1", "Robot_1": "jump", "Robot_2": "bow"},
+        {"Time": "1", "Robot_1": "wave\nwave"},
+    ]
+    with pytest.raises(CompileError) as excinfo:
+        compile_show(rows)
+    error = excinfo.value
+    assert [(d.row, d.key, d.kind) for d in error.diagnostics] == [
+        (1, "Time", "time_format"),
+        (2, "Robot_1", "existence"),
+        (2, "Robot_2", "repeat"),
+        (3, "Robot_1", "time"),
+    ]
+    message = str(error)
+    assert message.startswith("4 problem(s) in the action sheet:")
+    assert "Action 'jump' for key 'Robot_1' not found" in message
+    assert "negative Repeat_Time -1" in message
+
+
+def test_compile_error_is_a_value_error():
+    with pytest.raises(ValueError):
+        compile_show([{"Time": "1", "Robot_1": "jump"}])
+
+
+def test_valid_sheet_compiles():
+    rows = compile_show([{"Time": "2", "Robot_1": "wave", "Robot_2": "{{ 'wave' }}"}])
+    assert [ref.name for ref in rows[0].cells["Robot_2"].actions] == ["wave"]
+    assert rows[0].cells["Robot_1"].slack == pytest.approx(1.1)
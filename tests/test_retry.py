@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from action import RobotAction
+from retry_policy import RetryPolicy
+
+# Short timeouts and backoff so lost requests are given up on quickly
+FAST = RetryPolicy(max_attempts=4, backoff=0.05, min_timeout=0.05, max_timeout=0.1)
+
+
+def test_delay_doubles_per_attempt():
+    policy = RetryPolicy(backoff=0.02)
+    assert [policy.delay(attempt) for attempt in (1, 2, 3)] == pytest.approx([0.02, 0.04, 0.08])
+
+
+def test_deadline_allows_part_of_the_action_to_be_late():
+    policy = RetryPolicy(late_fraction=0.25)
+    assert policy.deadline(10.0, 2.0) == pytest.approx(10.5)
+
+
+def test_deadline_never_passes_the_next_command():
+    policy = RetryPolicy(late_fraction=0.25)
+    assert policy.deadline(10.0, 2.0, next_send=10.2) == pytest.approx(10.2)
+    assert policy.deadline(10.0, 2.0, next_send=11.0) == pytest.approx(10.5)
+
+
+def test_answered_command_is_not_retried(mock_fleet):
+    (url,) = mock_fleet(1)
+    robot = RobotAction(url, {"wave": 1.0}, retry=FAST)
+    try:
+        assert robot.start_action("wave", deadline=time.monotonic() + 1.0) is not None
+        stats = robot.retry_stats.as_dict()
+        assert stats["requests"] == 1
+        assert stats["retries"] == 0
+        assert robot.running[0] == "wave"
+    finally:
+        robot.close()
+
+
+def test_lost_command_is_retried_until_its_deadline(mock_fleet):
+    (url,) = mock_fleet(1, loss=1.0)
+    robot = RobotAction(url, {"wave": 1.0}, retry=FAST)
+    try:
+        deadline = time.monotonic() + 0.2
+        assert robot.start_action("wave", deadline=deadline) is None
+        finished = time.monotonic()
+        stats = robot.retry_stats.as_dict()
+        assert stats["abandoned"] == 1
+        assert 1 <= stats["retries"] < FAST.max_attempts
+        # The last attempt started before the deadline and only its timeout ran past it
+        assert robot.last_send_time <= deadline
+        assert finished <= deadline + FAST.max_timeout + 0.05
+    finally:
+        robot.close()
+
+
+def test_command_without_deadline_is_sent_once(mock_fleet):
+    (url,) = mock_fleet(1, loss=1.0)
+    robot = RobotAction(url, {"wave": 1.0}, retry=FAST)
+    try:
+        assert robot.start_action("wave") is None
+        assert robot.retry_stats.as_dict()["retries"] == 0
+    finally:
+        robot.close()
+
+
+def test_stop_event_cancels_the_backoff(mock_fleet):
+    (url,) = mock_fleet(1, loss=1.0)
+    slow_backoff = RetryPolicy(max_attempts=3, backoff=5.0, min_timeout=0.05, max_timeout=0.1)
+    robot = RobotAction(url, {"wave": 1.0}, retry=slow_backoff)
+    stop_event = threading.Event()
+    timer = threading.Timer(0.3, stop_event.set)
+    timer.start()
+    try:
+        started = time.monotonic()
+        assert robot.start_action("wave", deadline=started + 30.0, stop_event=stop_event) is None
+        assert time.monotonic() - started < 2.0
+        assert robot.retry_stats.as_dict()["retries"] == 0
+        # A stopped show isn't held against the robot
+        assert robot.health.failures == 0
+    finally:
+        timer.cancel()
+        robot.close()
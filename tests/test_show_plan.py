@@ -0,0 +1,77 @@
+import pytest
+
+from action_catalog import ActionCatalog
+from scheduler import compile_timeline
+from show_ir import parse_rows
+from show_plan import PlanAction, ShowPlan
+
+CATALOG = ActionCatalog.from_rows(
+    [
+        {"Name": "wave", "Code": "7", "Time": "0.9"},
+        {"Name": "bow", "Code": "3", "Time": "0.5", "Repeat_Time": "2"},
+        {"Name": "spin", "Time": "1.25"},
+    ]
+)
+
+
+@pytest.fixture
+def plan():
+    rows = [
+        {"Time": "1.5", "Robot_1": "wave", "Robot_2": "spin"},
+        {"Time": "2", "Robot_1": "bow\nwave", "Robot_3": "bow"},
+    ]
+    parsed, diagnostics = parse_rows(rows, CATALOG.durations, CATALOG.repeats, catalog=CATALOG)
+    assert not diagnostics
+    timeline = compile_timeline(parsed, [1, 2, 3])
+    return ShowPlan.from_timeline(
+        "demo", timeline, CATALOG.durations, CATALOG.repeats, CATALOG.codes
+    ), timeline
+
+
+def test_round_trip_restores_the_timeline(plan):
+    plan, timeline = plan
+    loaded = ShowPlan.from_bytes(plan.to_bytes())
+    assert loaded.song == "demo"
+    assert loaded.to_timeline() == timeline
+    assert loaded.action_tables() == plan.action_tables()
+
+
+def test_round_trip_through_a_file(plan, tmp_path):
+    plan, timeline = plan
+    path = str(tmp_path / "demo.rgap")
+    plan.save(path)
+    assert ShowPlan.load(path).to_timeline() == timeline
+
+
+def test_sheet_codes_are_kept_and_missing_ones_assigned(plan):
+    plan, _ = plan
+    codes = {action.name: action.code for action in plan.actions}
+    assert codes == {"wave": 7, "bow": 3, "spin": 8}
+
+
+def test_for_robots_keeps_only_their_tracks(plan):
+    plan, _ = plan
+    assert sorted(plan.for_robots([2, 3]).tracks) == [2, 3]
+
+
+def test_unknown_action_code_is_a_value_error(plan):
+    plan, _ = plan
+    plan.actions = [PlanAction(99, "other", 1.0, 1)]
+    with pytest.raises(ValueError, match="unknown action code"):
+        plan.to_timeline()
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda data: b"XXXX" + data[4:],
+        lambda data: data[:4] + b"\x09\x00" + data[6:],
+        lambda data: data[:-3],
+        lambda data: data[:10],
+    ],
+    ids=["magic", "version", "truncated array", "truncated header"],
+)
+def test_corrupt_data_is_a_value_error(plan, corrupt):
+    plan, _ = plan
+    with pytest.raises(ValueError):
+        ShowPlan.from_bytes(corrupt(plan.to_bytes()))
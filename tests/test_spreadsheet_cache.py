@@ -0,0 +1,105 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from spreadsheet_cache import SpreadsheetCache
+
+
+class Sheet:
+    """A sheet served with an ETag, counting full and conditional requests."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.version = 1
+        self.requests = []
+
+    def update(self, body: bytes) -> None:
+        self.body = body
+        self.version += 1
+
+
+@pytest.fixture
+def sheet():
+    sheet = Sheet(b"Name,Time\nwave,0.9\n")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            etag = f'"v{sheet.version}"'
+            if_none_match = self.headers.get("If-None-Match")
+            sheet.requests.append(if_none_match)
+            if if_none_match == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(sheet.body)))
+            self.end_headers()
+            self.wfile.write(sheet.body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    sheet.url = f"http://127.0.0.1:{server.server_address[1]}/sheet.csv"
+    sheet.server = server
+    yield sheet
+    server.shutdown()
+    server.server_close()
+
+
+def test_fresh_copy_is_served_without_a_request(sheet, tmp_path):
+    cache = SpreadsheetCache(str(tmp_path), ttl=300)
+    assert cache.fetch(sheet.url) == "Name,Time\nwave,0.9\n"
+    assert cache.fetch(sheet.url) == "Name,Time\nwave,0.9\n"
+    assert sheet.requests == [None]
+
+
+def test_stale_copy_is_revalidated_with_its_etag(sheet, tmp_path):
+    cache = SpreadsheetCache(str(tmp_path), ttl=0)
+    first = cache.fetch(sheet.url)
+    assert cache.fetch(sheet.url) == first
+    assert sheet.requests == [None, '"v1"']
+
+
+def test_changed_sheet_replaces_the_cached_copy(sheet, tmp_path):
+    cache = SpreadsheetCache(str(tmp_path), ttl=300)
+    cache.fetch(sheet.url)
+    sheet.update(b"Name,Time\nwave,1.2\n")
+    # Within the TTL the old copy is still served, max_age=0 asks the server
+    assert cache.fetch(sheet.url) == "Name,Time\nwave,0.9\n"
+    assert cache.fetch(sheet.url, max_age=0) == "Name,Time\nwave,1.2\n"
+    assert sheet.requests == [None, '"v1"']
+
+
+def test_index_survives_a_restart(sheet, tmp_path):
+    SpreadsheetCache(str(tmp_path), ttl=0).fetch(sheet.url)
+    assert SpreadsheetCache(str(tmp_path), ttl=0).fetch(sheet.url) == "Name,Time\nwave,0.9\n"
+    assert sheet.requests == [None, '"v1"']
+
+
+def test_stale_copy_is_used_when_revalidation_fails(sheet, tmp_path):
+    cache = SpreadsheetCache(str(tmp_path), ttl=0)
+    cache.fetch(sheet.url)
+    sheet.server.shutdown()
+    sheet.server.server_close()
+    assert cache.fetch(sheet.url, timeout=1) == "Name,Time\nwave,0.9\n"
+
+
+def test_offline_mode_never_touches_the_network(sheet, tmp_path):
+    SpreadsheetCache(str(tmp_path), ttl=0).fetch(sheet.url)
+    offline = SpreadsheetCache(str(tmp_path), ttl=0, offline=True)
+    assert offline.fetch(sheet.url) == "Name,Time\nwave,0.9\n"
+    assert offline.fetch(sheet.url + "?other") is None
+    assert sheet.requests == [None]
+
+
+def test_uncached_download_failure_raises(sheet, tmp_path):
+    sheet.server.shutdown()
+    sheet.server.server_close()
+    with pytest.raises(requests.RequestException):
+        SpreadsheetCache(str(tmp_path)).fetch(sheet.url, timeout=1)
@@ -0,0 +1,57 @@
+import pytest
+
+from action_catalog import ActionCatalog
+from scheduler import ScheduledAction, compile_timeline
+from show_ir import parse_rows
+
+CATALOG = ActionCatalog.from_rows(
+    [
+        {"Name": "wave", "Code": "1", "Time": "0.9"},
+        {"Name": "bow", "Code": "2", "Time": "0.5", "Repeat_Time": "2"},
+    ]
+)
+
+
+def timeline_of(rows, robot_ids=(1, 2)):
+    parsed, _ = parse_rows(rows, CATALOG.durations, CATALOG.repeats, catalog=CATALOG)
+    return compile_timeline(parsed, list(robot_ids))
+
+
+def test_rows_start_when_the_previous_slot_ends():
+    timeline = timeline_of(
+        [
+            {"Time": "1.5", "Robot_1": "wave"},
+            {"Time": "2", "Robot_1": "bow", "Robot_2": "wave"},
+            {"Time": "1", "Robot_2": "bow"},
+        ]
+    )
+    assert timeline.row_offsets == [0.0, 1.5, 3.5]
+    assert timeline.duration == 4.5
+    assert timeline.robot_entries[1] == [
+        ScheduledAction(1, 0.0, "wave", 1),
+        ScheduledAction(2, 1.5, "bow", 2),
+    ]
+    assert timeline.robot_entries[2] == [
+        ScheduledAction(2, 1.5, "wave", 1),
+        ScheduledAction(3, 3.5, "bow", 2),
+    ]
+
+
+def test_multi_line_cell_actions_follow_each_other():
+    timeline = timeline_of([{"Time": "2", "Robot_1": "wave\nbow\nwave"}])
+    assert [entry.offset for entry in timeline.robot_entries[1]] == pytest.approx([0.0, 0.9, 1.4])
+
+
+def test_unknown_actions_and_other_robots_are_left_out():
+    timeline = timeline_of([{"Time": "2", "Robot_1": "jump\nbow", "Robot_9": "wave"}])
+    assert timeline.robot_entries == {1: [ScheduledAction(1, 0.0, "bow", 2)], 2: []}
+
+
+def test_invalid_time_raises():
+    with pytest.raises(ValueError):
+        timeline_of([{"Time": "soon", "Robot_1": "wave"}])
+
+
+def test_starting_at_keeps_offsets_from_the_song_start():
+    timeline = timeline_of([{"Time": "1", "Robot_1": "wave"}, {"Time": "1", "Robot_1": "bow"}])
+    assert timeline.starting_at(1.0).robot_entries[1] == [ScheduledAction(2, 1.0, "bow", 2)]
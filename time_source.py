@@ -0,0 +1,28 @@
+import threading
+import time
+
+
+class WallClock:
+    """
+    Real time: time.monotonic() and blocking waits.
+
+    TimelineScheduler and RobotAction read the time and wait through a clock
+    like this one, so that ShowSimulator can run the same code on virtual time.
+    """
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def perf_counter(self) -> float:
+        """High-resolution time for measuring round trips."""
+        return time.perf_counter()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        """Wait at most `timeout` seconds for `event`; True if it was set."""
+        return event.wait(timeout)
+
+
+WALL_CLOCK = WallClock()